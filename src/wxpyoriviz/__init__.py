@@ -0,0 +1,3 @@
+# Attitude visualization with vispy and wxPython. The math and data
+# modules (attitude_math, orientation, recorder, ...) only need numpy; wx
+# and vispy are imported by the GUI modules alone, see main.py.
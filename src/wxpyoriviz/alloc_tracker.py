@@ -0,0 +1,196 @@
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from . import attitude_math as amath
+from .orientation import AttitudeInterpolator, GenRatesData
+
+
+# Declared per tick budgets for the simulate and render cycle. peak_bytes
+# is the transient high water mark inside one tick (temporaries included),
+# held_bytes and gc_objects are what a tick leaves behind on average. The
+# gc_objects count is what advances the generation 0 collector. The
+# simulate tick writes into angle histories that are already at their
+# capped size, so it holds nothing; the chevron tick only copies the
+# attitude into its model matrix, uniforms are set at draw time.
+TICK_BUDGETS = {
+    'simulate': {'peak_bytes': 4096, 'held_bytes': 16, 'gc_objects': 0.5},
+    'interpolate': {'peak_bytes': 2048, 'held_bytes': 16, 'gc_objects': 0.5},
+    'chevron_matrices': {'peak_bytes': 1024, 'held_bytes': 256,
+                         'gc_objects': 0.5},
+}
+
+
+class TickAllocations:
+    def __init__(self, name, n_ticks, peak_bytes, held_bytes, held_blocks,
+                 gc_objects, top_sites):
+        self.name = name
+        self.n_ticks = n_ticks
+        self.peak_bytes = peak_bytes
+        self.held_bytes = held_bytes
+        self.held_blocks = held_blocks
+        self.gc_objects = gc_objects
+        self.top_sites = top_sites
+
+    def over_budget(self, budget):
+        # Names of the budget entries this measurement exceeds
+        return [key for key, limit in budget.items()
+                if getattr(self, key) > limit]
+
+    def format(self):
+        lines = ["{} ({} ticks): peak {:.0f} B, held {:.1f} B / {:.2f} blocks,"
+                 " gc objects {:.2f} per tick".format(
+                     self.name, self.n_ticks, self.peak_bytes,
+                     self.held_bytes, self.held_blocks, self.gc_objects)]
+        for stat in self.top_sites:
+            frame = stat.traceback[0]
+            lines.append("    {}:{}  {} B in {} blocks".format(
+                frame.filename, frame.lineno, stat.size_diff,
+                stat.count_diff))
+        return "\n".join(lines)
+
+
+class AllocationTracker:
+    # Runs a tick function under tracemalloc and reports allocations per
+    # tick. The collector is paused while measuring so its own work does not
+    # show up as allocations.
+
+    def __init__(self, top_n=10, n_frames=1):
+        self.top_n = top_n
+        self.n_frames = n_frames
+
+    def measure(self, name, tick, n_ticks=200, warmup=20):
+        for _ in range(warmup):
+            tick()
+
+        gc_was_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(self.n_frames)
+        try:
+            # Peak of a single tick, worst case over all of them
+            peak = 0
+            for _ in range(min(n_ticks, 20)):
+                tracemalloc.reset_peak()
+                start, _ = tracemalloc.get_traced_memory()
+                tick()
+                _, tick_peak = tracemalloc.get_traced_memory()
+                peak = max(peak, tick_peak - start)
+
+            snap_before = tracemalloc.take_snapshot()
+            mem_before, _ = tracemalloc.get_traced_memory()
+            gc_before = gc.get_count()[0]
+            for _ in range(n_ticks):
+                tick()
+            gc_after = gc.get_count()[0]
+            mem_after, _ = tracemalloc.get_traced_memory()
+            snap_after = tracemalloc.take_snapshot()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+            if gc_was_enabled:
+                gc.enable()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, __file__)]
+        diff = snap_after.filter_traces(filters).compare_to(
+            snap_before.filter_traces(filters), 'lineno')
+        top_sites = [stat for stat in diff if stat.size_diff > 0][:self.top_n]
+        held_blocks = sum(stat.count_diff for stat in diff)
+
+        return TickAllocations(name, n_ticks, peak,
+                               (mem_after - mem_before) / n_ticks,
+                               held_blocks / n_ticks,
+                               (gc_after - gc_before) / n_ticks, top_sites)
+
+
+# History rows kept by the simulate tick. Small, so it is warmed up to the
+# capped steady state and every measurement of SIMULATE_TICKS ticks crosses
+# several points where an uncapped history would have doubled.
+SIMULATE_HISTORY = 64
+SIMULATE_TICKS = 1000
+
+
+def simulate_tick():
+    data = GenRatesData(history_rows=SIMULATE_HISTORY)
+    data.set_body_rates((10.0, 20.0, 90.0))
+    for _ in range(2 * SIMULATE_HISTORY):
+        data.iterate_data()
+    return data.iterate_data
+
+
+def interpolate_tick():
+    data = GenRatesData()
+    data.set_body_rates((10.0, 20.0, 90.0))
+    interpolator = AttitudeInterpolator()
+    data.iterate_data()
+    interpolator.push(data.t, data.attitude_q, 0.0)
+    data.iterate_data()
+    interpolator.push(data.t, data.attitude_q, 1.0)
+
+    def tick():
+        quat = interpolator.sample(1.5)
+        amath.QuatToDCM(quat)
+    return tick
+
+
+def chevron_matrices_tick():
+    # gloo queues the uniform upload, so no GL context is needed here
+    from .chevron_viz import ChevronIndicator
+    chevron = ChevronIndicator((800, 600))
+    dcm = amath.QuatToDCM(amath.QuaternionFromEulerXYZ([0.3, -0.2, 0.5]))
+    return lambda: chevron.set_dcm_rot(dcm)
+
+
+TICKS = {
+    'simulate': simulate_tick,
+    'interpolate': interpolate_tick,
+    'chevron_matrices': chevron_matrices_tick,
+}
+
+# Ticks measured per name, long enough to cover the steady state
+TICK_COUNTS = {'simulate': SIMULATE_TICKS}
+
+
+def run(names=None, check=False, top_n=10):
+    tracker = AllocationTracker(top_n)
+    failures = []
+    for name in names or TICKS:
+        try:
+            tick = TICKS[name]()
+        except ImportError as exc:
+            print("Skipping {}: {}".format(name, exc))
+            continue
+
+        result = tracker.measure(name, tick, TICK_COUNTS.get(name, 200))
+        print(result.format())
+
+        if check:
+            over = result.over_budget(TICK_BUDGETS[name])
+            if over:
+                failures.append((name, over))
+                print("    OVER BUDGET: {}".format(", ".join(over)))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Per tick allocation report for the simulate and render "
+                    "cycle")
+    parser.add_argument('ticks', nargs='*',
+                        help="Ticks to measure, from {} (default: all)".format(
+                            ", ".join(TICKS)))
+    parser.add_argument('--check', action='store_true',
+                        help="Exit with an error if a tick is over budget")
+    parser.add_argument('--top', type=int, default=10,
+                        help="Number of allocation sites to list")
+    args = parser.parse_args()
+    for name in args.ticks:
+        if name not in TICKS:
+            parser.error("Unknown tick '{}'".format(name))
+
+    if run(args.ticks, args.check, args.top):
+        sys.exit(1)
@@ -0,0 +1,39 @@
+import numpy as np
+from vispy import app
+from vispy import plot as vp
+
+
+# Allan deviation and PSD side by side. vispy's plot widgets have linear
+# axes, so both curves are drawn as log10 values and the axis labels say so.
+AXIS_COLORS = ((0.85, 0.2, 0.2, 1.0), (0.2, 0.7, 0.2, 1.0),
+               (0.2, 0.4, 0.9, 1.0))
+
+
+def log_curve(x, y):
+    keep = (x > 0) & (y > 0) & np.isfinite(y)
+    return np.column_stack([np.log10(x[keep]), np.log10(y[keep])]).astype(
+        np.float32)
+
+
+def show_analysis(results, units='rad/s'):
+    fig = vp.Fig(size=(1200, 550), show=False,
+                 title="Gyro noise: X red, Y green, Z blue")
+    adev_plot = fig[0, 0]
+    psd_plot = fig[0, 1]
+
+    for axis, color in enumerate(AXIS_COLORS):
+        adev_plot.plot(log_curve(results['tau'], results['adev'][:, axis]),
+                       color=color, width=2,
+                       title="Allan deviation",
+                       xlabel="log10 tau (s)",
+                       ylabel="log10 adev ({})".format(units))
+        # DC is left out, it is zero after the per segment mean removal
+        psd_plot.plot(log_curve(results['freq'][1:],
+                                results['psd'][1:, axis]),
+                      color=color,
+                      title="Power spectral density",
+                      xlabel="log10 f (Hz)",
+                      ylabel="log10 PSD (({})^2/Hz)".format(units))
+
+    fig.show()
+    app.run()
@@ -2,6 +2,9 @@ import numpy as np
 from vispy import gloo
 from vispy import app
 
+from . import gl_cache
+from .frame_profiler import FrameProfiler
+
 
 def deg_to_rad(deg):
     return deg * (np.pi / 180.0)
@@ -104,19 +107,12 @@ class AngleGauge:
         self.circle_xy = []
         self.build_circle()
 
-        self.circle_program = gloo.Program(
-            self.CIRCLE_V_SHADER, self.FRAG_SHADER)
-
         self.radius_frac = 0.9
 
-        self.circle_program['a_position2d'] = gloo.VertexBuffer(
-            np.array(self.circle_xy).astype(np.float32))
-        self.circle_program['radius_frac'] = self.radius_frac
-        self.circle_program['radius'] = 0.0
-
-        self.circle_program['scr_dim'] = np.array([total_screen_dim])
-        self.circle_program['draw_dim'] = np.array([draw_area_dim])
-        self.circle_program['center_offset'] = np.array([center_offset])
+        self.scr_dim = total_screen_dim
+        self.draw_dim = draw_area_dim
+        self.center_offset = center_offset
+        self.line_angle = deg_to_rad(90)
 
         self.ref_line1_xy = []
         self.ref_line2_xy = []
@@ -125,17 +121,22 @@ class AngleGauge:
         self.ref_line_angle_offset = 0
         self.build_ref_line()
 
-        self.line_program = gloo.Program(
-            self.ANGLE_LINE_V_SHADER, self.FRAG_SHADER)
-
-        self.line_program['radius_frac'] = self.radius_frac
-        self.line_program['scr_dim'] = np.array([total_screen_dim])
-        self.line_program['draw_dim'] = np.array([draw_area_dim])
-        self.line_program['center_offset'] = np.array([center_offset])
+        # Programs and buffers come from the context's resource cache on the
+        # first draw, see build_programs
+        self.circle_program = None
+        self.line_program = None
 
-        self.line_program['a_position2d'] = gloo.VertexBuffer(
-            np.array(self.ref_line1_xy).astype(np.float32))
-        self.line_program['line_angle'] = deg_to_rad(90)
+    def build_programs(self):
+        # Every gauge in a context shares the two programs and the circle
+        # buffer, so each gauge sets its own uniforms right before drawing
+        cache = gl_cache.get_cache()
+        self.circle_program = cache.program(
+            self.CIRCLE_V_SHADER, self.FRAG_SHADER)
+        self.line_program = cache.program(
+            self.ANGLE_LINE_V_SHADER, self.FRAG_SHADER)
+        self.circle_vbo = cache.vertex_buffer(
+            np.array(self.circle_xy).astype(np.float32))
+        self.build_ref_line_vbos()
 
     def build_circle(self, angle_step=1.0):
         step = deg_to_rad(angle_step)
@@ -164,24 +165,41 @@ class AngleGauge:
         else:
             self.ref_line2_xy = [origin, line_tip2]
 
+    def build_ref_line_vbos(self):
+        # Identical ref lines (all but the symmetric one) share a buffer
+        cache = gl_cache.get_cache()
+        self.ref_line1_vbo = cache.vertex_buffer(
+            np.array(self.ref_line1_xy).astype(np.float32))
+        self.ref_line2_vbo = cache.vertex_buffer(
+            np.array(self.ref_line2_xy).astype(np.float32))
+
     def resize(self, new_draw_area: tuple, new_total_screen: tuple, new_offsets: tuple):
-        self.circle_program['scr_dim'] = np.array([new_total_screen])
-        self.circle_program['draw_dim'] = np.array([new_draw_area])
-        self.circle_program['center_offset'] = np.array([new_offsets])
+        self.scr_dim = new_total_screen
+        self.draw_dim = new_draw_area
+        self.center_offset = new_offsets
 
-        self.line_program['scr_dim'] = np.array([new_total_screen])
-        self.line_program['draw_dim'] = np.array([new_draw_area])
-        self.line_program['center_offset'] = np.array([new_offsets])
+    def set_layout_uniforms(self, program):
+        program['scr_dim'] = self.scr_dim
+        program['draw_dim'] = self.draw_dim
+        program['center_offset'] = self.center_offset
+        program['radius_frac'] = self.radius_frac
 
     def run_shaders(self):
+        if self.circle_program is None:
+            self.build_programs()
+
+        self.set_layout_uniforms(self.circle_program)
+        self.circle_program['radius'] = 0.0
+        self.circle_program['a_position2d'] = self.circle_vbo
         self.circle_program.draw('line_strip')
 
-        self.line_program['a_position2d'] = gloo.VertexBuffer(
-            np.array(self.ref_line1_xy).astype(np.float32))
+        self.set_layout_uniforms(self.line_program)
+        self.line_program['line_angle'] = self.line_angle
+
+        self.line_program['a_position2d'] = self.ref_line1_vbo
         self.line_program.draw('line_strip')
 
-        self.line_program['a_position2d'] = gloo.VertexBuffer(
-            np.array(self.ref_line2_xy).astype(np.float32))
+        self.line_program['a_position2d'] = self.ref_line2_vbo
         self.line_program.draw('line_strip')
 
     def set_ref_line_symmetry(self, symmetric: bool):
@@ -189,29 +207,173 @@ class AngleGauge:
         self.ref_line1_xy = []
         self.ref_line2_xy = []
         self.build_ref_line()
+        if self.line_program is not None:
+            self.build_ref_line_vbos()
 
     def set_line_angle(self, line_angle):
-        self.line_program['line_angle'] = deg_to_rad(
-            line_angle + self.ref_line_angle_offset)
+        self.line_angle = deg_to_rad(line_angle + self.ref_line_angle_offset)
 
     def set_line_angle_offset(self, offset_angle):
         self.ref_line_angle_offset = offset_angle
 
 
+class SdfAngleGauge(AngleGauge):
+    # Same gauge drawn procedurally: one quad, with the dial, tick marks and
+    # needle evaluated per pixel from signed distance functions. Edges are
+    # antialiased analytically from the pixel size, so the gauge stays
+    # smooth at any canvas size and costs only its pixel count.
+
+    SDF_V_SHADER = """
+    uniform float radius_frac;
+    uniform vec2 scr_dim;
+    uniform vec2 draw_dim;
+    uniform vec2 center_offset;
+    attribute vec2 a_position2d;
+    varying vec2 v_pos;
+    void main (void) {
+        float offset_x_fact = center_offset.x / (scr_dim.x / 2.f);
+        float offset_y_fact = center_offset.y / (scr_dim.y / 2.f);
+
+        vec2 screen_fact = draw_dim / scr_dim;
+
+        float r_frac_x, r_frac_y;
+        if(draw_dim.x > draw_dim.y) {
+            r_frac_x = radius_frac * (draw_dim.y / draw_dim.x);
+            r_frac_y = radius_frac;
+        }
+        else {
+            r_frac_x = radius_frac;
+            r_frac_y = radius_frac * (draw_dim.x / draw_dim.y);
+        }
+
+        // Gauge space: the dial is the unit circle
+        v_pos = a_position2d;
+        gl_Position = vec4(r_frac_x * a_position2d.x * screen_fact.x + offset_x_fact,
+                           r_frac_y * a_position2d.y * screen_fact.y + offset_y_fact,
+                           0.0, 1.0);
+    }
+    """
+
+    SDF_F_SHADER = """
+    uniform float line_angle;
+    uniform float px_size;      // Gauge space units per pixel
+    uniform float symmetric;
+    varying vec2 v_pos;
+
+    const float PI = 3.14159265;
+
+    float sd_segment(vec2 p, vec2 a, vec2 b) {
+        vec2 pa = p - a;
+        vec2 ba = b - a;
+        float h = clamp(dot(pa, ba) / dot(ba, ba), 0.0, 1.0);
+        return length(pa - ba * h);
+    }
+
+    float sd_arrow(vec2 p, float dir) {
+        // Shaft from the centre with a head at (dir, 0), as the line gauge
+        vec2 tip = vec2(dir, 0.0);
+        float d = sd_segment(p, vec2(0.0), tip);
+        d = min(d, sd_segment(p, tip, vec2(dir * 0.9, 0.1)));
+        return min(d, sd_segment(p, tip, vec2(dir * 0.9, -0.1)));
+    }
+
+    float coverage(float d, float half_width) {
+        return clamp(0.5 - (d - half_width) / px_size, 0.0, 1.0);
+    }
+
+    void main()
+    {
+        float half_line = 0.6 * px_size;
+
+        // Dial
+        float r = length(v_pos);
+        float alpha = coverage(abs(r - 1.0), half_line);
+
+        // Tick marks every 10 degrees, longer every 30
+        float angle = atan(v_pos.y, v_pos.x);
+        float tick_step = PI / 18.0;
+        float tick = floor(angle / tick_step + 0.5);
+        float c = cos(tick * tick_step);
+        float s = sin(tick * tick_step);
+        vec2 q = vec2(c * v_pos.x + s * v_pos.y, -s * v_pos.x + c * v_pos.y);
+        float major = 1.0 - step(0.5, mod(tick, 3.0));
+        float inner = mix(0.93, 0.85, major);
+        float d_tick = sd_segment(q, vec2(inner, 0.0), vec2(1.0, 0.0));
+        alpha = max(alpha, 0.6 * coverage(d_tick, half_line));
+
+        // Needle, rotated into its own frame. The line gauge turns its
+        // points by -line_angle, so the frame turns the other way here.
+        c = cos(line_angle);
+        s = sin(line_angle);
+        vec2 n = vec2(c * v_pos.x - s * v_pos.y, s * v_pos.x + c * v_pos.y);
+        float d_needle = sd_arrow(n, 1.0);
+        if(symmetric > 0.5) {
+            d_needle = min(d_needle, sd_arrow(n, -1.0));
+            d_needle = min(d_needle, sd_segment(n, vec2(0.0), vec2(0.0, 0.15)));
+        }
+        else {
+            d_needle = min(d_needle, sd_segment(n, vec2(0.0), vec2(-1.0, 0.0)));
+        }
+        alpha = max(alpha, coverage(d_needle, 1.5 * half_line));
+
+        if(alpha <= 0.0)
+            discard;
+        gl_FragColor = vec4(0.0, 0.0, 0.0, alpha);
+    }
+    """
+
+    # Slightly larger than the dial so its antialiased edge fits
+    QUAD = 1.05 * np.array([(-1, -1), (1, -1), (-1, 1), (1, 1)],
+                           dtype=np.float32)
+
+    def build_programs(self):
+        cache = gl_cache.get_cache()
+        self.program = cache.program(self.SDF_V_SHADER, self.SDF_F_SHADER)
+        self.quad_vbo = cache.vertex_buffer(self.QUAD)
+        # Checked by the base class to see whether programs exist
+        self.circle_program = self.program
+
+    def build_ref_line_vbos(self):
+        pass    # Drawn procedurally
+
+    def run_shaders(self):
+        if self.circle_program is None:
+            self.build_programs()
+
+        self.set_layout_uniforms(self.program)
+        # Dial radius in pixels, as the vertex shader lays it out
+        radius_px = self.radius_frac * min(self.draw_dim) / 2.0
+        self.program['px_size'] = 1.0 / max(radius_px, 1.0)
+        self.program['line_angle'] = self.line_angle
+        self.program['symmetric'] = 1.0 if self.symmetrical_ref_line else 0.0
+        self.program['a_position2d'] = self.quad_vbo
+        self.program.draw('triangle_strip')
+
+
+GAUGE_RENDERERS = {
+    'lines': AngleGauge,
+    'sdf': SdfAngleGauge,
+}
+
+
 class GaugeCanvas(app.Canvas):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, renderer='lines', **kwargs):
         if 'size' in kwargs.keys():
             canvas_size = kwargs['size']
         else:
             canvas_size = (1200, 400)
 
+        show = kwargs.pop('show', True)
         app.Canvas.__init__(self, *args, **kwargs)
 
         self.data_obj = None
+        self.profiler = FrameProfiler()
 
-        self.angle_gauge1 = AngleGauge((400, 400), canvas_size, (-400, 0))
-        self.angle_gauge2 = AngleGauge((400, 400), canvas_size, (0, 0))
-        self.angle_gauge3 = AngleGauge((400, 400), canvas_size, (400, 0))
+        # 'lines' draws line strips, 'sdf' the procedural SdfAngleGauge
+        gauge_cls = GAUGE_RENDERERS[renderer]
+        self.angle_gauge1 = gauge_cls((400, 400), canvas_size, (-400, 0))
+        self.angle_gauge2 = gauge_cls((400, 400), canvas_size, (0, 0))
+        self.angle_gauge3 = gauge_cls((400, 400), canvas_size, (400, 0))
 
         self.angle_gauge1.set_line_angle_offset(-90)
         self.angle_gauge2.set_line_angle_offset(-180)
@@ -230,7 +392,8 @@ class GaugeCanvas(app.Canvas):
         self.angle2 = 0
         self.angle3 = 0
 
-        self.show()
+        if show:
+            self.show()
 
     def update_gauges_sizes(self, new_screen_size: tuple):
         total_x = new_screen_size[0]
@@ -288,6 +451,9 @@ class GaugeCanvas(app.Canvas):
     def set_data_obj(self, data_obj):
         self.data_obj = data_obj
 
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+
     def update_angles(self, ypr_tpl):
         self.angle1 = ypr_tpl[0]
         self.angle2 = ypr_tpl[1]
@@ -307,6 +473,7 @@ class GaugeCanvas(app.Canvas):
     def on_draw(self, event):
         gloo.context.set_current_canvas(self)
         self.context.clear()
-        self.angle_gauge1.run_shaders()
-        self.angle_gauge2.run_shaders()
-        self.angle_gauge3.run_shaders()
+        with self.profiler.stage('gauge_shaders'):
+            self.angle_gauge1.run_shaders()
+            self.angle_gauge2.run_shaders()
+            self.angle_gauge3.run_shaders()
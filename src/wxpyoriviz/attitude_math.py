@@ -133,7 +133,8 @@ def EulerAngleRatesXYZ(attitude, omega_body):
     theta = attitude[1]
     E = np.array([[1, np.tan(theta) * np.sin(phi), np.tan(theta) * np.cos(phi)],
                   [0, np.cos(phi), -np.sin(phi)],
-                  [0, np.sin(phi) / np.cos(theta), np.cos(phi) / np.cos(theta)]])
+                  [0, np.sin(phi) / np.cos(theta), np.cos(phi) / np.cos(theta)]],
+                 dtype=np.result_type(phi, theta))
     return np.matmul(E, omega_body)
 
 
@@ -161,3 +162,53 @@ def EulerFromQuaternion(quat):
     yaw_z = np.arctan2(t3, t4)
 
     return (roll_x, pitch_y, yaw_z)
+
+
+def QuaternionSlerp(q0, q1, frac):
+    cos_half = np.dot(q0, q1)
+
+    # Take the short way around
+    if cos_half < 0.0:
+        q1 = -q1
+        cos_half = -cos_half
+
+    # Nearly parallel, plain lerp avoids dividing by a tiny sine
+    if cos_half > 0.9995:
+        return QuaternionNormalise(q0 + frac * (q1 - q0))
+
+    half_angle = np.arccos(cos_half)
+    sin_half = np.sin(half_angle)
+    w0 = np.sin((1.0 - frac) * half_angle) / sin_half
+    w1 = np.sin(frac * half_angle) / sin_half
+    return (w0 * q0) + (w1 * q1)
+
+
+# The functions below index the last axis, so they take either a single
+# quaternion / vector or an (N, 4) / (N, 3) array of them
+
+
+def QuaternionMultiply(p, q):
+    p0, p1, p2, p3 = p[..., 0], p[..., 1], p[..., 2], p[..., 3]
+    q0, q1, q2, q3 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+    r0 = (p0 * q0) - (p1 * q1) - (p2 * q2) - (p3 * q3)
+    r1 = (p0 * q1) + (p1 * q0) + (p2 * q3) - (p3 * q2)
+    r2 = (p0 * q2) - (p1 * q3) + (p2 * q0) + (p3 * q1)
+    r3 = (p0 * q3) + (p1 * q2) - (p2 * q1) + (p3 * q0)
+
+    return np.stack([r0, r1, r2, r3], axis=-1)
+
+
+def QuaternionFromRotationVector(rot_vec):
+    rot_vec = np.asarray(rot_vec)
+    angle = np.sqrt(np.sum(rot_vec * rot_vec, axis=-1))
+
+    # sin(a/2)/a, with its series expansion near zero
+    small = angle < 1e-6
+    safe_angle = np.where(small, 1.0, angle)
+    scale = np.where(small, 0.5 - (angle * angle) / 48.0,
+                     np.sin(0.5 * safe_angle) / safe_angle)
+
+    q0 = np.cos(0.5 * angle)
+    return np.concatenate([q0[..., np.newaxis],
+                           rot_vec * scale[..., np.newaxis]], axis=-1)
@@ -0,0 +1,290 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from . import attitude_math as amath
+
+
+# Multi-core conversions and integration over very long (N, k) arrays. The
+# rows are split into blocks small enough that a block and the temporaries
+# attitude_math makes for it stay in cache, and the blocks are run on a
+# thread pool (the NumPy kernels release the GIL) or a process pool. Every
+# block writes straight into its slice of a preallocated or memory mapped
+# output, so peak memory is the output plus a few blocks per worker.
+#
+# Process pools need arrays they can open by name: inputs and outputs given
+# as .npy paths are memory mapped by every worker, anything else is first
+# spilled to a temporary .npy file.
+BLOCK_ROWS = 16384
+
+
+def quat_to_dcm(quats):
+    return np.moveaxis(amath.QuatToDCM(quats.T), -1, 0)
+
+
+def quat_to_euler(quats):
+    return amath.EulerXYZfromQuaternion(quats.T).T
+
+
+def euler_to_quat(angles):
+    return amath.QuaternionFromEulerXYZ(angles.T).T
+
+
+# name: (input row shape, output row shape, block function)
+CONVERSIONS = {
+    'quat_to_dcm': ((4,), (3, 3), quat_to_dcm),
+    'quat_to_euler': ((4,), (3,), quat_to_euler),
+    'euler_to_quat': ((3,), (4,), euler_to_quat),
+    'rotvec_to_quat': ((3,), (4,), amath.QuaternionFromRotationVector),
+}
+
+
+def rate_increments(rates, dt, increments='euler'):
+    # Per step body frame quaternion increments. 'euler' reproduces
+    # GenRatesData.iterate_data, whose normalised first order step equals
+    # q <- q * (1, rates * dt / 2); 'exp' is the exact rotation for a rate
+    # held over the step, as in iterate_rotation_vectors.
+    if increments == 'exp':
+        return amath.QuaternionFromRotationVector(rates * dt)
+    inc = np.empty((len(rates), 4))
+    inc[:, 0] = 1.0
+    np.multiply(rates, 0.5 * dt, out=inc[:, 1:])
+    return inc
+
+
+def prefix_product(quats):
+    # Running products q0 * q1 * ... * qi of an (N, 4) array by recursive
+    # doubling, log2(N) vectorized passes instead of an N step loop
+    prod = np.array(quats, dtype=np.float64)
+    k = 1
+    while k < len(prod):
+        prod[k:] = amath.QuaternionMultiply(prod[:-k], prod[k:])
+        k *= 2
+    return prod
+
+
+def normalise_rows(quats):
+    quats /= np.sqrt(np.sum(quats * quats, axis=1, keepdims=True))
+    return quats
+
+
+def open_array(spec, mode='r'):
+    # Arrays are passed to workers as arrays (threads) or .npy paths
+    if isinstance(spec, str):
+        return np.load(spec, mmap_mode=mode)
+    return spec
+
+
+def run_conversion(name, src, dst, start, stop):
+    func = CONVERSIONS[name][2]
+    out = open_array(dst, 'r+')
+    out[start:stop] = func(np.asarray(open_array(src)[start:stop],
+                                      dtype=np.float64))
+
+
+def run_local_products(src, dst, start, stop, dt, increments):
+    # First pass of the integration: products within the block from
+    # identity. Returns the block's total rotation.
+    out = open_array(dst, 'r+')
+    rates = np.asarray(open_array(src)[start:stop], dtype=np.float64)
+    local = prefix_product(rate_increments(rates, dt, increments))
+    out[start:stop] = local
+    return local[-1]
+
+
+def run_apply_start(dst, start, stop, q_start):
+    # Second pass: rotate the block's local products by the attitude at the
+    # block's start
+    out = open_array(dst, 'r+')
+    out[start:stop] = normalise_rows(amath.QuaternionMultiply(
+        q_start, np.asarray(out[start:stop], dtype=np.float64)))
+
+
+class ChunkedExecutor:
+    def __init__(self, workers=None, processes=False, block_rows=BLOCK_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.block_rows = block_rows
+        self.pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(
+            self.workers)
+        self.spill_dir = None
+        self.n_spilled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+    def blocks(self, n_rows):
+        return [(start, min(start + self.block_rows, n_rows))
+                for start in range(0, n_rows, self.block_rows)]
+
+    def temp_path(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='batch_exec_')
+        self.n_spilled += 1
+        return os.path.join(self.spill_dir,
+                            "spill_{}.npy".format(self.n_spilled))
+
+    def spill(self, array):
+        # A path process workers can memory map the array from
+        if isinstance(array, str):
+            return array
+        path = self.temp_path()
+        np.save(path, array)
+        return path
+
+    def prepare(self, data, out, shape):
+        # Input and output as handed to the workers, and the output array
+        # returned to the caller. out may be None, an array or a .npy path
+        # to create as a memory map.
+        if isinstance(out, str):
+            np.lib.format.open_memmap(out, 'w+', np.float64, shape).flush()
+            result = np.load(out, mmap_mode='r+')
+        elif out is None and self.processes:
+            out = self.temp_path()
+            np.lib.format.open_memmap(out, 'w+', np.float64, shape).flush()
+            result = None
+        else:
+            if out is None:
+                out = np.empty(shape)
+            result = out
+
+        if self.processes:
+            return self.spill(data), self.spill(out), result
+        return open_array(data), result, result
+
+    def finish(self, dst, result):
+        if result is None:
+            # Process pool without an output given, read the spilled one in
+            return np.array(np.load(dst, mmap_mode='r'))
+        if isinstance(result, np.memmap):
+            result.flush()
+        return result
+
+    def convert(self, name, data, out=None):
+        # Applies a CONVERSIONS entry to (N, ...) rows, e.g.
+        # convert('quat_to_euler', quats) -> (N, 3)
+        in_shape, out_shape, _ = CONVERSIONS[name]
+        n_rows = len(open_array(data))
+        src, dst, result = self.prepare(data, out, (n_rows,) + out_shape)
+        futures = [self.pool.submit(run_conversion, name, src, dst, a, b)
+                   for a, b in self.blocks(n_rows)]
+        for future in futures:
+            future.result()
+        return self.finish(dst, result)
+
+    def integrate(self, rates, dt, q0=(1.0, 0.0, 0.0, 0.0), out=None,
+                  increments='euler'):
+        # (N, 4) attitude quaternions after each row of (N, 3) body rates
+        # (rad/s, GenRatesData convention). Body frame increments depend on
+        # the rates only, so the running product splits into per block
+        # products, a short sequential pass over the block totals, and the
+        # per block correction.
+        n_rows = len(open_array(rates))
+        src, dst, result = self.prepare(rates, out, (n_rows, 4))
+        blocks = self.blocks(n_rows)
+
+        totals = [f.result() for f in [
+            self.pool.submit(run_local_products, src, dst, a, b, dt,
+                             increments) for a, b in blocks]]
+
+        q_start = np.array(q0, dtype=np.float64)
+        futures = []
+        for (a, b), total in zip(blocks, totals):
+            futures.append(self.pool.submit(run_apply_start, dst, a, b,
+                                            q_start))
+            q_start = amath.QuaternionMultiply(q_start, total)
+            q_start = q_start / np.linalg.norm(q_start)
+        for future in futures:
+            future.result()
+        return self.finish(dst, result)
+
+
+def bench_scaling(n_rows=2000000, max_workers=None, processes=False):
+    # Rows per second of quat_to_euler and integrate for 1, 2, 4, ... workers
+    rng = np.random.default_rng(0)
+    quats = rng.normal(size=(n_rows, 4))
+    quats /= np.linalg.norm(quats, axis=1, keepdims=True)
+    rates = np.radians(rng.normal(0.0, 60.0, size=(n_rows, 3)))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+
+    results = {}
+    for workers in counts:
+        with ChunkedExecutor(workers, processes) as executor:
+            timings = {}
+            for name, run in (
+                    ('quat_to_euler',
+                     lambda: executor.convert('quat_to_euler', quats)),
+                    ('integrate', lambda: executor.integrate(rates, 1 / 60))):
+                t0 = time.perf_counter()
+                run()
+                timings[name] = n_rows / (time.perf_counter() - t0)
+            results[workers] = timings
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Chunked multi-core attitude conversions and "
+                    "integration of .npy arrays")
+    parser.add_argument('task', choices=sorted(CONVERSIONS) + ['integrate',
+                                                               'bench'])
+    parser.add_argument('input', nargs='?', help="Input (N, k) .npy file")
+    parser.add_argument('output', nargs='?',
+                        help="Output .npy file, written as a memory map")
+    parser.add_argument('--dt', type=float,
+                        help="Sample interval in seconds, for integrate")
+    parser.add_argument('--exp', action='store_true',
+                        help="Integrate with exact rotation increments "
+                             "instead of GenRatesData's first order step")
+    parser.add_argument('--workers', type=int,
+                        help="Pool size, default one per core")
+    parser.add_argument('--processes', action='store_true',
+                        help="Use a process pool instead of threads")
+    parser.add_argument('--block-rows', type=int, default=BLOCK_ROWS)
+    parser.add_argument('--rows', type=int, default=2000000,
+                        help="Rows for the bench task")
+    args = parser.parse_args()
+
+    if args.task == 'bench':
+        for workers, timings in bench_scaling(
+                args.rows, args.workers, args.processes).items():
+            print("{:>3} workers: ".format(workers) + ", ".join(
+                "{} {:,.0f} rows/s".format(name, rate)
+                for name, rate in timings.items()))
+        raise SystemExit(0)
+
+    if args.input is None or args.output is None:
+        parser.error("{} needs an input and an output file".format(args.task))
+    if args.task == 'integrate' and args.dt is None:
+        parser.error("integrate needs --dt")
+
+    t0 = time.perf_counter()
+    with ChunkedExecutor(args.workers, args.processes,
+                         args.block_rows) as executor:
+        if args.task == 'integrate':
+            executor.integrate(args.input, args.dt, out=args.output,
+                               increments='exp' if args.exp else 'euler')
+        else:
+            executor.convert(args.task, args.input, out=args.output)
+    print("{} done in {:.2f} s".format(args.task, time.perf_counter() - t0))
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from . import attitude_math as amath
+from . import math_backend
+from .orientation import GenRatesData, precision_drift
+
+
+# Each result is stored as {'value': ..., 'unit': ..., 'better': 'lower' or
+# 'higher'} so runs can be compared without knowing what was measured.
+
+REPEATS = 5
+
+
+def time_per_call(func, repeats=REPEATS):
+    # Best of several autoranged runs, in nanoseconds per call
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeats, number=number))
+    return 1e9 * best / number
+
+
+def bench_math():
+    quat = amath.QuaternionFromEulerXYZ([0.3, -0.2, 0.5])
+    attitude = np.array([0.3, -0.2, 0.5])
+    omega = np.array([0.1, -0.4, 1.5])
+    rot_vec = omega * 1e-3
+    quat2 = amath.QuaternionFromEulerXYZ([0.35, -0.1, 0.55])
+
+    cases = {
+        'RotationX': lambda: amath.RotationX(0.3),
+        'DCMfromEulerXYZ': lambda: amath.DCMfromEulerXYZ(attitude),
+        'QuaternionFromEulerXYZ': lambda: amath.QuaternionFromEulerXYZ(attitude),
+        'EulerXYZfromQuaternion': lambda: amath.EulerXYZfromQuaternion(quat),
+        'QuaternionNormalise': lambda: amath.QuaternionNormalise(quat),
+        'QuatToDCM': lambda: amath.QuatToDCM(quat),
+        'QuaternionRates': lambda: amath.QuaternionRates(quat, omega),
+        'EulerAngleRatesXYZ': lambda: amath.EulerAngleRatesXYZ(attitude, omega),
+        'EulerIntegration': lambda: amath.EulerIntegration(quat, quat2, 1e-3),
+        'EulerFromQuaternion': lambda: amath.EulerFromQuaternion(quat),
+        'QuaternionSlerp': lambda: amath.QuaternionSlerp(quat, quat2, 0.3),
+        'QuaternionMultiply': lambda: amath.QuaternionMultiply(quat, quat2),
+        'QuaternionFromRotationVector':
+            lambda: amath.QuaternionFromRotationVector(rot_vec),
+    }
+
+    results = {}
+    for name, func in cases.items():
+        results['math.' + name] = {
+            'value': time_per_call(func), 'unit': 'ns/call', 'better': 'lower'}
+    return results
+
+
+def bench_stepping(n_steps=20000):
+    data = GenRatesData()
+    data.set_body_rates((10.0, 20.0, 90.0))
+
+    t0 = time.perf_counter()
+    for _ in range(n_steps):
+        data.iterate_data()
+    elapsed = time.perf_counter() - t0
+
+    results = {'step.iterate_data': {
+        'value': n_steps / elapsed, 'unit': 'steps/s', 'better': 'higher'}}
+
+    # Offline stepping through each available math backend; a first call
+    # compiles the numba loop
+    for name in math_backend.BACKENDS:
+        if name == 'numba' and not math_backend.HAVE_NUMBA:
+            continue
+        data = GenRatesData(backend=name)
+        data.set_body_rates((10.0, 20.0, 90.0))
+        data.run_steps(10)
+        t0 = time.perf_counter()
+        data.run_steps(n_steps)
+        elapsed = time.perf_counter() - t0
+        results['step.run_steps.' + name] = {
+            'value': n_steps / elapsed, 'unit': 'steps/s', 'better': 'higher'}
+    return results
+
+
+def bench_memory(n_steps=2000, block=1024):
+    # Size of the GenRatesData histories once they have grown to their cap
+    # (2 * history_rows rows, see HistoryBuffer) and run n_steps past it.
+    # They stop growing there, so this is the steady state of a run of any
+    # length. Filled in run_steps blocks, which takes seconds.
+    data = GenRatesData()
+    data.set_body_rates((10.0, 20.0, 90.0))
+    for _ in range(2 * data.history_rows // block):
+        data.run_steps(block)
+    for _ in range(n_steps):
+        data.iterate_data()
+
+    held = data.time_history.data.nbytes + data.angle_history.data.nbytes
+    return {'memory.history_steady_state': {
+        'value': held / 2 ** 20, 'unit': 'MiB', 'better': 'lower'}}
+
+
+def bench_precision(duration=600.0):
+    drift = precision_drift(duration=duration)
+    return {'drift.float32_max_deg': {
+        'value': drift['max_error_deg'], 'unit': 'deg', 'better': 'lower'}}
+
+
+def bench_render(backend, n_frames=200):
+    # Frame time of the canvases drawn offscreen. Needs vispy and a GL
+    # backend that can run headless (e.g. egl or osmesa).
+    try:
+        from vispy import app, gloo
+        app.use_app(backend)
+        from .angle_gauges import GaugeCanvas
+        from .chevron_viz import ChevronCanvas
+    except Exception as exc:
+        print("Skipping render benchmarks: {}".format(exc), file=sys.stderr)
+        return {}
+
+    data = GenRatesData()
+    data.set_body_rates((10.0, 20.0, 90.0))
+
+    results = {}
+    for name, cls in (('ChevronCanvas', ChevronCanvas),
+                      ('GaugeCanvas', GaugeCanvas)):
+        canvas = cls(size=(800, 600), show=False)
+        canvas.set_data_obj(data)
+        frame_times = []
+        with canvas:
+            for _ in range(n_frames):
+                data.iterate_data()
+                if name == 'ChevronCanvas':
+                    canvas.update_dcm(data.get_dcm())
+                else:
+                    canvas.update_angles(data.get_latest_ypr())
+
+                t0 = time.perf_counter()
+                canvas.on_draw(None)
+                gloo.finish()
+                frame_times.append(time.perf_counter() - t0)
+        canvas.close()
+
+        results['render.' + name] = {
+            'value': 1e3 * float(np.median(frame_times)), 'unit': 'ms/frame',
+            'better': 'lower'}
+    return results
+
+
+def bench_startup(repeats=REPEATS):
+    # Fresh interpreter importing only the math and data layers, which must
+    # not pull in wx or vispy. Best of several runs, in milliseconds.
+    code = ("import sys, time; t0 = time.perf_counter(); "
+            "import wxpyoriviz.attitude_math, wxpyoriviz.orientation; "
+            "print(time.perf_counter() - t0); "
+            "sys.exit('wx' in sys.modules or 'vispy' in sys.modules)")
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], cwd=src_dir,
+                             capture_output=True, text=True, check=True)
+        times.append((time.perf_counter() - t0, float(out.stdout)))
+
+    return {
+        'startup.interpreter_and_import': {
+            'value': 1e3 * min(t[0] for t in times), 'unit': 'ms',
+            'better': 'lower'},
+        'startup.import_math': {
+            'value': 1e3 * min(t[1] for t in times), 'unit': 'ms',
+            'better': 'lower'},
+    }
+
+
+def run_all(render_backend=None):
+    results = {}
+    results.update(bench_math())
+    results.update(bench_stepping())
+    results.update(bench_memory())
+    results.update(bench_precision())
+    results.update(bench_startup())
+    if render_backend is not None:
+        results.update(bench_render(render_backend))
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    # Returns the names of results that got worse by more than tolerance
+    regressions = []
+    print("{:<40} {:>14} {:>14} {:>9}".format(
+        "benchmark", "baseline", "current", "change"))
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            print("{:<40} {:>14} {:>14.4g}".format(name, "-", result['value']))
+            continue
+
+        change = (result['value'] - base['value']) / base['value']
+        worse = change > tolerance if result['better'] == 'lower' \
+            else change < -tolerance
+        if worse:
+            regressions.append(name)
+        print("{:<40} {:>14.4g} {:>14.4g} {:>+8.1%}{}".format(
+            name, base['value'], result['value'], change,
+            "  REGRESSION" if worse else ""))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for attitude math, stepping and rendering")
+    parser.add_argument('-o', '--output', help="Write results to a JSON file")
+    parser.add_argument('--baseline', help="Compare against saved results")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Allowed relative slowdown before failing")
+    parser.add_argument('--render-backend',
+                        help="vispy backend for offscreen rendering, e.g. egl")
+    args = parser.parse_args()
+
+    current = run_all(args.render_backend)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+    else:
+        for name, result in sorted(current['results'].items()):
+            print("{:<40} {:>14.4g} {}".format(
+                name, result['value'], result['unit']))
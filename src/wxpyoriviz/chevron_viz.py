@@ -0,0 +1,495 @@
+import itertools
+import time
+
+import numpy as np
+from vispy import app, gloo
+from vispy.util.transforms import ortho, perspective, rotate
+
+from . import attitude_math as amath
+from . import gl_cache
+from .frame_profiler import FrameProfiler
+
+
+def deg_to_rad(deg):
+    return deg * (np.pi / 180.0)
+
+
+def lookAt(eye, target, up=[0, 0, 1]):
+    """Computes matrix to put eye looking at target point."""
+    eye = np.asarray(eye).astype(np.float32)
+    target = np.asarray(target).astype(np.float32)
+    up = np.asarray(up).astype(np.float32)
+
+    vforward = eye - target
+    vforward /= np.linalg.norm(vforward)
+    vright = np.cross(up, vforward)
+    vright /= np.linalg.norm(vright)
+    vup = np.cross(vforward, vright)
+
+    view = np.r_[vright, -np.dot(vright, eye),
+                 vup, -np.dot(vup, eye),
+                 vforward, -np.dot(vforward, eye),
+                 [0, 0, 0, 1]].reshape(4, 4, order='F')
+
+    return view
+
+
+def getView(azimuth, elevation, distance, target=[0, 0, 0]):
+    """Computes view matrix based on angle, distance and target."""
+    x = distance * np.sin(elevation) * np.sin(azimuth)
+    y = distance * np.sin(-elevation) * np.cos(azimuth)
+    z = distance * np.cos(elevation)
+    return lookAt([x, y, z], target)
+
+
+camera_versions = itertools.count()
+
+
+class ViewportCamera:
+    # One camera of a multi-view layout. rect is the (x, y, width, height)
+    # fraction of the canvas it draws into, y measured from the bottom as in
+    # gl viewports. The view and projection matrices are cached and only
+    # rebuilt by resize() or a camera change (orbit, zoom), never per frame;
+    # version changes with every rebuild, and is unique across cameras, so
+    # users can tell when to re-upload them.
+
+    def __init__(self, name, azimuth, elevation, distance=3.0,
+                 rect=(0.0, 0.0, 1.0, 1.0), projection='perspective',
+                 up=(0, 0, 1), interactive=False):
+        self.name = name
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.distance = distance
+        self.rect = rect
+        self.projection_type = projection
+        self.up = up
+        self.interactive = interactive   # Follows mouse drags and the wheel
+
+        self.viewport = (0, 0, 1, 1)
+        self.update_view()
+        self.update_projection()
+
+    def update_view(self):
+        x = self.distance * np.sin(self.elevation) * np.sin(self.azimuth)
+        y = self.distance * np.sin(-self.elevation) * np.cos(self.azimuth)
+        z = self.distance * np.cos(self.elevation)
+        self.view = lookAt([x, y, z], [0, 0, 0], self.up)
+        self.version = next(camera_versions)
+
+    def update_projection(self):
+        width, height = self.viewport[2], self.viewport[3]
+        aspect = width / max(height, 1)
+        if self.projection_type == 'ortho':
+            # Scene is about 1.5 units across, scaled with the zoom
+            half = 0.4 * self.distance
+            self.projection = ortho(-half * aspect, half * aspect,
+                                    -half, half, 0.1, 10.0)
+        else:
+            self.projection = perspective(40.0, aspect, 2.0, 10.0)
+        self.version = next(camera_versions)
+
+    def resize(self, canvas_size):
+        x, y, w, h = self.rect
+        self.viewport = (int(x * canvas_size[0]), int(y * canvas_size[1]),
+                         max(int(w * canvas_size[0]), 1),
+                         max(int(h * canvas_size[1]), 1))
+        self.update_projection()
+
+    def contains(self, pos, canvas_size):
+        # pos and canvas_size in logical pixels, origin top left as in mouse
+        # events
+        fx = pos[0] / canvas_size[0]
+        fy = 1.0 - pos[1] / canvas_size[1]
+        x, y, w, h = self.rect
+        return x <= fx < x + w and y <= fy < y + h
+
+    def orbit(self, d_azimuth, d_elevation):
+        self.azimuth += d_azimuth
+        # Stay clear of the poles, where the up vector degenerates
+        self.elevation = min(max(self.elevation + d_elevation, 0.05),
+                             np.pi - 0.05)
+        self.update_view()
+
+    def zoom(self, factor):
+        self.distance = min(max(self.distance * factor, 2.5), 8.0)
+        self.update_view()
+        if self.projection_type == 'ortho':
+            self.update_projection()
+
+
+def camera_layout(name):
+    # Predefined layouts for ChevronCanvas.set_cameras. 'single' is the
+    # original fixed view, 'quad' adds orthographic top, front and side views
+    # of the same attitude next to a free orbit camera.
+    orbit = (-(3 * np.pi / 4), np.pi / 3)
+    if name == 'single':
+        return [ViewportCamera('orbit', *orbit, interactive=True)]
+    if name == 'quad':
+        return [
+            ViewportCamera('top', 0.0, 0.0, rect=(0.0, 0.5, 0.5, 0.5),
+                           projection='ortho', up=(1, 0, 0)),
+            ViewportCamera('orbit', *orbit, rect=(0.5, 0.5, 0.5, 0.5),
+                           interactive=True),
+            ViewportCamera('front', np.pi / 2, np.pi / 2,
+                           rect=(0.0, 0.0, 0.5, 0.5), projection='ortho'),
+            ViewportCamera('side', 0.0, np.pi / 2,
+                           rect=(0.5, 0.0, 0.5, 0.5), projection='ortho'),
+        ]
+    raise ValueError("Unknown camera layout '{}'".format(name))
+
+
+CAMERA_LAYOUTS = ('single', 'quad')
+
+
+class ChevronIndicator:
+    VERT_SHADER = """
+    // Uniforms
+    // ------------------------------------
+    uniform   mat4 u_model;
+    uniform   mat4 u_view;
+    uniform   mat4 u_projection;
+    uniform   vec4 u_color;
+
+    // Attributes
+    // ------------------------------------
+    attribute vec3 a_position;
+
+    // Varying
+    // ------------------------------------
+    varying vec4 v_color;
+
+    void main()
+    {
+        v_color = u_color;
+        gl_Position = u_projection * u_view * u_model * vec4(a_position,1.0);
+    }
+    """
+
+    FRAG_SHADER = """
+    // Varying
+    // ------------------------------------
+    varying vec4 v_color;
+
+    void main()
+    {
+        gl_FragColor = v_color;
+    }
+    """
+
+    def __init__(self, scr_dim: tuple):
+        view_azimuth = -(3 * np.pi / 4)
+        view_elevation = np.pi / 3
+        self.view = getView(view_azimuth, view_elevation, 3)
+
+        self.model = np.eye(4, dtype=np.float32)
+        # Reused by set_dcm_rot so a new attitude does not allocate
+        self.model_dcm = np.eye(4, dtype=np.float32)
+
+        self.projection = perspective(40.0, scr_dim[0] / scr_dim[1], 2.0, 10.0)
+        self.view_version = next(camera_versions)
+
+        self.phi = 0    # Roll
+        self.theta = 0  # Pitch
+        self.psi = 0    # Yaw
+
+        self.color = (0, 0, 0, 1)
+        self.floor_color = (0.8, 0.8, 0.8, 1)
+
+        # Program and buffers come from the context's resource cache on the
+        # first draw, see build_programs
+        self.cache = None
+        self.program = None
+        self.identity = np.eye(4, dtype=np.float32)
+
+        self.draw_floor_refs = True
+        self.build_floor_verts()
+
+    def build_programs(self):
+        # The chevron and the floor planes use the same shaders, so with
+        # the cache every indicator in a context shares one program
+        self.cache = gl_cache.get_cache()
+        self.program = self.cache.program(self.VERT_SHADER, self.FRAG_SHADER)
+        self.vbo = self.cache.vertex_buffer(self.get_verts())
+        self.floor_vbo_yz = self.cache.vertex_buffer(self.verts_yz)
+        self.floor_vbo_xy = self.cache.vertex_buffer(self.verts_xy)
+        self.floor_vbo_xz = self.cache.vertex_buffer(self.verts_xz)
+
+    def get_verts(self):
+        verts_y = np.array([(0, -0.4, 0), (0, 0.6, 0), (0.4, -0.7, 0),
+                            (0, -0.4, 0), (-0.4, -0.7, 0), (0, 0.6, 0),
+                            (0, 0.1, 0), (0, -0.5, 0.15), (0, -0.4, 0)]).astype(np.float32)
+
+        verts = np.array([(0, -0.4, 0), (0, 0.6, 0), (0.4, -0.7, 0),
+                          (0, -0.4, 0), (-0.4, -0.7, 0), (0, 0.6, 0),
+                          (0, 0.1, 0), (0, -0.5, 0.15), (0, -0.4, 0)]).astype(np.float32)
+
+        angle = deg_to_rad(-90)
+        rot_z = np.array([[np.cos(angle), -np.sin(angle), 0],
+                          [np.sin(angle), np.cos(angle), 0],
+                          [0, 0, 1]])
+
+        return np.array([np.matmul(rot_z, v) for v in verts]).astype(np.float32)
+
+    def build_floor_verts(self):
+        scale_fact = 0.75
+        self.verts_xz = scale_fact * np.array(
+            [(-1, 0, -1), (1, 0, -1), (1, 0, 1), (-1, 0, 1), (-1, 0, -1)]).astype(np.float32)
+
+        self.verts_xy = scale_fact * np.array(
+            [(-1, 1, 0), (1, 1, 0), (1, -1, 0), (-1, -1, 0), (-1, 1, 0)]).astype(np.float32)
+
+        self.verts_yz = scale_fact * np.array(
+            [(0, 1, -1), (0, 1, 1), (0, -1, 1), (0, -1, -1), (0, 1, -1)]).astype(np.float32)
+
+    def update_screen_size(self, new_size: tuple):
+        self.projection = perspective(
+            40.0, new_size[0] / new_size[1], 2.0, 10.0)
+        self.view_version = next(camera_versions)
+
+    # Angles should be passed in degrees
+    def set_ypr_angles(self, ypr: tuple):
+        self.phi = -ypr[2]
+        self.theta = -ypr[1]
+        self.psi = -ypr[0]
+
+        self.model = np.dot(rotate(self.phi, (1, 0, 0)), np.dot(rotate(self.theta, (0, 1, 0)),
+                                                                rotate(self.psi, (0, 0, 1))))
+
+    def set_dcm_rot(self, dcm):
+        self.model_dcm[:3, :3] = dcm
+        self.model = self.model_dcm
+
+    def set_draw_floor_refs(self, draw: bool):
+        self.draw_floor_refs = draw
+
+    def bind_camera(self, camera):
+        # Uploads a camera's cached matrices, skipped when the program still
+        # holds them from the last draw, e.g. a single view
+        if camera is None:
+            key, view, projection = (self.view_version, self.view,
+                                     self.projection)
+        else:
+            key = camera.version
+            view, projection = camera.view, camera.projection
+        if self.cache.needs_upload(self.program, 'camera', key):
+            self.program['u_view'] = view
+            self.program['u_projection'] = projection
+
+    def run_shaders(self, camera=None):
+        if self.program is None:
+            self.build_programs()
+
+        self.bind_camera(camera)
+
+        # The program is shared, so this indicator's attitude and colours
+        # are set again for every draw
+        self.program['a_position'] = self.vbo
+        self.program['u_model'] = self.model
+        self.program['u_color'] = self.color
+        self.program.draw('line_strip')
+
+        if self.draw_floor_refs:
+            self.program['u_model'] = self.identity
+            self.program['u_color'] = self.floor_color
+
+            self.program['a_position'] = self.floor_vbo_yz
+            self.program.draw('line_strip')
+
+            self.program['a_position'] = self.floor_vbo_xy
+            self.program.draw('line_strip')
+
+            self.program['a_position'] = self.floor_vbo_xz
+            self.program.draw('line_strip')
+
+
+class ChevronCanvas(app.Canvas):
+    def __init__(self, *args, **kwargs):
+        self.print_callback = None
+        self.interpolator = None
+        self.frame_callback = None
+        self.profiler = FrameProfiler()
+        self.overlay_text = None
+        self.show_overlay = False
+        self.overlay_next_refresh = 0.0
+        scr_size = (800, 600)
+        show = kwargs.pop('show', True)
+        app.Canvas.__init__(self, *args, **kwargs)
+
+        self.chevron = ChevronIndicator(scr_size)
+
+        # Every camera draws the same programs and buffers into its own
+        # viewport of this one context
+        self.cameras = []
+        self.set_cameras(camera_layout('single'))
+        self.drag_camera = None
+
+        gloo.set_viewport(0, 0, scr_size[0], scr_size[1])
+
+        gloo.set_clear_color('white')
+        gloo.set_state('opaque')
+
+        self.timer = app.Timer('auto', connect=self.on_timer)
+
+        if show:
+            self.show()
+
+        # self.phi = 0
+        # self.theta = 0
+        # self.psi = 0
+
+    def set_data_obj(self, data_obj):
+        self.data_obj = data_obj
+
+    def on_timer(self, event):
+        # self.phi += 0.0
+        # self.theta += 1.0
+        # self.psi += 1.0
+
+        # ypr_tpl = (self.psi, self.theta, self.phi)
+        with self.profiler.stage('integrate'):
+            self.data_obj.iterate_data()
+
+        with self.profiler.stage('matrices'):
+            self.chevron.set_ypr_angles(self.data_obj.get_latest_ypr())
+        # self.chevron.set_dcm_rot(self.data_obj.get_dcm())
+
+        if self.print_callback is not None:
+            self.print_callback(self.data_obj.get_latest_ypr())
+
+        self.update()
+
+    def set_interpolator(self, interpolator, frame_callback=None):
+        # With an interpolator set, the attitude is sampled at draw time and
+        # frame_callback receives the same quaternion so other displays can
+        # show exactly what this frame shows
+        self.interpolator = interpolator
+        self.frame_callback = frame_callback
+        self.update()
+
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+        profiler.wrap_swap(self)
+
+    def set_profiler_overlay(self, show: bool):
+        if show and self.overlay_text is None:
+            from vispy import visuals
+            self.overlay_text = visuals.TextVisual(
+                '', color='black', font_size=8, anchor_x='left',
+                anchor_y='top')
+            self.overlay_text.transforms.configure(
+                canvas=self, viewport=(0, 0) + tuple(self.physical_size))
+        self.show_overlay = show
+        self.update()
+
+    def draw_overlay(self):
+        # Re-layout the text a few times a second, not every frame
+        now = time.perf_counter()
+        if now >= self.overlay_next_refresh:
+            lines = self.profiler.format_summary().split("\n")
+            self.overlay_text.text = lines
+            self.overlay_text.pos = [(10, 10 + 14 * i)
+                                     for i in range(len(lines))]
+            self.overlay_next_refresh = now + 0.25
+        self.overlay_text.draw()
+
+    def update_dcm(self, dcm):
+        with self.profiler.stage('matrices'):
+            self.chevron.set_dcm_rot(dcm)
+
+        self.update()
+
+    def set_cameras(self, cameras):
+        # A list of ViewportCamera, or the name of a camera_layout
+        if isinstance(cameras, str):
+            cameras = camera_layout(cameras)
+        self.cameras = cameras
+        for camera in cameras:
+            camera.resize(self.physical_size)
+        self.update()
+
+    def camera_at(self, pos):
+        for camera in self.cameras:
+            if camera.contains(pos, self.size):
+                return camera
+        return None
+
+    def on_mouse_press(self, event):
+        camera = self.camera_at(event.pos)
+        if camera is not None and camera.interactive:
+            self.drag_camera = camera
+
+    def on_mouse_release(self, event):
+        self.drag_camera = None
+
+    def on_mouse_move(self, event):
+        if self.drag_camera is None or event.last_event is None:
+            return
+        dx, dy = np.subtract(event.pos, event.last_event.pos)
+        self.drag_camera.orbit(-0.01 * dx, -0.01 * dy)
+        self.update()
+
+    def on_mouse_wheel(self, event):
+        camera = self.camera_at(event.pos)
+        if camera is not None and camera.interactive:
+            camera.zoom(0.9 ** event.delta[1])
+            self.update()
+
+    def set_ref_planes(self, draw: bool):
+        self.chevron.set_draw_floor_refs(draw)
+        self.update()
+
+    def on_key_press(self, event):
+        if event.text == 'p' or event.text == 'P':
+            if self.timer.running:
+                self.timer.stop()
+            else:
+                self.timer.start()
+        elif event.text == 'r' or event.text == 'R':
+            # i_data.reset_data()
+            self.chevron.set_ypr_angles((0, 0, 0))
+        elif event.text == 'v' or event.text == 'V':
+            # Cycle through the camera layouts
+            names = [camera.name for camera in self.cameras]
+            self.set_cameras('quad' if names == ['orbit'] else 'single')
+
+        self.update()
+
+    def on_resize(self, event):
+        gloo.set_viewport(0, 0, event.physical_size[0], event.physical_size[1])
+        self.chevron.update_screen_size(
+            (event.physical_size[0], event.physical_size[1]))
+        for camera in self.cameras:
+            camera.resize(event.physical_size)
+        if self.overlay_text is not None:
+            self.overlay_text.transforms.configure(
+                canvas=self, viewport=(0, 0) + tuple(event.physical_size))
+
+    def on_draw(self, event):
+        self.profiler.begin_frame()
+        gloo.context.set_current_canvas(self)
+        gloo.clear()
+        gloo.set_state(blend=True, depth_test=True)
+
+        if self.interpolator is not None and self.interpolator.has_state():
+            with self.profiler.stage('interpolate'):
+                quat = self.interpolator.sample(time.perf_counter())
+            with self.profiler.stage('matrices'):
+                self.chevron.set_dcm_rot(amath.QuatToDCM(quat))
+            if self.frame_callback is not None:
+                self.frame_callback(quat)
+
+        with self.profiler.stage('run_shaders'):
+            for camera in self.cameras:
+                gloo.set_viewport(*camera.viewport)
+                self.chevron.run_shaders(camera)
+
+        if self.show_overlay:
+            gloo.set_viewport(0, 0, *self.physical_size)
+            self.draw_overlay()
+
+        # Keep drawing until the rendered attitude reaches the newest state
+        if self.interpolator is not None and not self.interpolator.is_settled():
+            self.update()
+
+    def stop_timer(self):
+        self.timer.stop()
@@ -0,0 +1,245 @@
+import argparse
+import time
+
+import numpy as np
+
+from . import attitude_math as amath
+
+
+# Event detection over recorder.RecordingReader recordings. Every chunk is
+# tested with array operations, runs of flagged rows become intervals, and
+# the intervals of all kinds go into one EventIndex sorted by start row that
+# the GUI can jump through. Runs crossing a chunk boundary are joined.
+#
+#   rate        body rate magnitude above rate_limit (deg/s)
+#   gimbal      quaternion solution pitch within pitch_margin (deg) of +-90,
+#               where EulerAngleRatesXYZ goes singular
+#   norm_drift  quaternion norm before normalising off 1 by more than
+#               norm_tolerance (recordings with a q_norm column)
+#   divergence  Euler angle solution more than divergence_limit (deg) of
+#               rotation away from the quaternion solution
+EVENT_KINDS = ('rate', 'gimbal', 'norm_drift', 'divergence')
+
+
+def solution_divergence(quats, eulers):
+    # Angle (deg) of the rotation between (N, 4) quaternion solutions and
+    # (N, 3) Euler angle solutions, via the vector part of the relative
+    # quaternion so small angles stay accurate
+    q_euler = amath.QuaternionFromEulerXYZ(eulers.T).T
+    q_inv = quats * np.array([1.0, -1.0, -1.0, -1.0])
+    q_rel = amath.QuaternionMultiply(q_inv, q_euler)
+    sin_half = np.minimum(np.linalg.norm(q_rel[:, 1:], axis=1), 1.0)
+    return np.degrees(2.0 * np.arcsin(sin_half))
+
+
+class EventIndex:
+    # Intervals [start, stop) in rows, with the time of their first and last
+    # row and the peak of the tested quantity (deg/s, deg or norm error)
+
+    FIELDS = ('kind', 'start', 'stop', 't_start', 't_stop', 'peak')
+
+    def __init__(self, kind, start, stop, t_start, t_stop, peak):
+        order = np.lexsort((kind, start))
+        self.kind = np.asarray(kind, dtype=np.int8)[order]
+        self.start = np.asarray(start, dtype=np.int64)[order]
+        self.stop = np.asarray(stop, dtype=np.int64)[order]
+        self.t_start = np.asarray(t_start, dtype=np.float64)[order]
+        self.t_stop = np.asarray(t_stop, dtype=np.float64)[order]
+        self.peak = np.asarray(peak, dtype=np.float64)[order]
+        # Running maximum of the stops; everything before the first entry
+        # above a row has ended by then, which bounds the overlap search
+        self.max_stop = np.maximum.accumulate(self.stop) \
+            if len(self.stop) else self.stop
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, i):
+        return {'kind': EVENT_KINDS[self.kind[i]], 'start': int(self.start[i]),
+                'stop': int(self.stop[i]), 't_start': float(self.t_start[i]),
+                't_stop': float(self.t_stop[i]), 'peak': float(self.peak[i])}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def kind_mask(self, kind):
+        if kind is None:
+            return np.ones(len(self), dtype=bool)
+        return self.kind == EVENT_KINDS.index(kind)
+
+    def overlapping(self, start, stop=None):
+        # Positions of the events overlapping rows [start, stop), or covering
+        # row start when stop is None
+        if stop is None:
+            stop = start + 1
+        lo = int(np.searchsorted(self.max_stop, start, side='right'))
+        hi = int(np.searchsorted(self.start, stop, side='left'))
+        candidates = np.arange(lo, hi)
+        return candidates[self.stop[lo:hi] > start]
+
+    def next_after(self, row, kind=None):
+        # Position of the first event starting after row, or None
+        i = int(np.searchsorted(self.start, row, side='right'))
+        hits = np.flatnonzero(self.kind_mask(kind)[i:])
+        return i + int(hits[0]) if len(hits) else None
+
+    def previous_before(self, row, kind=None):
+        # Position of the last event starting before row, or None
+        i = int(np.searchsorted(self.start, row, side='left'))
+        hits = np.flatnonzero(self.kind_mask(kind)[:i])
+        return int(hits[-1]) if len(hits) else None
+
+    def counts(self):
+        return {name: int(np.count_nonzero(self.kind == code))
+                for code, name in enumerate(EVENT_KINDS)}
+
+    def save(self, path):
+        np.savez(path, **{name: getattr(self, name) for name in self.FIELDS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(*(npz[name] for name in cls.FIELDS))
+
+
+class RunTracker:
+    # Turns per chunk boolean masks into runs, carrying an unfinished run
+    # over to the next chunk
+
+    def __init__(self):
+        self.open = None    # [start row, start time, peak] of a running run
+        self.runs = []      # (start, stop, t_start, t_stop, peak) arrays
+
+    def push(self, row0, t, mask, value):
+        padded = np.concatenate(([False], mask, [False])).view(np.int8)
+        edges = np.diff(padded)
+        starts = np.flatnonzero(edges == 1)
+        stops = np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            self.close()
+            return
+
+        # Peak per run; the gaps between runs are masked out
+        peaks = np.maximum.reduceat(np.where(mask, value, -np.inf), starts)
+        run_start = starts + row0
+        run_t = t[starts]
+
+        if self.open is not None:
+            if starts[0] == 0:
+                run_start[0], run_t[0] = self.open[0], self.open[1]
+                peaks[0] = max(peaks[0], self.open[2])
+            else:
+                self.close()
+            self.open = None
+
+        if stops[-1] == len(mask):
+            # Still running at the end of the chunk
+            self.open = [run_start[-1], run_t[-1], peaks[-1]]
+            self.last_t = t[-1]
+            run_start, run_t, peaks = run_start[:-1], run_t[:-1], peaks[:-1]
+            stops, last = stops[:-1], t[stops[:-1] - 1]
+        else:
+            last = t[stops - 1]
+        self.runs.append((run_start, stops + row0, run_t, last, peaks))
+        self.next_row = row0 + len(mask)
+
+    def close(self):
+        if self.open is not None:
+            start, t_start, peak = self.open
+            self.runs.append((np.array([start]), np.array([self.next_row]),
+                              np.array([t_start]), np.array([self.last_t]),
+                              np.array([peak])))
+            self.open = None
+
+    def result(self):
+        self.close()
+        if not self.runs:
+            return [np.zeros(0)] * 5
+        return [np.concatenate(column) for column in zip(*self.runs)]
+
+
+class EventDetector:
+    def __init__(self, rate_limit=360.0, pitch_margin=5.0,
+                 norm_tolerance=1e-3, divergence_limit=1.0):
+        self.rate_limit = rate_limit
+        self.pitch_margin = pitch_margin
+        self.norm_tolerance = norm_tolerance
+        self.divergence_limit = divergence_limit
+
+    def test_chunk(self, cols):
+        # {kind: (mask, value)} for one chunk of recording columns
+        tests = {}
+
+        rate = np.degrees(np.linalg.norm(cols['rates'], axis=1))
+        tests['rate'] = (rate > self.rate_limit, rate)
+
+        pitch = np.degrees(np.abs(cols['euler_q'][:, 1]))
+        tests['gimbal'] = (pitch > 90.0 - self.pitch_margin, pitch)
+
+        if 'q_norm' in cols:
+            norm_error = np.abs(cols['q_norm'] - 1.0)
+            tests['norm_drift'] = (norm_error > self.norm_tolerance,
+                                   norm_error)
+
+        divergence = solution_divergence(cols['quat'], cols['euler'])
+        tests['divergence'] = (divergence > self.divergence_limit, divergence)
+        return tests
+
+    def scan(self, reader):
+        # EventIndex for a whole recording, one chunk in memory at a time
+        columns = ['t', 'rates', 'quat', 'euler_q', 'euler']
+        if 'q_norm' in reader.columns:
+            columns.append('q_norm')
+
+        trackers = {kind: RunTracker() for kind in EVENT_KINDS}
+        for row0, cols in reader.iter_chunks(columns):
+            for kind, (mask, value) in self.test_chunk(cols).items():
+                trackers[kind].push(row0, cols['t'], mask, value)
+
+        parts = []
+        for code, kind in enumerate(EVENT_KINDS):
+            start, stop, t_start, t_stop, peak = trackers[kind].result()
+            parts.append((np.full(len(start), code), start, stop,
+                          t_start, t_stop, peak))
+        return EventIndex(*(np.concatenate(column) for column in zip(*parts)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Find rate, gimbal lock, norm drift and divergence "
+                    "events in a recording")
+    parser.add_argument('path', help="Recording directory")
+    parser.add_argument('--rate-limit', type=float, default=360.0,
+                        help="Body rate magnitude threshold (deg/s)")
+    parser.add_argument('--pitch-margin', type=float, default=5.0,
+                        help="Flag pitch within this many degrees of 90")
+    parser.add_argument('--norm-tolerance', type=float, default=1e-3,
+                        help="Allowed quaternion norm error before "
+                             "normalising")
+    parser.add_argument('--divergence-limit', type=float, default=1.0,
+                        help="Allowed Euler vs quaternion solution "
+                             "difference (deg)")
+    parser.add_argument('--list', type=int, default=20, metavar='N',
+                        help="Print the first N events")
+    parser.add_argument('--save', metavar='FILE',
+                        help="Save the event index to an .npz file")
+    args = parser.parse_args()
+
+    from .recorder import RecordingReader
+
+    reader = RecordingReader(args.path)
+    detector = EventDetector(args.rate_limit, args.pitch_margin,
+                             args.norm_tolerance, args.divergence_limit)
+    t0 = time.perf_counter()
+    index = detector.scan(reader)
+    print("Scanned {} rows in {:.2f} s: {}".format(
+        len(reader), time.perf_counter() - t0, ", ".join(
+            "{} {}".format(n, kind) for kind, n in index.counts().items())))
+
+    for i in range(min(args.list, len(index))):
+        print("  {kind:<10} rows {start}-{stop}  t {t_start:.3f}-{t_stop:.3f} s"
+              "  peak {peak:.4g}".format(**index[i]))
+
+    if args.save:
+        index.save(args.save)
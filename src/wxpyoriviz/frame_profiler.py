@@ -0,0 +1,165 @@
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+
+class RollingStats:
+    # Fixed size ring of the most recent samples
+
+    def __init__(self, window=600):
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.index = 0
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+
+    def percentiles(self, pcts=(50, 99)):
+        if self.count == 0:
+            return [0.0] * len(pcts)
+        return list(np.percentile(self.samples[:self.count], pcts))
+
+    def reset(self):
+        self.count = 0
+        self.index = 0
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Stage:
+    # One reusable timer per stage name, so timing a stage does not allocate.
+    # Stages with the same name must not nest.
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.stats = RollingStats(profiler.window)
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        self.stats.add(t1 - self.t0)
+        if self.profiler.trace is not None:
+            self.profiler.trace.append((self.name, self.t0, t1))
+        return False
+
+
+class FrameProfiler:
+    # Hot path stage timers. When disabled, stage() hands back a shared no-op
+    # context manager, so the instrumented code pays one method call.
+
+    NULL_STAGE = _NullStage()
+
+    def __init__(self, enabled=False, window=600, frame_budget=1 / 60,
+                 trace_len=None):
+        self.enabled = enabled
+        self.window = window
+        self.frame_budget = frame_budget
+        self.stages = {}
+        self.frame_stats = RollingStats(window)
+        self.last_frame_start = None
+        self.frames = 0
+        self.dropped_frames = 0
+        # Frame intervals and drops only mean something while a timer is
+        # driving the frames; pauses and on demand redraws are not drops
+        self.paced = False
+
+        # Optional bounded list of (name, start, end) for trace export
+        self.trace = deque(maxlen=trace_len) if trace_len else None
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.last_frame_start = None
+
+    def set_paced(self, paced):
+        self.paced = paced
+        self.last_frame_start = None
+
+    def stage(self, name):
+        if not self.enabled:
+            return self.NULL_STAGE
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _Stage(self, name)
+        return stage
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+
+        self.frames += 1
+        if not self.paced:
+            return
+
+        now = time.perf_counter()
+        if self.last_frame_start is not None:
+            interval = now - self.last_frame_start
+            self.frame_stats.add(interval)
+            # Every whole budget missed is a frame that was never shown
+            missed = int(interval / self.frame_budget + 0.5) - 1
+            if missed > 0:
+                self.dropped_frames += missed
+        self.last_frame_start = now
+
+    def wrap_swap(self, canvas):
+        # The buffer swap happens inside the vispy backend after on_draw, so
+        # time it by wrapping the backend's swap call
+        backend = getattr(canvas, '_backend', None)
+        swap = getattr(backend, '_vispy_swap_buffers', None)
+        if swap is None:
+            return
+
+        def timed_swap(*args, **kwargs):
+            with self.stage('swap'):
+                return swap(*args, **kwargs)
+
+        backend._vispy_swap_buffers = timed_swap
+
+    def summary(self):
+        # {name: (p50, p99)} in milliseconds, plus the frame interval
+        out = {}
+        for name, stage in self.stages.items():
+            out[name] = tuple(1e3 * p for p in stage.stats.percentiles())
+        out['frame'] = tuple(1e3 * p for p in self.frame_stats.percentiles())
+        return out
+
+    def format_summary(self):
+        lines = ["{:<14}{:>8}{:>8}".format("stage (ms)", "p50", "p99")]
+        for name, (p50, p99) in sorted(self.summary().items()):
+            lines.append("{:<14}{:>8.2f}{:>8.2f}".format(name, p50, p99))
+        lines.append("dropped frames {}".format(self.dropped_frames))
+        return "\n".join(lines)
+
+    def reset(self):
+        for stage in self.stages.values():
+            stage.stats.reset()
+        self.frame_stats.reset()
+        self.last_frame_start = None
+        self.frames = 0
+        self.dropped_frames = 0
+        if self.trace is not None:
+            self.trace.clear()
+
+    def export_trace(self, filename):
+        # Chrome trace event format, opens in chrome://tracing or Perfetto
+        events = []
+        for name, t0, t1 in (self.trace or ()):
+            events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                           'ts': 1e6 * t0, 'dur': 1e6 * (t1 - t0)})
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
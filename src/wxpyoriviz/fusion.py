@@ -0,0 +1,425 @@
+import argparse
+import itertools
+
+import numpy as np
+
+from . import attitude_math as amath
+from .orientation import quat_to_display_ypr
+
+
+# Batched accelerometer (and optionally magnetometer) aided attitude
+# filters for parameter sweeps. K filter configurations run side by side
+# over the same IMU log as a (K, 4) quaternion state, so every update is a
+# handful of array operations whatever K is.
+#
+# Conventions follow GenRatesData: quaternions are [w, x, y, z], body
+# rates are in rad/s and propagate as q <- q * exp(omega * dt). The world
+# frame has Z up, so a level accelerometer at rest reads (0, 0, 1) after
+# normalisation.
+METHODS = ('mahony', 'madgwick', 'complementary')
+
+# Gains per method. Mahony: proportional kp and bias integral ki (1/s).
+# Madgwick: gradient step beta (rad/s) and gyro bias gain zeta.
+# Complementary: fraction alpha of the tilt (and heading) error removed
+# each step.
+PARAM_DEFAULTS = {
+    'mahony': {'kp': 1.0, 'ki': 0.0},
+    'madgwick': {'beta': 0.1, 'zeta': 0.0},
+    'complementary': {'alpha': 0.02},
+}
+
+GRAVITY_WORLD = np.array([0.0, 0.0, 1.0])
+# Unit field pointing north and down, 60 degrees inclination
+MAG_WORLD = np.array([0.5, 0.0, -np.sqrt(3.0) / 2.0])
+
+
+class ImuLog:
+    # Timestamps (N,), gyro rates (N, 3) rad/s, accelerometer (N, 3) and
+    # optional magnetometer (N, 3) samples, any units. Sample i's gyro rate
+    # applies from t[i - 1] to t[i].
+
+    def __init__(self, t, gyro, accel, mag=None):
+        self.t = np.asarray(t, dtype=np.float64)
+        self.gyro = np.asarray(gyro, dtype=np.float64)
+        self.accel = normalise_rows(accel)
+        self.mag = None if mag is None else normalise_rows(mag)
+
+    def __len__(self):
+        return len(self.t)
+
+    def save(self, path, reference=None):
+        arrays = {'t': self.t, 'gyro': self.gyro, 'accel': self.accel}
+        if self.mag is not None:
+            arrays['mag'] = self.mag
+        if reference is not None:
+            arrays['reference'] = reference
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        # Returns (log, reference quaternions or None)
+        with np.load(path) as npz:
+            log = cls(npz['t'], npz['gyro'], npz['accel'],
+                      npz['mag'] if 'mag' in npz else None)
+            reference = npz['reference'] if 'reference' in npz else None
+        return log, reference
+
+
+def normalise_rows(vecs):
+    vecs = np.asarray(vecs, dtype=np.float64)
+    return vecs / np.linalg.norm(vecs, axis=-1, keepdims=True)
+
+
+def rotate_to_body(quats, vec_world):
+    # World vector seen in the body frame, q^-1 * v * q, for (..., 4) quats
+    v = np.concatenate([[0.0], vec_world])
+    conj = quats * np.array([1.0, -1.0, -1.0, -1.0])
+    return amath.QuaternionMultiply(
+        amath.QuaternionMultiply(conj, v), quats)[..., 1:]
+
+
+def synthetic_log(rates, dt, q0=(1.0, 0.0, 0.0, 0.0), gyro_bias=(0.0, 0.0, 0.0),
+                  gyro_noise=0.0, accel_noise=0.0, mag_noise=0.0, seed=0):
+    # IMU log and exact reference attitudes for (N, 3) body rates in rad/s.
+    # Noise levels are standard deviations (rad/s, and fractions of the
+    # unit accelerometer and magnetometer readings).
+    rng = np.random.default_rng(seed)
+    rates = np.asarray(rates, dtype=np.float64)
+    n = len(rates)
+
+    reference = np.empty((n, 4))
+    q = np.asarray(q0, dtype=np.float64)
+    for i, dq in enumerate(amath.QuaternionFromRotationVector(rates * dt)):
+        q = amath.QuaternionNormalise(amath.QuaternionMultiply(q, dq))
+        reference[i] = q
+
+    gyro = rates + np.asarray(gyro_bias) + gyro_noise * rng.standard_normal((n, 3))
+    accel = rotate_to_body(reference, GRAVITY_WORLD) \
+        + accel_noise * rng.standard_normal((n, 3))
+    mag = rotate_to_body(reference, MAG_WORLD) \
+        + mag_noise * rng.standard_normal((n, 3))
+    return ImuLog(dt * np.arange(1, n + 1), gyro, accel, mag), reference
+
+
+def param_grid(method, **values):
+    # Cartesian product of per parameter value lists, as (K,) arrays.
+    # Parameters left out take their default.
+    names = list(PARAM_DEFAULTS[method])
+    for name in values:
+        if name not in names:
+            raise ValueError("{} has no parameter '{}'".format(method, name))
+    axes = [np.atleast_1d(values.get(name, PARAM_DEFAULTS[method][name]))
+            for name in names]
+    combos = np.array(list(itertools.product(*axes)), dtype=np.float64)
+    return {name: combos[:, i] for i, name in enumerate(names)}
+
+
+def angle_error_rad(q_ref, quats):
+    # Rotation angle between q_ref (4,) and each of (K, 4) quats, via the
+    # vector part of the relative rotation so small angles stay accurate
+    q_rel = amath.QuaternionMultiply(q_ref * np.array([1.0, -1.0, -1.0, -1.0]),
+                                     quats)
+    sin_half = np.linalg.norm(q_rel[..., 1:], axis=-1)
+    return 2.0 * np.arcsin(np.clip(sin_half, 0.0, 1.0))
+
+
+class FusionBatch:
+    def __init__(self, method, **params):
+        if method not in METHODS:
+            raise ValueError("Unknown method '{}'".format(method))
+        self.method = method
+
+        defaults = PARAM_DEFAULTS[method]
+        for name in params:
+            if name not in defaults:
+                raise ValueError("{} has no parameter '{}'".format(
+                    method, name))
+        arrays = np.broadcast_arrays(*[
+            np.atleast_1d(np.asarray(params.get(name, default), dtype=np.float64))
+            for name, default in defaults.items()])
+        self.params = dict(zip(defaults, arrays))
+        self.k = len(arrays[0])
+        self.reset()
+
+    def reset(self, q0=(1.0, 0.0, 0.0, 0.0)):
+        self.q = np.tile(np.asarray(q0, dtype=np.float64), (self.k, 1))
+        self.bias = np.zeros((self.k, 3))
+
+    def config(self, k):
+        return {name: float(values[k]) for name, values in self.params.items()}
+
+    def step(self, gyro, accel, mag, dt):
+        getattr(self, 'step_' + self.method)(gyro, accel, mag, dt)
+
+    def propagate(self, rates, dt):
+        # rates is (K, 3), one body rate per configuration
+        dq = amath.QuaternionFromRotationVector(rates * dt)
+        self.q = amath.QuaternionMultiply(self.q, dq)
+
+    def normalise(self):
+        self.q /= np.linalg.norm(self.q, axis=1, keepdims=True)
+
+    def estimated_directions(self, mag):
+        # Gravity and (if mag is given) field directions predicted in the
+        # body frame, the field reference taken from the measurement's own
+        # horizontal and vertical parts so declination does not matter
+        q0, q1, q2, q3 = self.q.T
+        v = np.stack([2.0 * (q1 * q3 - q0 * q2),
+                      2.0 * (q0 * q1 + q2 * q3),
+                      q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3], axis=1)
+        if mag is None:
+            return v, None, None
+
+        h = amath.QuaternionMultiply(
+            amath.QuaternionMultiply(self.q, np.concatenate([[0.0], mag])),
+            self.q * np.array([1.0, -1.0, -1.0, -1.0]))[:, 1:]
+        bx = np.hypot(h[:, 0], h[:, 1])
+        bz = h[:, 2]
+        w = np.stack([
+            2.0 * bx * (0.5 - q2 * q2 - q3 * q3) + 2.0 * bz * (q1 * q3 - q0 * q2),
+            2.0 * bx * (q1 * q2 - q0 * q3) + 2.0 * bz * (q0 * q1 + q2 * q3),
+            2.0 * bx * (q0 * q2 + q1 * q3) + 2.0 * bz * (0.5 - q1 * q1 - q2 * q2),
+        ], axis=1)
+        return v, w, (bx, bz)
+
+    def step_mahony(self, gyro, accel, mag, dt):
+        v, w, _ = self.estimated_directions(mag)
+        error = np.cross(accel, v)
+        if mag is not None:
+            error += np.cross(mag, w)
+
+        self.bias += self.params['ki'][:, np.newaxis] * error * dt
+        rates = gyro + self.params['kp'][:, np.newaxis] * error + self.bias
+        self.propagate(rates, dt)
+        self.normalise()
+
+    def step_madgwick(self, gyro, accel, mag, dt):
+        v, w, b = self.estimated_directions(mag)
+        q0, q1, q2, q3 = self.q.T
+
+        # Gradient of the measurement mismatch, J^T f
+        f = v - accel
+        grad = 2.0 * (f[:, 0:1] * np.stack([-q2, q3, -q0, q1], axis=1)
+                      + f[:, 1:2] * np.stack([q1, q0, q3, q2], axis=1)
+                      + f[:, 2:3] * np.stack([0.0 * q0, -2.0 * q1, -2.0 * q2,
+                                              0.0 * q0], axis=1))
+        if mag is not None:
+            bx, bz = b
+            f = w - mag
+            grad += f[:, 0:1] * np.stack([
+                -2.0 * bz * q2, 2.0 * bz * q3,
+                -4.0 * bx * q2 - 2.0 * bz * q0, -4.0 * bx * q3 + 2.0 * bz * q1],
+                axis=1)
+            grad += f[:, 1:2] * np.stack([
+                -2.0 * bx * q3 + 2.0 * bz * q1, 2.0 * bx * q2 + 2.0 * bz * q0,
+                2.0 * bx * q1 + 2.0 * bz * q3, -2.0 * bx * q0 + 2.0 * bz * q2],
+                axis=1)
+            grad += f[:, 2:3] * np.stack([
+                2.0 * bx * q2, 2.0 * bx * q3 - 4.0 * bz * q1,
+                2.0 * bx * q0 - 4.0 * bz * q2, 2.0 * bx * q1], axis=1)
+
+        norm = np.linalg.norm(grad, axis=1, keepdims=True)
+        grad = grad / np.where(norm > 0.0, norm, 1.0)
+
+        # Gyro bias from the rate error the gradient step implies
+        rate_error = 2.0 * amath.QuaternionMultiply(
+            self.q * np.array([1.0, -1.0, -1.0, -1.0]), grad)[:, 1:]
+        self.bias += self.params['zeta'][:, np.newaxis] * rate_error * dt
+
+        self.propagate(gyro - self.bias, dt)
+        self.q -= self.params['beta'][:, np.newaxis] * grad * dt
+        self.normalise()
+
+    def step_complementary(self, gyro, accel, mag, dt):
+        self.propagate(np.broadcast_to(gyro, (self.k, 3)), dt)
+        self.normalise()
+
+        # Rotate a fraction alpha of the way from the predicted gravity
+        # direction to the measured one
+        v, w, _ = self.estimated_directions(mag)
+        axis = np.cross(accel, v)
+        sin_err = np.linalg.norm(axis, axis=1, keepdims=True)
+        angle = np.arctan2(sin_err, np.sum(accel * v, axis=1, keepdims=True))
+        correction = axis * (angle / np.where(sin_err > 0.0, sin_err, 1.0))
+
+        if mag is not None:
+            # Heading only: the part of the field error about the vertical
+            up = v / np.linalg.norm(v, axis=1, keepdims=True)
+            heading = np.sum(np.cross(mag, w) * up, axis=1, keepdims=True)
+            correction += heading * up
+
+        alpha = self.params['alpha'][:, np.newaxis]
+        self.propagate(alpha * correction, 1.0)
+        self.normalise()
+
+    def run(self, log, reference=None, settle=0.0, keep=None):
+        # Runs the whole log. With reference (N, 4) quaternions, returns per
+        # configuration error statistics in degrees, ignoring samples before
+        # t[0] + settle. keep is a configuration index whose trajectory is
+        # returned as (N, 4) as well.
+        if reference is not None:
+            self.reset(reference[0])
+        else:
+            self.reset()
+
+        n = len(log)
+        dts = np.diff(log.t, prepend=2.0 * log.t[0] - log.t[1])
+        t_settled = log.t[0] + settle
+        sum_sq = np.zeros(self.k)
+        max_err = np.zeros(self.k)
+        n_scored = 0
+        trajectory = np.empty((n, 4)) if keep is not None else None
+
+        for i in range(n):
+            mag = None if log.mag is None else log.mag[i]
+            self.step(log.gyro[i], log.accel[i], mag, dts[i])
+
+            if trajectory is not None:
+                trajectory[i] = self.q[keep]
+            if reference is not None and log.t[i] >= t_settled:
+                err = angle_error_rad(reference[i], self.q)
+                sum_sq += err * err
+                np.maximum(max_err, err, out=max_err)
+                n_scored += 1
+
+        stats = None
+        if reference is not None:
+            stats = {
+                'rms_deg': np.degrees(np.sqrt(sum_sq / max(n_scored, 1))),
+                'max_deg': np.degrees(max_err),
+                'final_deg': np.degrees(angle_error_rad(reference[-1], self.q)),
+            }
+        return stats, trajectory
+
+
+def rank(batch, stats, key='rms_deg'):
+    # Configurations ordered best first, as (index, config, error) tuples
+    order = np.argsort(stats[key], kind='stable')
+    return [(int(k), batch.config(k), float(stats[key][k])) for k in order]
+
+
+def sweep(log, reference, method, settle=0.0, **values):
+    # Runs every combination of the given parameter values and returns the
+    # ranking plus the best configuration's trajectory
+    batch = FusionBatch(method, **param_grid(method, **values))
+    stats, _ = batch.run(log, reference, settle)
+    ranking = rank(batch, stats)
+
+    best = FusionBatch(method, **ranking[0][1])
+    _, trajectory = best.run(log, reference, keep=0)
+    return ranking, trajectory
+
+
+class FusionReplay:
+    # Plays a fused trajectory back through the GenRatesData interface, one
+    # sample per iterate_data, so ChevronCanvas can show a sweep's result
+
+    def __init__(self, t, quats):
+        self.t_samples = np.asarray(t, dtype=np.float64)
+        self.quats = np.asarray(quats, dtype=np.float64)
+        self.dt = float(np.mean(np.diff(self.t_samples))) \
+            if len(self.t_samples) > 1 else 1 / 60
+        self.dtype = self.quats.dtype
+        self.recorder = None
+        self.reset_data()
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz['t'], npz['quat'])
+
+    def save(self, path):
+        np.savez(path, t=self.t_samples, quat=self.quats)
+
+    def reset_data(self):
+        self.index = 0
+        self.t = 0.0
+        self.time = []
+        self.attitude_q = self.quats[0]
+        self.omega_body = np.zeros(3)
+        self.dcm = amath.QuatToDCM(self.attitude_q)
+
+    def iterate_data(self, dt=None):
+        # Holds the last sample once the trajectory has played out
+        if self.index >= len(self.quats):
+            return
+
+        self.t = float(self.t_samples[self.index])
+        self.attitude_q = self.quats[self.index]
+        self.dcm = amath.QuatToDCM(self.attitude_q)
+        self.time = [self.t]
+        self.index += 1
+
+        if self.recorder is not None:
+            self.attitude_q_euler = amath.EulerXYZfromQuaternion(
+                self.attitude_q)
+            self.attitude_euler = self.attitude_q_euler
+            self.recorder.record(self)
+
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+
+    def set_body_rates(self, rates_tpl):
+        pass    # Replayed, not integrated
+
+    def get_latest_ypr(self):
+        return quat_to_display_ypr(self.attitude_q)
+
+    def get_dcm(self):
+        return self.dcm
+
+
+def parse_values(text):
+    return [float(v) for v in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Sweep attitude filter gains over an IMU log")
+    parser.add_argument('log', nargs='?',
+                        help=".npz with t, gyro, accel, optional mag and "
+                             "reference quaternions (default: synthetic)")
+    parser.add_argument('--method', choices=METHODS, default='mahony')
+    parser.add_argument('--param', action='append', default=[],
+                        metavar='NAME=V1,V2,...',
+                        help="Values to sweep for one parameter")
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help="Seconds ignored while the filters converge")
+    parser.add_argument('--no-mag', action='store_true',
+                        help="Ignore the magnetometer")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--save-best', metavar='FILE',
+                        help="Save the best trajectory for wxpyoriviz --replay")
+    args = parser.parse_args()
+
+    if args.log is None:
+        # Coning manoeuvre with a gyro bias, so the aiding has work to do
+        dt = 1 / 200
+        t = dt * np.arange(12000)
+        rates = np.stack([0.5 * np.sin(0.7 * t), 0.4 * np.cos(0.5 * t),
+                          0.3 + 0.0 * t], axis=1)
+        log, reference = synthetic_log(rates, dt, gyro_bias=(0.02, -0.01, 0.015),
+                                       gyro_noise=0.01, accel_noise=0.02,
+                                       mag_noise=0.02)
+    else:
+        log, reference = ImuLog.load(args.log)
+        if reference is None:
+            parser.error("The log has no reference quaternions to rank by")
+    if args.no_mag:
+        log.mag = None
+
+    values = {}
+    for item in args.param:
+        name, _, text = item.partition('=')
+        values[name] = parse_values(text)
+
+    ranking, trajectory = sweep(log, reference, args.method, args.settle,
+                                **values)
+    print("{} configurations, best first (RMS error after {:g} s):".format(
+        len(ranking), args.settle))
+    for k, config, error in ranking[:args.top]:
+        print("  {:>8.4f} deg  {}".format(error, ", ".join(
+            "{}={:g}".format(name, value) for name, value in config.items())))
+
+    if args.save_best:
+        FusionReplay(log.t, trajectory).save(args.save_best)
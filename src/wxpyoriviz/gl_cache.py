@@ -0,0 +1,81 @@
+import hashlib
+import weakref
+
+import numpy as np
+from vispy import gloo
+
+
+# Compiled programs and uploaded vertex buffers, shared by everything that
+# draws into the same GL context or into contexts that share objects
+# (canvases created with vispy's shared= argument). Programs are keyed by
+# their shader source and buffers by their contents, so identical shaders
+# are compiled once and identical geometry is uploaded once.
+#
+# A shared program keeps only the uniforms and attributes set last, so
+# users set theirs right before each draw instead of once up front.
+
+
+class GLResourceCache:
+    def __init__(self):
+        self.programs = {}
+        self.buffers = {}
+        self.uploaded = {}
+        self.hits = 0
+        self.misses = 0
+
+    def program(self, vert, frag):
+        key = (vert, frag)
+        program = self.programs.get(key)
+        if program is None:
+            self.misses += 1
+            program = gloo.Program(vert, frag)
+            self.programs[key] = program
+        else:
+            self.hits += 1
+        return program
+
+    def vertex_buffer(self, data):
+        data = np.ascontiguousarray(data)
+        key = (data.dtype.str, data.shape,
+               hashlib.sha1(data.tobytes()).hexdigest())
+        vbo = self.buffers.get(key)
+        if vbo is None:
+            self.misses += 1
+            vbo = gloo.VertexBuffer(data)
+            self.buffers[key] = vbo
+        else:
+            self.hits += 1
+        return vbo
+
+    def needs_upload(self, program, slot, key):
+        # Tracks what was last set on a shared program, so unchanged values
+        # (e.g. a camera's cached matrices) are not sent again
+        state = self.uploaded.setdefault(id(program), {})
+        if state.get(slot) == key:
+            return False
+        state[slot] = key
+        return True
+
+    def stats(self):
+        return {'programs': len(self.programs), 'buffers': len(self.buffers),
+                'hits': self.hits, 'misses': self.misses}
+
+
+# One cache per set of sharing contexts. Objects created without a current
+# canvas (e.g. for allocation measurements) go in a cache of their own.
+caches = weakref.WeakKeyDictionary()
+no_context_cache = GLResourceCache()
+
+
+def get_cache(context=None):
+    if context is None:
+        canvas = gloo.get_current_canvas()
+        if canvas is None:
+            return no_context_cache
+        context = canvas.context
+
+    shared = context.shared
+    cache = caches.get(shared)
+    if cache is None:
+        cache = caches[shared] = GLResourceCache()
+    return cache
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class ConingIntegrator:
+    # High rate gyro front end. Raw rate samples are turned into angle
+    # increments and accumulated into one rotation vector per output
+    # interval, with a coning correction for the non-commutativity of the
+    # rotation inside the interval. The attitude is then updated once per
+    # interval instead of once per raw sample.
+    #
+    # Rates are in rad/s, in the same X, Y, Z convention as
+    # GenRatesData.omega_body. Coning options:
+    #   'none'       - plain sum of increments (mean rate over the interval)
+    #   'two_sample' - classic two-sample correction 2/3 (d1 x d2) on each
+    #                  pair of samples, pairs combined with 1/2 (alpha x phi)
+    #   'recursive'  - Bortz recursion 1/2 (alpha + d_prev / 6) x d, for any
+    #                  number of samples per interval
+
+    CONING_MODES = ('none', 'two_sample', 'recursive')
+
+    def __init__(self, sample_dt, samples_per_update, coning='two_sample'):
+        if coning not in self.CONING_MODES:
+            raise ValueError("Unknown coning mode '{}'".format(coning))
+        if coning == 'two_sample' and samples_per_update % 2:
+            raise ValueError("Two-sample coning needs an even number of "
+                             "samples per update")
+
+        self.sample_dt = sample_dt
+        self.samples_per_update = samples_per_update
+        self.update_dt = sample_dt * samples_per_update
+        self.coning = coning
+        self.reset()
+
+    def reset(self):
+        self.pending = np.empty((0, 3))
+        self.last_increment = np.zeros(3)
+
+    def push(self, rates):
+        # Takes an (N, 3) block of raw samples, returns the (K, 3) rotation
+        # vectors of the intervals it completed. Leftover samples are kept
+        # for the next call.
+        rates = np.asarray(rates, dtype=float).reshape(-1, 3)
+        if len(self.pending):
+            rates = np.concatenate([self.pending, rates])
+
+        m = self.samples_per_update
+        k = len(rates) // m
+        self.pending = rates[k * m:].copy()
+        if k == 0:
+            return np.empty((0, 3))
+
+        increments = (rates[:k * m] * self.sample_dt).reshape(k, m, 3)
+        rot_vecs = self.rotation_vectors(increments)
+        self.last_increment = increments[-1, -1].copy()
+        return rot_vecs
+
+    def rotation_vectors(self, increments):
+        if self.coning == 'none':
+            return increments.sum(axis=1)
+
+        if self.coning == 'two_sample':
+            first = increments[:, 0::2]
+            second = increments[:, 1::2]
+            sub = first + second + (2.0 / 3.0) * np.cross(first, second)
+        else:
+            # Previous increment, carried across interval and call boundaries
+            flat = increments.reshape(-1, 3)
+            prev = np.concatenate([self.last_increment[np.newaxis], flat[:-1]])
+            prev = prev.reshape(increments.shape)
+            sub = increments
+
+        # Sum of the sub-interval vectors before each one
+        alpha = np.cumsum(sub, axis=1) - sub
+
+        if self.coning == 'two_sample':
+            beta = 0.5 * np.cross(alpha, sub).sum(axis=1)
+        else:
+            beta = 0.5 * np.cross(alpha + prev / 6.0, sub).sum(axis=1)
+
+        return sub.sum(axis=1) + beta
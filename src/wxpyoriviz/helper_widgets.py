@@ -1,5 +1,7 @@
 import wx
 
+from .events import EVENT_KINDS
+
 
 class QuatDisplay(wx.Panel):
     def __init__(self, parent, id):
@@ -148,6 +150,22 @@ class RateSliders(wx.Panel):
 
         self.set_rates()
 
+    def set_values(self, rates_tpl):
+        # Moves the controls to the given rates (deg/s) and applies them
+        for rate, txt, slider, btn_plus, btn_minus in (
+                (rates_tpl[0], self.txt_x, self.slider_x,
+                 self.btn_plus_x, self.btn_minus_x),
+                (rates_tpl[1], self.txt_y, self.slider_y,
+                 self.btn_plus_y, self.btn_minus_y),
+                (rates_tpl[2], self.txt_z, self.slider_z,
+                 self.btn_plus_z, self.btn_minus_z)):
+            txt.SetValue("{:.1f}".format(rate))
+            slider.SetValue(int(abs(rate)))
+            btn_plus.SetValue(rate >= 0.0)
+            btn_minus.SetValue(rate < 0.0)
+
+        self.set_rates()
+
     def set_rates(self):
         # Set based on values in TextCtrls
         rates_tpl = (float(self.txt_x.GetValue()),
@@ -226,3 +244,117 @@ class RateSliders(wx.Panel):
                 new_val = float(self.txt_z.GetValue()) * -1.0
                 self.txt_z.SetValue("{:.2f}".format(new_val))
                 self.set_rates()
+
+
+class PlaybackControl(wx.Panel):
+    RATES = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 90.0, 100.0)
+
+    def __init__(self, parent, id, rate_callback):
+        wx.Panel.__init__(self, parent, id)
+
+        self.rate_callback = rate_callback
+
+        self.lbl_rate = wx.StaticText(self, -1, "Rate")
+        self.ch_rate = wx.Choice(
+            self, wx.ID_ANY, choices=["{:g}x".format(r) for r in self.RATES])
+        self.ch_rate.SetSelection(self.RATES.index(1.0))
+
+        self.Bind(wx.EVT_CHOICE, self.on_rate_choice, self.ch_rate)
+
+        self.m_sizer = wx.StaticBoxSizer(wx.HORIZONTAL, self, "Playback")
+        self.m_sizer.Add(self.lbl_rate, 0, wx.CENTER | wx.ALL, 2)
+        self.m_sizer.Add(self.ch_rate, 0, wx.CENTER | wx.ALL, 2)
+
+        self.SetSizerAndFit(self.m_sizer)
+
+    def get_rate(self):
+        return self.RATES[self.ch_rate.GetSelection()]
+
+    def on_rate_choice(self, event):
+        self.rate_callback(self.get_rate())
+
+
+class EventBrowser(wx.Panel):
+    # Lists the events of an events.EventIndex and jumps to them. Prev and
+    # Next step from the row currently shown, so they work while playing.
+    # With a range_index.RangeIndex the event's statistics are shown too.
+    MAX_LISTED = 500
+
+    def __init__(self, parent, id, index, jump_callback, row_callback,
+                 range_index=None):
+        wx.Panel.__init__(self, parent, id)
+
+        self.index = index
+        self.range_index = range_index
+        self.jump_callback = jump_callback
+        self.row_callback = row_callback
+        self.listed = []
+
+        counts = index.counts()
+        self.ch_kind = wx.Choice(
+            self, wx.ID_ANY,
+            choices=["All ({})".format(len(index))]
+            + ["{} ({})".format(kind, counts[kind]) for kind in EVENT_KINDS])
+        self.ch_kind.SetSelection(0)
+        self.ch_event = wx.Choice(self, wx.ID_ANY, size=(260, -1))
+        self.btn_prev = wx.Button(self, -1, "< Prev")
+        self.btn_next = wx.Button(self, -1, "Next >")
+        self.lbl_stats = wx.StaticText(self, -1, "", size=(420, -1))
+
+        self.Bind(wx.EVT_CHOICE, self.on_kind_choice, self.ch_kind)
+        self.Bind(wx.EVT_CHOICE, self.on_event_choice, self.ch_event)
+        self.Bind(wx.EVT_BUTTON, self.on_btn_prev, self.btn_prev)
+        self.Bind(wx.EVT_BUTTON, self.on_btn_next, self.btn_next)
+
+        self.m_sizer = wx.StaticBoxSizer(wx.HORIZONTAL, self, "Events")
+        self.m_sizer.Add(self.ch_kind, 0, wx.CENTER | wx.ALL, 2)
+        self.m_sizer.Add(self.ch_event, 0, wx.CENTER | wx.ALL, 2)
+        self.m_sizer.Add(self.btn_prev, 0, wx.CENTER | wx.ALL, 2)
+        self.m_sizer.Add(self.btn_next, 0, wx.CENTER | wx.ALL, 2)
+        self.m_sizer.Add(self.lbl_stats, 0, wx.CENTER | wx.ALL, 2)
+
+        self.fill_events()
+        self.SetSizerAndFit(self.m_sizer)
+
+    def get_kind(self):
+        selection = self.ch_kind.GetSelection()
+        return None if selection == 0 else EVENT_KINDS[selection - 1]
+
+    def fill_events(self):
+        # Only the first MAX_LISTED go in the list, Prev/Next reach the rest
+        self.listed = self.index.kind_mask(self.get_kind()).nonzero()[0][
+            :self.MAX_LISTED]
+        self.ch_event.SetItems([
+            "{kind} {t_start:.2f}-{t_stop:.2f} s, peak {peak:.3g}".format(
+                **self.index[i]) for i in self.listed])
+
+    def jump(self, i):
+        if i is None:
+            return
+        self.jump_callback(int(self.index.start[i]))
+        if self.range_index is not None:
+            self.show_stats(self.index.start[i], self.index.stop[i])
+        listed = self.listed.searchsorted(i)
+        if listed < len(self.listed) and self.listed[listed] == i:
+            self.ch_event.SetSelection(int(listed))
+
+    def show_stats(self, start, stop):
+        stats = self.range_index.query_rows(start, stop)
+        self.lbl_stats.SetLabel(
+            "pitch {:.1f} to {:.1f} deg, yaw rate mean {:.1f} deg/s, "
+            "Euler error rms {:.3f} deg".format(
+                stats['pitch']['min'], stats['pitch']['max'],
+                stats['yaw_rate']['mean'], stats['euler_error']['rms']))
+
+    def on_kind_choice(self, event):
+        self.fill_events()
+
+    def on_event_choice(self, event):
+        self.jump(self.listed[self.ch_event.GetSelection()])
+
+    def on_btn_prev(self, event):
+        self.jump(self.index.previous_before(self.row_callback(),
+                                             self.get_kind()))
+
+    def on_btn_next(self, event):
+        self.jump(self.index.next_after(self.row_callback(), self.get_kind()))
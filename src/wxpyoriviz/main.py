@@ -0,0 +1,196 @@
+import argparse
+import importlib.util
+import os
+import time
+
+import numpy as np
+
+from .frame_profiler import FrameProfiler
+from .orientation import GenRatesData
+
+
+# Start of the --startup-time measurement: when this module has been
+# imported, before wx, vispy and the canvases are. Interpreter start up
+# comes before it and is not included.
+STARTUP_T0 = time.perf_counter()
+
+# Same as chevron_viz.CAMERA_LAYOUTS, kept here so parsing the arguments
+# does not import vispy
+CAMERA_LAYOUTS = ('single', 'quad')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='wxpyoriviz')
+    parser.add_argument('--stream', choices=('udp', 'tcp'),
+                        help="Feed body rates from a live rate stream")
+    parser.add_argument('--stream-host', default='127.0.0.1')
+    parser.add_argument('--stream-port', type=int, default=5005)
+    parser.add_argument('--jitter-delay', type=float, default=0.05,
+                        help="Jitter buffer delay in seconds")
+    parser.add_argument('--publish', metavar='NAME',
+                        help="Publish state on a shared memory ring")
+    parser.add_argument('--serve', metavar='PORT', type=int,
+                        help="Serve binary state frames over TCP")
+    parser.add_argument('--serve-unix', metavar='PATH',
+                        help="Serve binary state frames on a Unix socket")
+    parser.add_argument('--attach', metavar='NAME',
+                        help="View the state published by another process")
+    parser.add_argument('--no-smoothing', action='store_true',
+                        help="Show raw simulation states, no interpolation")
+    parser.add_argument('--float32', action='store_true',
+                        help="Integrate, record and draw in float32")
+    parser.add_argument('--math-backend', choices=('auto', 'numpy', 'numba'),
+                        default='numpy',
+                        help="Kernels used for the integration, numba needs "
+                             "the jit extra")
+    parser.add_argument('--record', metavar='DIR',
+                        help="Record the trajectory to a chunked recording")
+    parser.add_argument('--record-quat-bits', type=int, choices=(32, 48),
+                        help="Compact recording: smallest-three compressed "
+                             "quaternions, delta coded timestamps and "
+                             "float32 rates and angles")
+    parser.add_argument('--profile', action='store_true',
+                        help="Start with the stage profiler enabled")
+    parser.add_argument('--profile-trace', metavar='FILE',
+                        help="Write a Chrome trace of the stage timings on quit")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="Play back a trajectory saved by fusion.py "
+                             "--save-best, or a --record directory")
+    parser.add_argument('--events', metavar='INDEX', nargs='?', const='',
+                        help="Browse the events of a replayed recording, "
+                             "from a saved events.py index or scanned at "
+                             "startup")
+    parser.add_argument('--mount', metavar='FILE',
+                        help="Show the source in another IMU's frame, "
+                             "with an alignment saved by mount_align.py")
+    parser.add_argument('--rate-profile', metavar='FILE',
+                        help="Drive the rates from a JSON rate profile, the "
+                             "sliders then add an offset")
+    parser.add_argument('--sdf-gauges', action='store_true',
+                        help="Draw the gauges procedurally, antialiased at "
+                             "any size")
+    parser.add_argument('--views', choices=CAMERA_LAYOUTS, default='single',
+                        help="3D view layout; quad adds top, front and side "
+                             "views")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="Print the time from launch to the first frame")
+    args = parser.parse_args(argv)
+    if args.rate_profile is not None and (args.stream or args.attach):
+        parser.error("--rate-profile can not be combined with --stream or "
+                     "--attach")
+    if args.replay is not None and (args.stream or args.attach
+                                    or args.rate_profile):
+        parser.error("--replay can not be combined with --stream, --attach "
+                     "or --rate-profile")
+    if args.events is not None and (args.replay is None
+                                    or not os.path.isdir(args.replay)):
+        parser.error("--events needs --replay of a recording directory")
+
+    # Check for the GUI stack before any socket, shared memory block or
+    # recorder thread is created
+    missing = [name for name in ('wx', 'vispy')
+               if importlib.util.find_spec(name) is None]
+    if missing:
+        parser.error("{} not installed, the app needs the gui extra: "
+                     "pip install wxPyOriViz[gui]".format(', '.join(missing)))
+
+    profiler = FrameProfiler(enabled=args.profile or bool(args.profile_trace),
+                             trace_len=100000 if args.profile_trace else None)
+
+    rate_receiver = None
+    if args.stream is not None:
+        from .rate_stream import RateStreamReceiver
+        rate_receiver = RateStreamReceiver(args.stream_host, args.stream_port,
+                                           args.stream, args.jitter_delay)
+        try:
+            rate_receiver.start()
+        except OSError as exc:
+            parser.error("can not receive the rate stream: {}".format(exc))
+
+    state_publisher = None
+    if args.publish is not None:
+        from .shared_state import StatePublisher
+        state_publisher = StatePublisher(args.publish)
+
+    state_server = None
+    if args.serve is not None or args.serve_unix is not None:
+        from .state_server import StateServer
+        state_server = StateServer(port=args.serve, unix_path=args.serve_unix)
+        try:
+            state_server.start()
+        except OSError as exc:
+            parser.error("can not serve state frames: {}".format(exc))
+
+    if args.attach is not None:
+        from .shared_state import SharedStateView
+        i_data = SharedStateView(args.attach)
+    elif args.replay is not None and os.path.isdir(args.replay):
+        from .recorder import RecordingReplay
+        try:
+            i_data = RecordingReplay.open(args.replay)
+        except (OSError, ValueError) as exc:
+            parser.error("can not replay {}: {}".format(args.replay, exc))
+    elif args.replay is not None:
+        from .fusion import FusionReplay
+        i_data = FusionReplay.load(args.replay)
+    else:
+        i_data = GenRatesData(np.float32 if args.float32 else np.float64,
+                              args.math_backend)
+    if args.mount is not None:
+        from .mount_align import AlignedSource, MountAlignment
+        i_data = AlignedSource(i_data, MountAlignment.load(args.mount))
+    rate_schedule = None
+    if args.rate_profile is not None:
+        from .rate_profile import RateProfile
+        try:
+            profile = RateProfile.load(args.rate_profile)
+            rate_schedule = profile.evaluate(i_data.dt, i_data.dtype)
+        except (OSError, ValueError) as exc:
+            parser.error("can not use rate profile {}: {}".format(
+                args.rate_profile, exc))
+    event_index = None
+    if args.events == '':
+        from .events import EventDetector
+        event_index = EventDetector().scan(i_data.reader)
+    elif args.events is not None:
+        from .events import EventIndex
+        event_index = EventIndex.load(args.events)
+    range_index = None
+    if event_index is not None:
+        from .range_index import RangeIndex
+        range_index = RangeIndex.open(i_data.reader)
+
+    recorder = None
+    if args.record is not None:
+        from .recorder import TrajectoryRecorder
+        if args.record_quat_bits is not None:
+            recorder = TrajectoryRecorder(args.record, dtype=i_data.dtype,
+                                          quat_bits=args.record_quat_bits,
+                                          time_resolution=1e-6,
+                                          range_index=True, compact=True)
+        else:
+            recorder = TrajectoryRecorder(args.record, dtype=i_data.dtype,
+                                          range_index=True)
+
+    import wx
+    from .main_frame import MainFrame, report_first_frame
+
+    myapp = wx.App(0)
+    frame = MainFrame(i_data, rate_receiver, state_publisher,
+                      smoothing=not args.no_smoothing, profiler=profiler,
+                      trace_file=args.profile_trace, recorder=recorder,
+                      gauge_renderer='sdf' if args.sdf_gauges else 'lines',
+                      state_server=state_server, event_index=event_index,
+                      range_index=range_index)
+    frame.chevron_canvas.canvas.set_cameras(args.views)
+    if rate_schedule is not None:
+        i_data.set_rate_schedule(rate_schedule)
+        frame.slider_controls.set_values((0.0, 0.0, 0.0))
+    if args.startup_time:
+        report_first_frame(frame.chevron_canvas.canvas, STARTUP_T0)
+    frame.Show(True)
+    myapp.MainLoop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+import time
+
+import wx
+
+from .angle_gauges import GaugeCanvas
+from .chevron_viz import ChevronCanvas
+from .frame_profiler import FrameProfiler
+from .orientation import AttitudeInterpolator, SimClock, quat_to_display_ypr
+from .helper_widgets import (EventBrowser, PlaybackControl, QuatDisplay,
+                             RateSliders)
+
+
+# The wx window and its vispy canvases. Only imported by main.main() once
+# the arguments are parsed and the data source is set up, so importing the
+# package, --help and argument errors never load wx or vispy.
+
+
+class wxVP_Gauge(wx.Panel):
+    def __init__(self, parent, ID, ini_size, data_obj, renderer='lines'):
+        wx.Panel.__init__(self, parent, ID, size=ini_size)
+
+        self.canvas = GaugeCanvas(
+            app="wx", parent=self, keys='interactive', size=ini_size,
+            renderer=renderer)
+
+        self.canvas.set_data_obj(data_obj)
+
+        self.Bind(wx.EVT_SIZE, self.OnSize)
+
+    def ShowCanvas(self):
+        self.canvas.show()
+
+    def StopTimer(self):
+        self.canvas.stop_timer()
+
+    def OnSize(self, event):
+        size_x = event.GetSize()[0]
+        size_y = event.GetSize()[1]
+        self.canvas.size = (size_x, size_y)
+
+
+class wxVP_Chevron(wx.Panel):
+    def __init__(self, parent, ID, ini_size, data_obj, print_callback=None):
+        wx.Panel.__init__(self, parent, ID, size=ini_size)
+
+        self.canvas = ChevronCanvas(app="wx", parent=self, keys='interactive')
+
+        self.canvas.set_data_obj(data_obj)
+
+        if print_callback is not None:
+            self.canvas.print_callback = print_callback
+
+        self.Bind(wx.EVT_SIZE, self.OnSize)
+
+    def ShowCanvas(self):
+        self.canvas.show()
+
+    def StopTimer(self):
+        self.canvas.stop_timer()
+
+    def OnSize(self, event):
+        size_x = event.GetSize()[0]
+        size_y = event.GetSize()[1]
+        self.canvas.size = (size_x, size_y)
+
+
+class MainFrame(wx.Frame):
+    def __init__(self, data_obj, rate_receiver=None, state_publisher=None,
+                 smoothing=True, profiler=None, trace_file=None,
+                 recorder=None, gauge_renderer='lines', state_server=None,
+                 event_index=None, range_index=None):
+        wx.Frame.__init__(self, None, -1, "Euler angles tracking - Vispy + wxWidgets",
+                          wx.DefaultPosition, size=(1200, 1000))
+
+        MenuBar = wx.MenuBar()
+        file_menu = wx.Menu()
+        file_menu.Append(wx.ID_EXIT, "&Quit")
+        self.Bind(wx.EVT_MENU, self.on_quit, id=wx.ID_EXIT)
+        self.Bind(wx.EVT_SHOW, self.on_show)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        MenuBar.Append(file_menu, "&File")
+        self.SetMenuBar(MenuBar)
+
+        self.data_obj = data_obj
+        self.main_panel = wx.Panel(self)
+
+        self.chevron_canvas = wxVP_Chevron(self.main_panel, wx.ID_ANY,
+                                           (800, 600), data_obj,
+                                           self.PrintAngles)
+
+        self.gauge_canvas = wxVP_Gauge(self.main_panel, wx.ID_ANY, (1200, 400),
+                                       data_obj, gauge_renderer)
+
+        self.slider_controls = RateSliders(self.main_panel, wx.ID_ANY, data_obj)
+
+        self.quat_display = QuatDisplay(self.main_panel, wx.ID_ANY)
+
+        self.playback_control = PlaybackControl(
+            self.main_panel, wx.ID_ANY, self.on_playback_rate)
+
+        # Jump list for a replayed recording's events.EventIndex
+        self.event_browser = None
+        if event_index is not None:
+            self.event_browser = EventBrowser(
+                self.main_panel, wx.ID_ANY, event_index, self.jump_to_row,
+                lambda: data_obj.row, range_index)
+
+        self.lbl_x_lbl = wx.StaticText(self.main_panel, -1, "Roll:")
+        self.lbl_y_lbl = wx.StaticText(self.main_panel, -1, "Pitch:")
+        self.lbl_z_lbl = wx.StaticText(self.main_panel, -1, "Yaw:")
+
+        self.lbl_x_pos = wx.StaticText(
+            self.main_panel, -1, "")
+        self.lbl_y_pos = wx.StaticText(
+            self.main_panel, -1, "")
+        self.lbl_z_pos = wx.StaticText(
+            self.main_panel, -1, "")
+
+        self.lbl_x_pos.SetLabel("Test X")
+        self.lbl_y_pos.SetLabel("Test Y")
+        self.lbl_z_pos.SetLabel("Test Z")
+
+        self.btn_quit = wx.Button(self.main_panel, -1, "Quit")
+        self.btn_start_stop = wx.Button(self.main_panel, -1, "Start")
+        self.btn_reset = wx.Button(self.main_panel, -1, "Reset")
+
+        self.cb_angle_refs = wx.CheckBox(
+            self.main_panel, wx.ID_ANY, "Show ref. planes")
+        self.cb_angle_refs.SetValue(True)
+
+        # Per stage timings, shown as an overlay on the 3D view
+        self.profiler = profiler if profiler is not None else FrameProfiler()
+        self.trace_file = trace_file
+        self.chevron_canvas.canvas.set_profiler(self.profiler)
+        self.gauge_canvas.canvas.set_profiler(self.profiler)
+        self.cb_profiler = wx.CheckBox(
+            self.main_panel, wx.ID_ANY, "Profiler")
+        self.cb_profiler.SetValue(self.profiler.enabled)
+        self.chevron_canvas.canvas.set_profiler_overlay(self.profiler.enabled)
+
+        self.Bind(wx.EVT_BUTTON, self.on_quit, self.btn_quit)
+        self.Bind(wx.EVT_BUTTON, self.on_btn_start, self.btn_start_stop)
+        self.Bind(wx.EVT_BUTTON, self.on_btn_reset, self.btn_reset)
+
+        self.Bind(wx.EVT_CHECKBOX, self.on_cb_angle_refs, self.cb_angle_refs)
+        self.Bind(wx.EVT_CHECKBOX, self.on_cb_profiler, self.cb_profiler)
+
+        self.tick_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_tick_timer, self.tick_timer)
+        self.tick_size = 1.0 / 60.0   # So we have roughly 60fps refresh
+        self.timer_running = False
+
+        # The timer only sets the render rate, integration steps follow the
+        # monotonic clock so simulated time does not drift behind real time
+        self.sim_clock = SimClock(data_obj.dt)
+
+        # Optional live rate stream, replaces the fixed step integration
+        self.rate_receiver = rate_receiver
+
+        # Optional shared memory ring other viewer processes can attach to
+        self.state_publisher = state_publisher
+
+        # Optional socket server streaming binary state frames to other tools
+        self.state_server = state_server
+
+        # Optional on-disk recording of every integration step
+        self.recorder = recorder
+        if recorder is not None:
+            data_obj.set_recorder(recorder)
+
+        # SLERP between simulation states at draw time, so the display rate
+        # does not have to match the integration rate
+        self.interpolator = None
+        if smoothing:
+            self.interpolator = AttitudeInterpolator()
+            self.chevron_canvas.canvas.set_interpolator(
+                self.interpolator, self.on_frame_drawn)
+
+        self.main_sizer = wx.BoxSizer(wx.VERTICAL)
+        self.hsizer1 = wx.BoxSizer(wx.HORIZONTAL)
+        self.hsizer2 = wx.BoxSizer(wx.HORIZONTAL)
+
+        self.hsizer1.Add(self.chevron_canvas, 1,
+                         wx.CENTER | wx.EXPAND | wx. ALL, 2)
+        self.hsizer1.Add(self.slider_controls, 0,
+                         wx.CENTER | wx.EXPAND | wx.ALL, 2)
+
+        self.hsizer2.Add(self.quat_display, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(10)
+        self.hsizer2.Add(self.playback_control, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(10)
+        self.hsizer2.Add(self.lbl_z_lbl, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.Add(self.lbl_z_pos, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(5)
+        self.hsizer2.Add(self.lbl_y_lbl, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.Add(self.lbl_y_pos, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(5)
+        self.hsizer2.Add(self.lbl_x_lbl, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.Add(self.lbl_x_pos, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(20)
+        self.hsizer2.Add(self.btn_start_stop, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(10)
+        self.hsizer2.Add(self.btn_reset, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(40)
+        self.hsizer2.Add(self.btn_quit, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(20)
+        self.hsizer2.Add(self.cb_angle_refs, 0, wx.CENTER | wx.ALL, 2)
+        self.hsizer2.AddSpacer(10)
+        self.hsizer2.Add(self.cb_profiler, 0, wx.CENTER | wx.ALL, 2)
+
+        self.main_sizer.Add(self.gauge_canvas, 1,
+                            wx.CENTER | wx.EXPAND | wx.ALL, 2)
+        self.main_sizer.Add(self.hsizer1, 1, wx.CENTER | wx.EXPAND | wx.ALL, 2)
+        self.main_sizer.Add(self.hsizer2, 0, wx.CENTER | wx.ALL, 2)
+        if self.event_browser is not None:
+            self.main_sizer.Add(self.event_browser, 0, wx.CENTER | wx.ALL, 2)
+
+        self.main_panel.SetSizer(self.main_sizer)
+        self.main_panel.Fit()
+
+    def OnMouse(self, event):
+        self.lbl_x_pos.SetLabel(str(event.pos[0]))
+        self.lbl_y_pos.SetLabel(str(event.pos[1]))
+
+    def PrintAngles(self, angles):
+        with self.profiler.stage('labels'):
+            self.print_angle_labels(angles)
+
+    def print_angle_labels(self, angles):
+        self.lbl_x_pos.SetLabel("{:.2f}".format(angles[2]))
+        self.lbl_y_pos.SetLabel("{:.2f}".format(angles[1]))
+        self.lbl_z_pos.SetLabel("{:.2f}".format(angles[0]))
+
+    def on_tick_timer(self, event):
+        if self.rate_receiver is not None:
+            self.rate_receiver.drain(self.data_obj)
+            if len(self.data_obj.time) == 0:
+                return  # Nothing integrated from the stream yet
+        else:
+            n_steps = self.sim_clock.advance()
+            if n_steps == 0:
+                return  # Timer fired early, nothing new to draw
+            with self.profiler.stage('integrate'):
+                for _ in range(n_steps):
+                    self.data_obj.iterate_data()
+
+        if self.state_publisher is not None:
+            self.state_publisher.publish_from(self.data_obj)
+        if self.state_server is not None:
+            self.state_server.publish_from(self.data_obj)
+
+        if self.interpolator is not None:
+            # Gauges and readouts follow from on_frame_drawn
+            self.interpolator.push_from(self.data_obj)
+            self.chevron_canvas.canvas.update()
+            return
+
+        # self.chevron_canvas.canvas.chevron.set_ypr_angles(
+        #     self.data_obj.get_latest_ypr())
+        self.chevron_canvas.canvas.update_dcm(self.data_obj.get_dcm())
+
+        self.gauge_canvas.canvas.update_angles(self.data_obj.get_latest_ypr())
+
+        self.chevron_canvas.canvas.update()
+        self.gauge_canvas.canvas.update()
+
+        with self.profiler.stage('quat_display'):
+            self.quat_display.set_quat(self.data_obj.attitude_q)
+
+        self.PrintAngles(self.data_obj.get_latest_ypr())
+
+    def on_frame_drawn(self, quat):
+        ypr = quat_to_display_ypr(quat)
+        self.gauge_canvas.canvas.update_angles(ypr)
+        with self.profiler.stage('quat_display'):
+            self.quat_display.set_quat(quat)
+        self.PrintAngles(ypr)
+
+    def jump_to_row(self, row):
+        # Shows a row of the replayed recording straight away, whether
+        # playing or stopped
+        self.data_obj.seek(row)
+        self.sim_clock.start()
+        if self.interpolator is not None:
+            self.interpolator.reset()
+            self.interpolator.push_from(self.data_obj)
+        else:
+            self.chevron_canvas.canvas.update_dcm(self.data_obj.get_dcm())
+            self.on_frame_drawn(self.data_obj.attitude_q)
+        self.chevron_canvas.canvas.update()
+
+    def on_playback_rate(self, rate):
+        self.sim_clock.set_rate(rate)
+        if self.interpolator is not None:
+            self.interpolator.rate = self.sim_clock.rate
+
+    def on_btn_start(self, event):
+        if self.timer_running:
+            # Stop the timer
+            self.tick_timer.Stop()
+            self.timer_running = False
+            self.profiler.set_paced(False)
+            self.btn_start_stop.SetLabel("Start")
+        else:
+            # Start the timer
+            self.sim_clock.start()
+            self.tick_timer.Start(self.tick_size * 1000)
+            self.timer_running = True
+            self.profiler.set_paced(True)
+            self.btn_start_stop.SetLabel("Stop")
+
+    def on_btn_reset(self, event):
+        zero_angles = (0, 0, 0)
+        self.chevron_canvas.canvas.chevron.set_ypr_angles(zero_angles)
+        self.gauge_canvas.canvas.update_angles(zero_angles)
+        self.PrintAngles(zero_angles)
+
+        self.data_obj.reset_data()
+        if self.interpolator is not None:
+            self.interpolator.reset()
+
+        self.chevron_canvas.canvas.update()
+        self.gauge_canvas.canvas.update()
+
+    def on_cb_angle_refs(self, event):
+        self.chevron_canvas.canvas.set_ref_planes(
+            self.cb_angle_refs.GetValue())
+
+    def on_cb_profiler(self, event):
+        enabled = self.cb_profiler.GetValue()
+        self.profiler.set_enabled(enabled)
+        self.chevron_canvas.canvas.set_profiler_overlay(enabled)
+
+    def on_quit(self, event):
+        self.Close(True)
+
+    def on_close(self, event):
+        # Quit and the title bar close button both end up here
+        self.tick_timer.Stop()
+        self.chevron_canvas.StopTimer()
+        if self.rate_receiver is not None:
+            self.rate_receiver.stop()
+        if self.state_publisher is not None:
+            self.state_publisher.close()
+        if self.state_server is not None:
+            self.state_server.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.trace_file is not None:
+            self.profiler.export_trace(self.trace_file)
+        # self.gauge_canvas2.StopTimer()
+        event.Skip()
+
+    def on_show(self, event):
+        # self.canvas.show()
+        event.Skip()
+
+
+def report_first_frame(canvas, t0):
+    # One shot draw handler, prints the time from t0 (perf_counter) to the
+    # first frame
+    reported = []
+
+    def on_first_draw(event):
+        if reported:
+            return
+        reported.append(True)
+        print("Startup: first frame after {:.0f} ms".format(
+            1e3 * (time.perf_counter() - t0)))
+    canvas.events.draw.connect(on_first_draw, position='last')
@@ -0,0 +1,354 @@
+import argparse
+import importlib.util
+import math
+import time
+import types
+import warnings
+
+import numpy as np
+
+from . import attitude_math as amath
+
+
+# Interchangeable implementations of the attitude_math kernels. 'numpy' is
+# attitude_math itself; 'numba' compiles the same formulas to machine code,
+# which removes the per call array building and dispatch that dominates
+# these tiny functions, and compiles the whole integration loop
+# (IntegrateRates) so offline runs never go back to Python per step.
+# get_backend('auto') picks numba when it is installed and otherwise falls
+# back to numpy; the results agree to rounding, see parity_check() and
+# tests/test_math_backend.py.
+#
+# The numba scalar kernels take one quaternion / vector and compute in
+# float64. QuaternionMultiply and QuaternionFromRotationVector also take
+# (N, 4) / (N, 3) arrays, like their attitude_math versions.
+BACKENDS = ('numpy', 'numba')
+
+# numba itself is only imported when its backend is first asked for, it
+# takes longer to import than the rest of the math layer
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+
+def IntegrateRates(quat, euler, rates, dt):
+    # GenRatesData.iterate_data for each row of an (N, 3) array of body
+    # rates (rad/s, GenRatesData convention), starting from quat and the
+    # Euler angle solution euler. Returns the (N, 4) quaternions, (N, 3)
+    # Euler angles from them, (N, 3) Euler angle solution and the (N,)
+    # quaternion norms before normalising.
+    n = len(rates)
+    quats = np.empty((n, 4))
+    euler_q = np.empty((n, 3))
+    eulers = np.empty((n, 3))
+    norms = np.empty(n)
+
+    quat = np.array(quat, dtype=np.float64)
+    euler = np.array(euler, dtype=np.float64)
+    dcm = amath.QuatToDCM(quat)
+    for i in range(n):
+        world_rates = np.matmul(rates[i], dcm)
+        q_dot = amath.QuaternionRates(quat, world_rates)
+        quat = amath.EulerIntegration(quat, q_dot, dt)
+        norms[i] = amath.QuaternionNorm(quat)
+        quat = amath.QuaternionNormalise(quat)
+        euler_dot = amath.EulerAngleRatesXYZ(euler, rates[i])
+        euler = amath.EulerIntegration(euler, euler_dot, dt)
+        dcm = amath.QuatToDCM(quat)
+
+        quats[i] = quat
+        euler_q[i] = amath.EulerXYZfromQuaternion(quat)
+        eulers[i] = euler
+    return quats, euler_q, eulers, norms
+
+
+numpy_backend = types.SimpleNamespace(
+    name='numpy',
+    QuatToDCM=amath.QuatToDCM,
+    QuaternionRates=amath.QuaternionRates,
+    EulerAngleRatesXYZ=amath.EulerAngleRatesXYZ,
+    EulerXYZfromQuaternion=amath.EulerXYZfromQuaternion,
+    QuaternionNorm=amath.QuaternionNorm,
+    QuaternionNormalise=amath.QuaternionNormalise,
+    EulerIntegration=amath.EulerIntegration,
+    QuaternionMultiply=amath.QuaternionMultiply,
+    QuaternionFromRotationVector=amath.QuaternionFromRotationVector,
+    IntegrateRates=IntegrateRates,
+)
+
+
+def build_numba_backend():
+    import numba
+
+    def jit(func):
+        # Compiled kernels are cached next to this module, or in numba's
+        # user cache directory when the install is read only. With neither
+        # writable numba refuses to cache; compile once per process then.
+        try:
+            return numba.njit(cache=True)(func)
+        except RuntimeError:
+            return numba.njit(func)
+
+    @jit
+    def dcm_into(q, out):
+        q0, q1, q2, q3 = q[0], q[1], q[2], q[3]
+        out[0, 0] = q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3
+        out[0, 1] = 2.0 * (q1 * q2 + q0 * q3)
+        out[0, 2] = 2.0 * (q1 * q3 - q0 * q2)
+        out[1, 0] = 2.0 * (q1 * q2 - q0 * q3)
+        out[1, 1] = q0 * q0 - q1 * q1 + q2 * q2 - q3 * q3
+        out[1, 2] = 2.0 * (q2 * q3 + q0 * q1)
+        out[2, 0] = 2.0 * (q1 * q3 + q0 * q2)
+        out[2, 1] = 2.0 * (q2 * q3 - q0 * q1)
+        out[2, 2] = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+
+    @jit
+    def quat_rates_into(q, w, out):
+        out[0] = 0.5 * (-q[1] * w[0] - q[2] * w[1] - q[3] * w[2])
+        out[1] = 0.5 * (q[0] * w[0] + q[3] * w[1] - q[2] * w[2])
+        out[2] = 0.5 * (-q[3] * w[0] + q[0] * w[1] + q[1] * w[2])
+        out[3] = 0.5 * (q[2] * w[0] - q[1] * w[1] + q[0] * w[2])
+
+    @jit
+    def euler_rates_into(att, w, out):
+        s_phi = math.sin(att[0])
+        c_phi = math.cos(att[0])
+        t_theta = math.tan(att[1])
+        c_theta = math.cos(att[1])
+        out[0] = w[0] + t_theta * s_phi * w[1] + t_theta * c_phi * w[2]
+        out[1] = c_phi * w[1] - s_phi * w[2]
+        out[2] = (s_phi / c_theta) * w[1] + (c_phi / c_theta) * w[2]
+
+    @jit
+    def euler_from_quat_into(q, out):
+        q0, q1, q2, q3 = q[0], q[1], q[2], q[3]
+        r11 = q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3
+        r12 = 2.0 * (q1 * q2 + q0 * q3)
+        r13 = 2.0 * (q1 * q3 - q0 * q2)
+        r23 = 2.0 * (q2 * q3 + q0 * q1)
+        r33 = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+        out[0] = math.atan2(r23, r33)
+        # arcsin of a value rounded past +-1 is nan, as in attitude_math
+        out[1] = -math.asin(r13) if abs(r13) <= 1.0 else math.nan
+        out[2] = math.atan2(r12, r11)
+
+    @jit
+    def quat_to_dcm(q):
+        out = np.empty((3, 3))
+        dcm_into(q, out)
+        return out
+
+    @jit
+    def quaternion_rates(q, w):
+        out = np.empty(4)
+        quat_rates_into(q, w, out)
+        return out
+
+    @jit
+    def euler_angle_rates(att, w):
+        out = np.empty(3)
+        euler_rates_into(att, w, out)
+        return out
+
+    @jit
+    def euler_from_quaternion(q):
+        out = np.empty(3)
+        euler_from_quat_into(q, out)
+        return out
+
+    @jit
+    def quaternion_norm(q):
+        return math.sqrt(q[0] * q[0] + q[1] * q[1] + q[2] * q[2] + q[3] * q[3])
+
+    @jit
+    def quaternion_normalise(q):
+        return q / quaternion_norm(q)
+
+    @jit
+    def multiply_rows(p, q, out):
+        for i in range(p.shape[0]):
+            p0, p1, p2, p3 = p[i, 0], p[i, 1], p[i, 2], p[i, 3]
+            q0, q1, q2, q3 = q[i, 0], q[i, 1], q[i, 2], q[i, 3]
+            out[i, 0] = p0 * q0 - p1 * q1 - p2 * q2 - p3 * q3
+            out[i, 1] = p0 * q1 + p1 * q0 + p2 * q3 - p3 * q2
+            out[i, 2] = p0 * q2 - p1 * q3 + p2 * q0 + p3 * q1
+            out[i, 3] = p0 * q3 + p1 * q2 - p2 * q1 + p3 * q0
+
+    @jit
+    def rotation_vector_rows(v, out):
+        for i in range(v.shape[0]):
+            angle = math.sqrt(v[i, 0] ** 2 + v[i, 1] ** 2 + v[i, 2] ** 2)
+            if angle < 1e-6:
+                scale = 0.5 - angle * angle / 48.0
+            else:
+                scale = math.sin(0.5 * angle) / angle
+            out[i, 0] = math.cos(0.5 * angle)
+            out[i, 1] = v[i, 0] * scale
+            out[i, 2] = v[i, 1] * scale
+            out[i, 3] = v[i, 2] * scale
+
+    @jit
+    def integrate_rates(quat, euler, rates, dt):
+        n = rates.shape[0]
+        quats = np.empty((n, 4))
+        euler_q = np.empty((n, 3))
+        eulers = np.empty((n, 3))
+        norms = np.empty(n)
+
+        q = quat.copy()
+        e = euler.copy()
+        dcm = np.empty((3, 3))
+        world = np.empty(3)
+        q_dot = np.empty(4)
+        e_dot = np.empty(3)
+        dcm_into(q, dcm)
+        for i in range(n):
+            for j in range(3):
+                world[j] = (rates[i, 0] * dcm[0, j] + rates[i, 1] * dcm[1, j]
+                            + rates[i, 2] * dcm[2, j])
+            quat_rates_into(q, world, q_dot)
+            for j in range(4):
+                q[j] += q_dot[j] * dt
+            norm = quaternion_norm(q)
+            norms[i] = norm
+            for j in range(4):
+                q[j] /= norm
+            euler_rates_into(e, rates[i], e_dot)
+            for j in range(3):
+                e[j] += e_dot[j] * dt
+            dcm_into(q, dcm)
+
+            quats[i] = q
+            euler_from_quat_into(q, euler_q[i])
+            eulers[i] = e
+        return quats, euler_q, eulers, norms
+
+    def as_f64(values):
+        return np.ascontiguousarray(values, dtype=np.float64)
+
+    def batched(kernel, width):
+        # Applies a row kernel to one row or an (..., k) array of them
+        def wrapper(*args):
+            args = [as_f64(a) for a in args]
+            shape = np.broadcast_shapes(*(a.shape[:-1] for a in args))
+            rows = [np.broadcast_to(a, shape + a.shape[-1:]).reshape(
+                -1, a.shape[-1]) for a in args]
+            out = np.empty((len(rows[0]), width))
+            kernel(*[np.ascontiguousarray(r) for r in rows], out)
+            return out.reshape(shape + (width,))
+        return wrapper
+
+    return types.SimpleNamespace(
+        name='numba',
+        QuatToDCM=lambda q: quat_to_dcm(as_f64(q)),
+        QuaternionRates=lambda q, w: quaternion_rates(as_f64(q), as_f64(w)),
+        EulerAngleRatesXYZ=lambda a, w: euler_angle_rates(as_f64(a),
+                                                          as_f64(w)),
+        EulerXYZfromQuaternion=lambda q: euler_from_quaternion(as_f64(q)),
+        QuaternionNorm=lambda q: quaternion_norm(as_f64(q)),
+        QuaternionNormalise=lambda q: quaternion_normalise(as_f64(q)),
+        EulerIntegration=amath.EulerIntegration,
+        QuaternionMultiply=batched(multiply_rows, 4),
+        QuaternionFromRotationVector=batched(rotation_vector_rows, 4),
+        IntegrateRates=lambda quat, euler, rates, dt: integrate_rates(
+            as_f64(quat), as_f64(euler), as_f64(rates), float(dt)),
+    )
+
+
+loaded = {'numpy': numpy_backend}
+
+
+def get_backend(name='auto'):
+    # 'auto' is numba when installed, else numpy. Asking for numba without
+    # it installed warns and falls back to numpy.
+    if name not in BACKENDS + ('auto',):
+        raise ValueError("Unknown math backend '{}'".format(name))
+    if name == 'numpy' or (name == 'auto' and not HAVE_NUMBA):
+        return numpy_backend
+    if not HAVE_NUMBA:
+        warnings.warn("numba is not installed, using the numpy backend")
+        return numpy_backend
+
+    if 'numba' not in loaded:
+        loaded['numba'] = build_numba_backend()
+    return loaded['numba']
+
+
+def parity_check(backend='numba', n_steps=2000, seed=0):
+    # Largest absolute difference between backend and numpy, per kernel,
+    # over random inputs and a random manoeuvre
+    other = get_backend(backend)
+    rng = np.random.default_rng(seed)
+    quats = amath.QuaternionNormalise(rng.normal(size=(4, 64))).T
+    vecs = rng.normal(size=(64, 3))
+    angles = rng.uniform(-1.4, 1.4, size=(64, 3))
+
+    diffs = {}
+
+    def compare(name, ref, value):
+        diffs[name] = max(diffs.get(name, 0.0),
+                          float(np.max(np.abs(np.subtract(ref, value)))))
+
+    for q, v, a in zip(quats, vecs, angles):
+        for name, args in (('QuatToDCM', (q,)), ('QuaternionRates', (q, v)),
+                           ('EulerAngleRatesXYZ', (a, v)),
+                           ('EulerXYZfromQuaternion', (q,)),
+                           ('QuaternionNorm', (2.0 * q,)),
+                           ('QuaternionNormalise', (2.0 * q,))):
+            compare(name, getattr(numpy_backend, name)(*args),
+                    getattr(other, name)(*args))
+    for name, args in (('QuaternionMultiply', (quats, quats[::-1])),
+                       ('QuaternionFromRotationVector', (1e-3 * vecs,))):
+        compare(name, getattr(numpy_backend, name)(*args),
+                getattr(other, name)(*args))
+
+    rates = np.radians(rng.normal(0.0, 60.0, size=(n_steps, 3)))
+    q0 = quats[0]
+    e0 = amath.EulerXYZfromQuaternion(q0)
+    ref = numpy_backend.IntegrateRates(q0, e0, rates, 1 / 60)
+    result = other.IntegrateRates(q0, e0, rates, 1 / 60)
+    for name, r, v in zip(('quat', 'euler_q', 'euler', 'q_norm'), ref, result):
+        compare('IntegrateRates.' + name, r, v)
+    return diffs
+
+
+def bench_integration(n_steps=100000, backends=BACKENDS):
+    # Steps per second of IntegrateRates; a first short call compiles
+    rates = np.radians(np.tile([10.0, 20.0, 90.0], (n_steps, 1)))
+    q0 = np.array([1.0, 0.0, 0.0, 0.0])
+    e0 = np.zeros(3)
+    results = {}
+    for name in backends:
+        backend = get_backend(name)
+        if backend.name != name:
+            continue
+        backend.IntegrateRates(q0, e0, rates[:10], 1 / 60)
+        t0 = time.perf_counter()
+        backend.IntegrateRates(q0, e0, rates, 1 / 60)
+        results[name] = n_steps / (time.perf_counter() - t0)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare the attitude math backends")
+    parser.add_argument('--steps', type=int, default=100000,
+                        help="Steps for the throughput comparison")
+    parser.add_argument('--tolerance', type=float, default=1e-9,
+                        help="Largest allowed difference from numpy")
+    args = parser.parse_args()
+
+    if not HAVE_NUMBA:
+        print("numba is not installed, only the numpy backend is available")
+        raise SystemExit(0)
+
+    diffs = parity_check()
+    failed = [name for name, diff in diffs.items() if diff > args.tolerance]
+    for name, diff in diffs.items():
+        print("  {:<40} {:.3g}{}".format(
+            name, diff, "  FAIL" if name in failed else ""))
+
+    rates = bench_integration(args.steps)
+    for name, steps_per_s in rates.items():
+        print("{:>6}: {:,.0f} steps/s".format(name, steps_per_s))
+    if 'numba' in rates:
+        print("speedup: {:.0f}x".format(rates['numba'] / rates['numpy']))
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,298 @@
+import argparse
+import os
+
+import numpy as np
+
+from . import attitude_math as amath
+from .orientation import quat_to_display_ypr
+
+
+# Fixed mounting rotation between two IMUs on one airframe, from two
+# synchronized recorded streams. The mount q_m is defined by
+#
+#   q_B = q_A * q_m
+#
+# so B's body rates are A's seen in B's frame, w_B = C(q_m) w_A, and B's
+# world to body matrix is C(q_B) = C(q_m) C(q_A), with C = QuatToDCM. Either
+# relation is a Wahba problem: the rotation C best mapping vectors a_i onto
+# b_i is U diag(1, 1, det U det V) V^T from the SVD of B = sum b_i a_i^T.
+#
+# The streams are read once in fixed size blocks. Per window of `window`
+# samples only the 3x3 B matrix is kept, so millions of samples cost a few
+# thousand matrices; the windows are solved in one batched SVD (their
+# scatter shows whether the mount is stable) and their sum gives the
+# overall solution.
+MODES = ('rates', 'attitude')
+READ_ROWS = 65536
+
+
+def wahba_svd(B):
+    # Batched: (..., 3, 3) B matrices to the rotations C, the left singular
+    # vectors U and the singular values with the determinant sign applied
+    U, s, Vt = np.linalg.svd(B)
+    d = np.linalg.det(U) * np.linalg.det(Vt)
+    sign = np.stack([np.ones_like(d), np.ones_like(d), d], axis=-1)
+    C = np.matmul(U * sign[..., np.newaxis, :], Vt)
+    return C, U, s * sign
+
+
+def quat_from_dcm(C):
+    # Inverse of QuatToDCM for (..., 3, 3) rotation matrices, w >= 0. Uses
+    # the largest of the four candidate components for accuracy.
+    C = np.asarray(C, dtype=np.float64)
+    trace = C[..., 0, 0] + C[..., 1, 1] + C[..., 2, 2]
+    cands = np.stack([trace, C[..., 0, 0], C[..., 1, 1], C[..., 2, 2]], -1)
+    pick = np.argmax(cands, axis=-1)
+
+    # 4 q_k q_j for each pivot k, from the symmetric and skew parts
+    s01 = C[..., 1, 2] - C[..., 2, 1]
+    s02 = C[..., 2, 0] - C[..., 0, 2]
+    s03 = C[..., 0, 1] - C[..., 1, 0]
+    s12 = C[..., 0, 1] + C[..., 1, 0]
+    s13 = C[..., 0, 2] + C[..., 2, 0]
+    s23 = C[..., 1, 2] + C[..., 2, 1]
+    rows = np.stack([
+        np.stack([1.0 + trace, s01, s02, s03], -1),
+        np.stack([s01, 1.0 + 2.0 * C[..., 0, 0] - trace, s12, s13], -1),
+        np.stack([s02, s12, 1.0 + 2.0 * C[..., 1, 1] - trace, s23], -1),
+        np.stack([s03, s13, s23, 1.0 + 2.0 * C[..., 2, 2] - trace], -1),
+    ], -2)
+    q = np.take_along_axis(rows, pick[..., np.newaxis, np.newaxis],
+                           axis=-2)[..., 0, :]
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    return q * np.where(q[..., :1] < 0.0, -1.0, 1.0)
+
+
+def small_rotation(C):
+    # Rotation vectors (rad) of (..., 3, 3) near identity rotations
+    return 0.5 * np.stack([C[..., 1, 2] - C[..., 2, 1],
+                           C[..., 2, 0] - C[..., 0, 2],
+                           C[..., 0, 1] - C[..., 1, 0]], axis=-1)
+
+
+def open_stream(path, mode):
+    # (rows, read(start, stop), times(start, stop) or None) for a recording
+    # directory or an .npy file of (N, 3) rates or (N, 4) quaternions
+    column = 'rates' if mode == 'rates' else 'quat'
+    if os.path.isdir(path):
+        from .recorder import RecordingReader
+        reader = RecordingReader(path)
+        return (len(reader), lambda a, b: reader.read(column, a, b),
+                lambda a, b: reader.read('t', a, b))
+    array = np.load(path, mmap_mode='r')
+    return (len(array),
+            lambda a, b: np.asarray(array[a:b], dtype=np.float64), None)
+
+
+class AlignmentAccumulator:
+    # One pass over pairs of blocks; keeps per window B matrices and the
+    # sums the residual needs
+
+    def __init__(self, mode='rates', window=1000):
+        if mode not in MODES:
+            raise ValueError("Unknown alignment mode '{}'".format(mode))
+        self.mode = mode
+        self.window = window
+        self.windows = []
+        self.total = np.zeros((3, 3))
+        self.partial = np.zeros((3, 3))
+        self.partial_n = 0
+        self.n_samples = 0
+        self.n_vectors = 0
+        self.sum_sq = 0.0   # Sum of |a|^2 + |b|^2 over all vectors
+
+    def push(self, a, b):
+        # a, b: (n, 3) rates of A and B, or (n, 4) quaternions
+        if self.mode == 'rates':
+            terms = a[:, np.newaxis, :] * b[:, :, np.newaxis]
+            self.sum_sq += float(np.sum(a * a) + np.sum(b * b))
+            self.n_vectors += len(a)
+        else:
+            # Columns of each world to body matrix are the world axes seen
+            # in that body, three unit vector pairs per sample
+            C_a = np.moveaxis(amath.QuatToDCM(a.T), -1, 0)
+            C_b = np.moveaxis(amath.QuatToDCM(b.T), -1, 0)
+            terms = np.matmul(C_b, np.swapaxes(C_a, 1, 2))
+            self.sum_sq += 6.0 * len(a)
+            self.n_vectors += 3 * len(a)
+        self.n_samples += len(a)
+        self.total += terms.sum(axis=0)
+
+        # Top up the open window, then whole windows, then the remainder
+        take = min(self.window - self.partial_n, len(terms))
+        self.partial += terms[:take].sum(axis=0)
+        self.partial_n += take
+        if self.partial_n == self.window:
+            self.windows.append(self.partial)
+            self.partial, self.partial_n = np.zeros((3, 3)), 0
+        rest = terms[take:]
+        n_full = len(rest) // self.window * self.window
+        if n_full:
+            self.windows.extend(rest[:n_full].reshape(
+                -1, self.window, 3, 3).sum(axis=1))
+        if len(rest) > n_full:
+            self.partial = rest[n_full:].sum(axis=0)
+            self.partial_n = len(rest) - n_full
+
+    def finish(self):
+        # A final window of at least half the size still counts as one
+        windows = list(self.windows)
+        if self.partial_n >= max(self.window // 2, 1):
+            windows.append(self.partial)
+        return MountAlignment.solve(self.total,
+                                    np.array(windows).reshape(-1, 3, 3), self)
+
+
+class MountAlignment:
+    def __init__(self, quat, covariance, window_quats, window_cov,
+                 residual_rms, n_samples, mode):
+        self.quat = np.asarray(quat, dtype=np.float64)
+        self.dcm = amath.QuatToDCM(self.quat)
+        # Small angle covariance (rad^2) of the mount about B's axes,
+        # assuming isotropic noise estimated from the residuals
+        self.covariance = np.asarray(covariance)
+        self.window_quats = np.asarray(window_quats).reshape(-1, 4)
+        # Covariance (rad^2) of single window solutions about the overall one
+        self.window_cov = np.asarray(window_cov)
+        self.residual_rms = float(residual_rms)
+        self.n_samples = int(n_samples)
+        self.mode = mode
+
+    @property
+    def sigma_deg(self):
+        return np.degrees(np.sqrt(np.diag(self.covariance)))
+
+    @classmethod
+    def solve(cls, B, windows, acc):
+        C, U, s = wahba_svd(B)
+        # Loss sum |b - C a|^2 = sum |a|^2 + |b|^2 - 2 tr(C^T B)
+        loss = max(acc.sum_sq - 2.0 * np.sum(s), 0.0)
+        dof = max(3 * acc.n_vectors - 3, 1)
+        noise_var = loss / dof
+        with np.errstate(divide='ignore'):
+            info = 1.0 / np.array([s[1] + s[2], s[2] + s[0], s[0] + s[1]])
+        covariance = noise_var * (U * info) @ U.T
+        if acc.mode == 'attitude':
+            # The three axis pairs of a sample share one attitude error, not
+            # three independent ones
+            covariance *= 3.0
+
+        window_quats = np.zeros((0, 4))
+        window_cov = np.full((3, 3), np.nan)
+        if len(windows):
+            C_w, _, _ = wahba_svd(windows)
+            window_quats = quat_from_dcm(C_w)
+            errors = small_rotation(np.matmul(C_w, C.T))
+            if len(windows) > 1:
+                window_cov = np.cov(errors.T)
+
+        return cls(quat_from_dcm(C), covariance, window_quats, window_cov,
+                   np.sqrt(noise_var), acc.n_samples, acc.mode)
+
+    def rotate_rates(self, rates_b):
+        # (N, 3) body rates of B expressed in A's frame
+        return np.asarray(rates_b) @ self.dcm
+
+    def remove_from(self, quats_b):
+        # Attitudes of A from B's, q_A = q_B * q_m^-1
+        return amath.QuaternionMultiply(
+            quats_b, self.quat * np.array([1.0, -1.0, -1.0, -1.0]))
+
+    def save(self, path):
+        np.savez(path, quat=self.quat, covariance=self.covariance,
+                 window_quats=self.window_quats, window_cov=self.window_cov,
+                 residual_rms=self.residual_rms, n_samples=self.n_samples,
+                 mode=self.mode)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz['quat'], npz['covariance'], npz['window_quats'],
+                       npz['window_cov'], npz['residual_rms'],
+                       npz['n_samples'], str(npz['mode']))
+
+
+def align(path_a, path_b, mode='rates', window=1000, read_rows=READ_ROWS):
+    # Mount of B relative to A from two streams sampled at the same times.
+    # Recordings are checked sample by sample against each other's time
+    # stamps; a longer stream is cut to the shorter one.
+    n_a, read_a, times_a = open_stream(path_a, mode)
+    n_b, read_b, times_b = open_stream(path_b, mode)
+    n_rows = min(n_a, n_b)
+
+    acc = AlignmentAccumulator(mode, window)
+    for start in range(0, n_rows, read_rows):
+        stop = min(start + read_rows, n_rows)
+        if times_a is not None and times_b is not None:
+            t_a, t_b = times_a(start, stop), times_b(start, stop)
+            tolerance = 0.5 * np.median(np.diff(t_a)) if len(t_a) > 1 else 0.0
+            off = np.flatnonzero(np.abs(t_a - t_b) > tolerance)
+            if len(off):
+                raise ValueError(
+                    "Streams are not synchronized: row {} is at {:.6f} s in "
+                    "A and {:.6f} s in B".format(start + off[0], t_a[off[0]],
+                                                 t_b[off[0]]))
+        acc.push(read_a(start, stop), read_b(start, stop))
+    return acc.finish()
+
+
+class AlignedSource:
+    # Wraps a data source (GenRatesData, RecordingReplay, ...) mounted as
+    # IMU B so it is shown in IMU A's frame: the attitude and body rates
+    # have the mount removed, everything else is passed through. A recorder
+    # set on the source still records it in B's frame.
+
+    def __init__(self, source, alignment):
+        self.source = source
+        self.alignment = alignment
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+    @property
+    def attitude_q(self):
+        return self.alignment.remove_from(self.source.attitude_q)
+
+    @property
+    def omega_body(self):
+        return self.alignment.rotate_rates(self.source.omega_body)
+
+    @property
+    def dcm(self):
+        return amath.QuatToDCM(self.attitude_q)
+
+    def get_dcm(self):
+        return self.dcm
+
+    def get_latest_ypr(self):
+        return quat_to_display_ypr(self.attitude_q)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Mounting rotation of IMU B relative to IMU A from two "
+                    "synchronized recordings")
+    parser.add_argument('imu_a', help="Recording directory or .npy stream")
+    parser.add_argument('imu_b', help="Recording directory or .npy stream")
+    parser.add_argument('--mode', choices=MODES, default='rates',
+                        help="Align body rates (recorded 'rates', (N, 3) "
+                             ".npy) or attitudes ('quat', (N, 4) .npy)")
+    parser.add_argument('--window', type=int, default=1000,
+                        help="Samples per window solution")
+    parser.add_argument('--save', metavar='FILE',
+                        help="Save the alignment, for wxpyoriviz --mount")
+    args = parser.parse_args()
+
+    result = align(args.imu_a, args.imu_b, args.mode, args.window)
+    ypr = quat_to_display_ypr(result.quat)
+    print("{} samples, {} windows".format(result.n_samples,
+                                          len(result.window_quats)))
+    print("Mount q_m = [{:.6f}, {:.6f}, {:.6f}, {:.6f}]".format(*result.quat))
+    print("  yaw {:.3f}, pitch {:.3f}, roll {:.3f} deg".format(*ypr))
+    print("  1-sigma about B's x, y, z: {:.4f}, {:.4f}, {:.4f} deg".format(
+        *result.sigma_deg))
+    print("  window scatter (1-sigma): {:.4f}, {:.4f}, {:.4f} deg".format(
+        *np.degrees(np.sqrt(np.diag(result.window_cov)))))
+    print("  residual rms {:.4g} per component".format(result.residual_rms))
+    if args.save:
+        result.save(args.save)
@@ -0,0 +1,446 @@
+import time
+
+import numpy as np
+
+from . import attitude_math as amath
+from . import math_backend
+
+
+def quat_to_display_ypr(quat):
+    # Same (yaw, pitch, roll) degrees and sign convention as
+    # GenRatesData.get_latest_ypr, for sources without the angle histories
+    angles = amath.Rad_to_Deg(amath.EulerXYZfromQuaternion(quat))
+    return (-angles[2], -angles[1], -angles[0])
+
+
+# Newest history entries GenRatesData keeps by default, about 18 minutes
+# at 60 Hz
+HISTORY_ROWS = 65536
+
+
+class HistoryBuffer:
+    # (N, n_cols) array of the newest entries, packed values of one dtype
+    # instead of lists of boxed scalars. Capacity doubles up to
+    # 2 * max_rows; once it is full, the newest max_rows entries are moved
+    # to the front and the older ones dropped, so a long run stops
+    # allocating and columns stay contiguous views.
+
+    def __init__(self, n_cols, dtype=np.float64, capacity=4096,
+                 max_rows=HISTORY_ROWS):
+        self.max_rows = max_rows
+        self.data = np.zeros((min(capacity, 2 * max_rows), n_cols),
+                             dtype=dtype)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def make_room(self, n_new):
+        needed = self.n + n_new
+        limit = 2 * self.max_rows
+        if needed > len(self.data) and len(self.data) < limit:
+            capacity = len(self.data)
+            while capacity < needed and capacity < limit:
+                capacity *= 2
+            grown = np.zeros((min(capacity, limit), self.data.shape[1]),
+                             dtype=self.data.dtype)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+        if needed > len(self.data):
+            keep = min(self.n, self.max_rows)
+            self.data[:keep] = self.data[self.n - keep:self.n]
+            self.n = keep
+
+    def next_row(self):
+        # Returns the row to fill in for the next entry
+        self.make_room(1)
+        row = self.data[self.n]
+        self.n += 1
+        return row
+
+    def extend(self, rows):
+        # Appends an (M, n_cols) block of entries
+        if len(rows) >= self.max_rows:
+            # Only the block's own newest entries are kept
+            rows = rows[-self.max_rows:]
+            self.n = 0
+        self.make_room(len(rows))
+        self.data[self.n:self.n + len(rows)] = rows
+        self.n += len(rows)
+
+    def column(self, i):
+        return self.data[:self.n, i]
+
+
+class GenRatesData:
+    # dtype sets the precision of the integration state, the histories and
+    # what gets handed to the GPU; float32 halves the memory traffic, see
+    # precision_drift() for how far it wanders from float64. backend picks
+    # the math_backend kernels used per step and by run_steps. The angle
+    # histories keep the newest history_rows steps.
+    def __init__(self, dtype=np.float64, backend='numpy',
+                 history_rows=HISTORY_ROWS):
+        self.dtype = np.dtype(dtype)
+        self.history_rows = history_rows
+        self.math = math_backend.get_backend(backend)
+        self.recorder = None
+        self.rate_schedule = None
+        self.rate_offset = np.zeros(3, dtype=self.dtype)
+        self.init_data()
+
+    def init_data(self):
+        # Initial attitude in angles (roll, pitch, yaw)
+        self.attitude0 = amath.Deg_to_Rad([0, 0, 0]).astype(self.dtype)
+
+        # Initial body rates in degress/second (roll, pitch, yaw)
+        self.omega_body = amath.Deg_to_Rad([0, 0, 90]).astype(self.dtype)
+
+        self.attitude_q = amath.QuaternionFromEulerXYZ(self.attitude0)
+        self.attitude_q_euler = self.attitude0
+        self.attitude_euler = self.attitude0
+
+        self.dcm = amath.QuatToDCM(self.attitude_q)
+        self.q_norm = 1.0   # Quaternion norm of the last step, pre-normalise
+
+        self.t = 0
+        self.dt = 1 / 60        # Assuming 60fps refresh rate
+        self.schedule_index = 0     # Next row of rate_schedule
+        self.last_sample_t = None   # Timestamp of last streamed rate sample
+
+        # Time stays float64 so long runs keep their resolution. The angle
+        # history columns are phi, theta, psi from the quaternion solution,
+        # then from the Euler angle solution, in degrees.
+        self.time_history = HistoryBuffer(1, np.float64,
+                                          max_rows=self.history_rows)
+        self.angle_history = HistoryBuffer(6, self.dtype,
+                                           max_rows=self.history_rows)
+
+    @property
+    def time(self):
+        return self.time_history.column(0)
+
+    @property
+    def phi_q(self):
+        return self.angle_history.column(0)
+
+    @property
+    def theta_q(self):
+        return self.angle_history.column(1)
+
+    @property
+    def psi_q(self):
+        return self.angle_history.column(2)
+
+    @property
+    def phi_euler(self):
+        return self.angle_history.column(3)
+
+    @property
+    def theta_euler(self):
+        return self.angle_history.column(4)
+
+    @property
+    def psi_euler(self):
+        return self.angle_history.column(5)
+
+    def iterate_data(self, dt=None):
+        if dt is None:
+            dt = self.dt
+
+        if self.rate_schedule is not None:
+            self.next_scheduled_rates()
+
+        # Results are cast back so scalar promotion can not widen the state
+        m = self.math
+        world_rates = np.matmul(self.omega_body, self.dcm)
+        q_dot = m.QuaternionRates(self.attitude_q, world_rates)
+        self.attitude_q = m.EulerIntegration(self.attitude_q, q_dot, dt)
+        # Norm before normalising, recorded so drift can be found later
+        self.q_norm = m.QuaternionNorm(self.attitude_q)
+        self.attitude_q = m.QuaternionNormalise(
+            self.attitude_q).astype(self.dtype, copy=False)
+        self.attitude_q_euler = m.EulerXYZfromQuaternion(self.attitude_q)
+
+        euler_dot = m.EulerAngleRatesXYZ(self.attitude_euler, self.omega_body)
+        self.attitude_euler = m.EulerIntegration(
+            self.attitude_euler, euler_dot, dt).astype(self.dtype, copy=False)
+
+        self.append_history()
+
+        self.dcm = m.QuatToDCM(self.attitude_q).astype(self.dtype, copy=False)
+        self.t += dt
+
+    def run_steps(self, n_steps):
+        # Offline integration: n_steps calls of iterate_data in one go, the
+        # loop itself running in the math backend (compiled with numba).
+        # Histories, rate schedule and recorder are updated the same way.
+        if n_steps <= 0:
+            return
+        if self.rate_schedule is not None:
+            rows = np.minimum(np.arange(n_steps) + self.schedule_index,
+                              len(self.rate_schedule) - 1)
+            rates = self.rate_schedule[rows] + self.rate_offset
+            self.schedule_index += n_steps
+        else:
+            rates = np.tile(self.omega_body, (n_steps, 1))
+
+        quats, euler_q, eulers, norms = self.math.IntegrateRates(
+            self.attitude_q, self.attitude_euler, rates, self.dt)
+
+        # Time is accumulated step by step, as in iterate_data
+        times = np.cumsum(np.concatenate(
+            ([self.t], np.full(n_steps - 1, self.dt))))
+        if self.recorder is not None:
+            for i in range(n_steps):
+                self.recorder.append(times[i], rates[i], quats[i],
+                                     euler_q[i], eulers[i], norms[i])
+
+        self.time_history.extend(times[:, np.newaxis])
+        self.angle_history.extend(
+            np.concatenate([euler_q, eulers], axis=1) * (180.0 / np.pi))
+
+        self.omega_body = rates[-1].astype(self.dtype)
+        self.attitude_q = quats[-1].astype(self.dtype)
+        self.attitude_q_euler = euler_q[-1].astype(self.dtype)
+        self.attitude_euler = eulers[-1].astype(self.dtype)
+        self.q_norm = norms[-1]
+        self.dcm = self.math.QuatToDCM(self.attitude_q).astype(self.dtype)
+        self.t = times[-1] + self.dt
+
+    def iterate_rotation_vectors(self, rot_vecs, interval_dt):
+        # One attitude update per body frame rotation vector, as produced by
+        # gyro_frontend.ConingIntegrator for each output interval
+        rot_vecs = np.asarray(rot_vecs).astype(self.dtype, copy=False)
+        for rot_vec in rot_vecs:
+            dq = amath.QuaternionFromRotationVector(rot_vec)
+            self.attitude_q = amath.QuaternionMultiply(self.attitude_q, dq)
+            self.q_norm = amath.QuaternionNorm(self.attitude_q)
+            self.attitude_q = amath.QuaternionNormalise(
+                self.attitude_q).astype(self.dtype, copy=False)
+            self.attitude_q_euler = amath.EulerXYZfromQuaternion(
+                self.attitude_q)
+
+            # The Euler angle solution only gets the mean rate
+            self.omega_body = rot_vec / interval_dt
+            euler_dot = amath.EulerAngleRatesXYZ(
+                self.attitude_euler, self.omega_body)
+            self.attitude_euler = amath.EulerIntegration(
+                self.attitude_euler, euler_dot, interval_dt).astype(
+                    self.dtype, copy=False)
+
+            self.append_history()
+            self.t += interval_dt
+
+        self.dcm = amath.QuatToDCM(self.attitude_q).astype(
+            self.dtype, copy=False)
+
+    def iterate_gyro_samples(self, rates, frontend):
+        # Feed an (N, 3) block of raw high rate gyro samples (rad/s) through
+        # a ConingIntegrator front end
+        rot_vecs = frontend.push(rates)
+        self.iterate_rotation_vectors(rot_vecs, frontend.update_dt)
+        return len(rot_vecs)
+
+    def set_rate_schedule(self, rates):
+        # (N, 3) rates in degrees/second, one row per step of self.dt, e.g.
+        # from rate_profile.RateProfile.evaluate. Converted once here so each
+        # step only indexes a row; after the last row the final rates hold.
+        # While a schedule is set, set_body_rates sets an additive offset.
+        if rates is None:
+            self.rate_schedule = None
+            return
+        rates = amath.Deg_to_Rad(rates) * np.array([1.0, -1.0, -1.0])
+        self.rate_schedule = rates.astype(self.dtype)
+        self.omega_body = np.zeros(3, dtype=self.dtype)
+        self.schedule_index = 0
+
+    def next_scheduled_rates(self):
+        i = min(self.schedule_index, len(self.rate_schedule) - 1)
+        np.add(self.rate_schedule[i], self.rate_offset, out=self.omega_body)
+        self.schedule_index += 1
+
+    def set_recorder(self, recorder):
+        # Optional recorder.TrajectoryRecorder, fed every integration step
+        self.recorder = recorder
+
+    def append_history(self):
+        if self.recorder is not None:
+            self.recorder.record(self)
+
+        self.time_history.next_row()[0] = self.t
+        row = self.angle_history.next_row()
+        row[0:3] = self.attitude_q_euler
+        row[3:6] = self.attitude_euler
+        row *= 180.0 / np.pi
+
+    def set_body_rates(self, rates_tpl):
+        # Different signs so rates agree with OpenGL (vispy) conventions
+        rates = [rates_tpl[0], -rates_tpl[1], -rates_tpl[2]]
+        rates = amath.Deg_to_Rad(rates).astype(
+            self.dtype)   # In X, Y, Z format
+        if self.rate_schedule is not None:
+            self.rate_offset = rates
+        else:
+            self.omega_body = rates
+
+    def feed_rate_sample(self, t, rates_tpl):
+        # Zero-order hold: the previous sample's rates apply up to this
+        # sample's timestamp, so integration follows sample time rather
+        # than arrival time
+        if self.last_sample_t is not None and t > self.last_sample_t:
+            self.iterate_data(t - self.last_sample_t)
+        self.last_sample_t = t
+        self.set_body_rates(rates_tpl)
+
+    def restart_rate_stream(self):
+        # The rate stream restarted (rate_stream.JitterBuffer.resync); the
+        # next sample starts a new hold rather than integrating from the
+        # old stream's last timestamp
+        self.last_sample_t = None
+
+    def get_latest_ypr(self):
+        # Different signs so rates agree with OpenGL (vispy) conventions
+        out_tpl = (-self.psi_q[-1],
+                   -self.theta_q[-1],
+                   -self.phi_q[-1])
+
+        print(self.t, out_tpl)
+        return out_tpl
+
+    def get_dcm(self):
+        # return amath.QuatToDCM(self.attitude_q)
+        return self.dcm
+
+    def reset_data(self):
+        self.init_data()
+        if self.rate_schedule is not None:
+            self.omega_body = np.zeros(3, dtype=self.dtype)
+
+
+def precision_drift(rates_tpl=(10.0, 20.0, 90.0), duration=600.0, dt=1 / 60,
+                    threshold_deg=0.1):
+    # Runs the same manoeuvre in float64 and float32 and reports how far the
+    # float32 quaternion solution drifts from the float64 one
+    n_steps = int(duration / dt)
+    quats = {}
+    for dtype in (np.float64, np.float32):
+        data = GenRatesData(dtype)
+        data.dt = dt
+        data.set_body_rates(rates_tpl)
+        quats[dtype] = np.empty((n_steps, 4))
+        for i in range(n_steps):
+            data.iterate_data()
+            quats[dtype][i] = data.attitude_q
+
+    # Angle of the relative rotation, via the vector part to keep small
+    # angles accurate
+    q_ref = quats[np.float64] * np.array([1.0, -1.0, -1.0, -1.0])
+    q_rel = amath.QuaternionMultiply(q_ref, quats[np.float32])
+    sin_half = np.linalg.norm(q_rel[:, 1:], axis=1)
+    error = np.degrees(2.0 * np.arcsin(np.clip(sin_half, 0.0, 1.0)))
+    over = np.nonzero(error > threshold_deg)[0]
+
+    return {
+        'max_error_deg': float(error.max()),
+        'final_error_deg': float(error[-1]),
+        # Simulated time at which the drift first passed the threshold
+        'time_over_threshold': float((over[0] + 1) * dt) if len(over) else None,
+    }
+
+
+class AttitudeInterpolator:
+    # Keeps the two most recent timestamped attitudes and SLERPs between
+    # them at the frame presentation time. Rendering runs one simulation
+    # interval behind the newest state so there is always a pair to
+    # interpolate between, whatever the integration and display rates.
+
+    def __init__(self):
+        self.rate = 1.0     # Simulated seconds per wall clock second
+        self.reset()
+
+    def reset(self):
+        self.t_prev = None
+        self.q_prev = None
+        self.t_curr = None
+        self.q_curr = None
+        self.wall_curr = None
+        self.frac = 1.0
+
+    def push(self, t, quat, wall_time=None):
+        if wall_time is None:
+            wall_time = time.perf_counter()
+
+        if self.q_curr is not None and t == self.t_curr:
+            return          # Source has not moved on, e.g. a paused viewer
+        if self.q_curr is not None and t < self.t_curr:
+            self.reset()    # Time went backwards, e.g. after a data reset
+
+        self.t_prev, self.q_prev = self.t_curr, self.q_curr
+        self.t_curr = t
+        self.q_curr = np.array(quat)
+        self.wall_curr = wall_time
+
+    def push_from(self, data_obj, wall_time=None):
+        self.push(data_obj.t, data_obj.attitude_q, wall_time)
+
+    def has_state(self):
+        return self.q_curr is not None
+
+    def sample(self, wall_time=None):
+        if wall_time is None:
+            wall_time = time.perf_counter()
+
+        if self.q_prev is None:
+            self.frac = 1.0
+            return self.q_curr
+
+        interval = self.t_curr - self.t_prev
+        elapsed = (wall_time - self.wall_curr) * self.rate
+        self.frac = min(max(elapsed / interval, 0.0), 1.0)
+        return amath.QuaternionSlerp(self.q_prev, self.q_curr, self.frac)
+
+    def is_settled(self):
+        # True once the rendered attitude has caught up with the newest state
+        return self.frac >= 1.0
+
+
+class SimClock:
+    # Monotonic wall clock driven stepping. Each tick works out how many
+    # fixed size integration steps are due, so simulated time keeps up with
+    # real time (times the playback rate) however late the GUI timer fires.
+
+    MIN_RATE = 0.1
+    MAX_RATE = 100.0
+
+    def __init__(self, target_dt=1 / 60, rate=1.0, max_lag=0.25):
+        self.target_dt = target_dt
+        self.max_lag = max_lag      # Wall seconds of backlog worth catching up
+        self.set_rate(rate)
+        self.start()
+
+    def set_rate(self, rate):
+        self.rate = min(max(rate, self.MIN_RATE), self.MAX_RATE)
+
+    def start(self, now=None):
+        # Call when (re)starting so paused time is not integrated
+        self.last_wall = time.monotonic() if now is None else now
+        self.accumulator = 0.0
+        self.dropped_time = 0.0
+
+    def advance(self, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        elapsed = now - self.last_wall
+        self.last_wall = now
+
+        # After a stall (debugger, suspended laptop) drop the backlog instead
+        # of freezing the GUI while it is integrated
+        if elapsed > self.max_lag:
+            self.dropped_time += (elapsed - self.max_lag) * self.rate
+            elapsed = self.max_lag
+
+        self.accumulator += elapsed * self.rate
+        n_steps = int(self.accumulator / self.target_dt)
+        self.accumulator -= n_steps * self.target_dt
+        return n_steps
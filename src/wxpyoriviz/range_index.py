@@ -0,0 +1,259 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from .events import solution_divergence
+
+
+# Precomputed min / max / sum / sum of squares over blocks of a recording,
+# so statistics of any row or time range come from a handful of summaries
+# instead of a rescan. Level 0 summarises blocks of block_rows rows, every
+# level above merges fanout nodes of the one below. A query takes whole
+# nodes from the coarsest level that fits, at most fanout - 1 per side per
+# level, and reads only the rows at its two ends (under one block each)
+# from the recording: O(log N) whatever the span.
+#
+# The index is written next to the recording (INDEX_FILE) by
+# recorder.TrajectoryRecorder(range_index=True), or built in one streaming
+# pass by RangeIndex.build. Channels are in degrees and degrees/second, in
+# the recording's own (GenRatesData) sign convention.
+INDEX_FILE = 'range_index.npz'
+CHANNELS = ('roll', 'pitch', 'yaw', 'roll_rate', 'pitch_rate', 'yaw_rate',
+            'euler_error', 'q_norm_error')
+STATS = ('min', 'max', 'sum', 'sumsq')
+
+
+def channels_for(columns):
+    # Channels available from a recording with the given columns
+    if 'q_norm' in columns:
+        return CHANNELS
+    return CHANNELS[:-1]
+
+
+def channel_values(cols, channels):
+    # (n, len(channels)) values from a dict of recording columns
+    values = []
+    for name in channels:
+        if name in ('roll', 'pitch', 'yaw'):
+            values.append(np.degrees(cols['euler_q'][:, CHANNELS.index(name)]))
+        elif name in ('roll_rate', 'pitch_rate', 'yaw_rate'):
+            values.append(np.degrees(cols['rates'][:, CHANNELS.index(name) - 3]))
+        elif name == 'euler_error':
+            values.append(solution_divergence(cols['quat'], cols['euler']))
+        else:
+            values.append(cols['q_norm'] - 1.0)
+    return np.stack(values, axis=1)
+
+
+def source_columns(channels):
+    columns = ['rates', 'euler_q']
+    if 'euler_error' in channels:
+        columns += ['quat', 'euler']
+    if 'q_norm_error' in channels:
+        columns.append('q_norm')
+    return columns
+
+
+def summarise(values, rows):
+    # Per block stats of (n_blocks * rows, C) values
+    blocks = values.reshape(-1, rows, values.shape[1])
+    return {'min': blocks.min(axis=1), 'max': blocks.max(axis=1),
+            'sum': blocks.sum(axis=1), 'sumsq': (blocks * blocks).sum(axis=1)}
+
+
+def merge(level, fanout):
+    # Next level up; a trailing partial group is left out, queries never
+    # need it
+    n = len(level['min']) // fanout * fanout
+    grouped = {stat: level[stat][:n].reshape(-1, fanout, level[stat].shape[1])
+               for stat in STATS}
+    return {'min': grouped['min'].min(axis=1),
+            'max': grouped['max'].max(axis=1),
+            'sum': grouped['sum'].sum(axis=1),
+            'sumsq': grouped['sumsq'].sum(axis=1)}
+
+
+class RangeIndexBuilder:
+    # Streams chunks of recording columns into the level 0 summaries,
+    # carrying the rows of an unfinished block over to the next chunk
+
+    def __init__(self, channels=CHANNELS, block_rows=64, fanout=8):
+        self.channels = tuple(channels)
+        self.block_rows = block_rows
+        self.fanout = fanout
+        self.pending = np.zeros((0, len(self.channels)))
+        self.parts = {stat: [] for stat in STATS}
+        self.n_rows = 0
+
+    def push(self, cols):
+        values = channel_values(cols, self.channels)
+        self.n_rows += len(values)
+        data = np.concatenate([self.pending, values])
+        n_full = len(data) // self.block_rows * self.block_rows
+        if n_full:
+            for stat, summary in summarise(data[:n_full],
+                                           self.block_rows).items():
+                self.parts[stat].append(summary)
+        self.pending = data[n_full:]
+
+    def finish(self, reader=None):
+        # Rows of a final partial block are not summarised, queries read
+        # them from the recording
+        n_channels = len(self.channels)
+        level = {stat: np.concatenate(parts) if parts
+                 else np.zeros((0, n_channels))
+                 for stat, parts in self.parts.items()}
+        levels = [level]
+        while len(levels[-1]['min']) >= 2 * self.fanout:
+            levels.append(merge(levels[-1], self.fanout))
+        return RangeIndex(levels, self.channels, self.block_rows, self.fanout,
+                          self.n_rows, reader)
+
+
+class RangeIndex:
+    def __init__(self, levels, channels, block_rows, fanout, n_rows,
+                 reader=None):
+        self.levels = levels
+        self.channels = tuple(channels)
+        self.block_rows = block_rows
+        self.fanout = fanout
+        self.n_rows = n_rows
+        self.reader = reader    # For the rows at the ends of a query
+
+    @classmethod
+    def build(cls, reader, block_rows=64, fanout=8):
+        channels = channels_for(reader.columns)
+        builder = RangeIndexBuilder(channels, block_rows, fanout)
+        for _, cols in reader.iter_chunks(source_columns(channels)):
+            builder.push(cols)
+        return builder.finish(reader)
+
+    def save(self, path):
+        arrays = {'channels': np.array(self.channels),
+                  'shape': np.array([self.block_rows, self.fanout,
+                                     self.n_rows])}
+        for i, level in enumerate(self.levels):
+            for stat in STATS:
+                arrays['{}_{}'.format(stat, i)] = level[stat]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, reader=None):
+        with np.load(path) as npz:
+            block_rows, fanout, n_rows = (int(v) for v in npz['shape'])
+            levels = []
+            while 'min_{}'.format(len(levels)) in npz:
+                i = len(levels)
+                levels.append({stat: npz['{}_{}'.format(stat, i)]
+                               for stat in STATS})
+            channels = [str(c) for c in npz['channels']]
+        return cls(levels, channels, block_rows, fanout, n_rows, reader)
+
+    @classmethod
+    def open(cls, reader):
+        # The index saved with the recording, built (and saved when the
+        # directory is writable) if it is missing or out of date
+        path = os.path.join(reader.path, INDEX_FILE)
+        if os.path.exists(path):
+            index = cls.load(path, reader)
+            if index.n_rows == len(reader):
+                return index
+        index = cls.build(reader)
+        try:
+            index.save(path)
+        except OSError:
+            pass
+        return index
+
+    def raw_values(self, start, stop):
+        cols = {c: self.reader.read(c, start, stop)
+                for c in source_columns(self.channels)}
+        return channel_values(cols, self.channels)
+
+    def query_rows(self, start, stop):
+        # {channel: {'min', 'max', 'mean', 'rms', 'std'}} over rows
+        # [start, stop)
+        start = max(int(start), 0)
+        stop = min(int(stop), self.n_rows)
+        parts = []
+
+        def add_raw(a, b):
+            if b > a:
+                v = self.raw_values(a, b)
+                parts.append((v, v, v, v * v))
+
+        rows = self.block_rows
+        lo = -(-start // rows)
+        hi = stop // rows
+        if lo >= hi:
+            add_raw(start, stop)
+        else:
+            add_raw(start, lo * rows)
+            add_raw(hi * rows, stop)
+            for i, level in enumerate(self.levels):
+                # Whole groups of fanout nodes move up a level, the nodes
+                # either side of them are taken here
+                up_lo = -(-lo // self.fanout) * self.fanout
+                up_hi = hi // self.fanout * self.fanout
+                if i == len(self.levels) - 1 or up_lo >= up_hi:
+                    spans = [(lo, hi)]
+                else:
+                    spans = [(lo, up_lo), (up_hi, hi)]
+                for a, b in spans:
+                    if b > a:
+                        parts.append(tuple(level[stat][a:b] for stat in STATS))
+                if len(spans) == 1:
+                    break
+                lo, hi = up_lo // self.fanout, up_hi // self.fanout
+
+        n = stop - start
+        if n <= 0:
+            return {}
+        stats = [np.concatenate([p[k] for p in parts]) for k in range(4)]
+        total = stats[2].sum(axis=0)
+        total_sq = stats[3].sum(axis=0)
+        mean = total / n
+        result = {'min': stats[0].min(axis=0), 'max': stats[1].max(axis=0),
+                  'mean': mean, 'rms': np.sqrt(total_sq / n),
+                  'std': np.sqrt(np.maximum(total_sq / n - mean * mean, 0.0))}
+        return {name: {stat: float(values[i])
+                       for stat, values in result.items()}
+                for i, name in enumerate(self.channels)}
+
+    def query(self, t0, t1):
+        # Statistics over the rows with t0 <= t < t1
+        return self.query_rows(self.reader.time_to_row(t0),
+                               self.reader.time_to_row(t1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Interval statistics of a recording from its range index")
+    parser.add_argument('path', help="Recording directory")
+    parser.add_argument('--t0', type=float, default=0.0)
+    parser.add_argument('--t1', type=float, default=float('inf'))
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Rebuild the index even if one is saved")
+    args = parser.parse_args()
+
+    from .recorder import RecordingReader
+    reader = RecordingReader(args.path)
+    t_start = time.perf_counter()
+    if args.rebuild:
+        index = RangeIndex.build(reader)
+        index.save(os.path.join(args.path, INDEX_FILE))
+    else:
+        index = RangeIndex.open(reader)
+    t_query = time.perf_counter()
+    stats = index.query(args.t0, args.t1)
+    t_end = time.perf_counter()
+
+    print("Index ready in {:.3f} s, query in {:.2f} ms".format(
+        t_query - t_start, 1e3 * (t_end - t_query)))
+    print("{:<14}".format("") + "".join(
+        "{:>12}".format(stat) for stat in ('min', 'max', 'mean', 'rms', 'std')))
+    for name, values in stats.items():
+        print("{:<14}".format(name) + "".join(
+            "{:>12.5g}".format(v) for v in values.values()))
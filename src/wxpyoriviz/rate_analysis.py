@@ -0,0 +1,206 @@
+import argparse
+import os
+
+import numpy as np
+
+
+# Single pass noise characterisation of (N, 3) body rate logs: overlapping
+# Allan deviation over octave spaced cluster times and a Welch power
+# spectral density. Data is consumed in chunks (memory mapped .npy files or
+# recorder.RecordingReader chunks), and nothing kept between chunks grows
+# with the log length, so logs far larger than RAM can be analysed.
+#
+# Results are in the units of the input: rate for the Allan deviation,
+# rate^2/Hz for the PSD.
+
+# Cluster sizes up to this many samples use every overlapping cluster.
+# Larger ones start a cluster every m // ALLAN_OVERLAP samples, which keeps
+# the carried state bounded at a negligible cost in confidence.
+ALLAN_OVERLAP = 64
+
+
+class StreamingAllan:
+    def __init__(self, sample_dt, max_cluster=2 ** 20, n_axes=3):
+        self.sample_dt = sample_dt
+        self.n_axes = n_axes
+        self.m = 2 ** np.arange(int(np.log2(max_cluster)) + 1)
+        self.stride = np.maximum(self.m // ALLAN_OVERLAP, 1)
+        self.reset()
+
+    def reset(self):
+        self.n = 0                      # Samples consumed
+        self.angle = np.zeros(self.n_axes)  # Integrated rate so far
+        # Per cluster size, the decimated integrated rate still needed by
+        # the next second differences
+        self.tails = [np.zeros((1, self.n_axes)) for _ in self.m]
+        self.sum_sq = np.zeros((len(self.m), self.n_axes))
+        self.counts = np.zeros(len(self.m), dtype=np.int64)
+
+    def push(self, rates):
+        rates = np.asarray(rates, dtype=np.float64).reshape(-1, self.n_axes)
+        if len(rates) == 0:
+            return
+
+        # Integrated rate x[n0 + 1], ..., x[n0 + len]; x[0] = 0 went in the
+        # tails at reset
+        x = self.angle + self.sample_dt * np.cumsum(rates, axis=0)
+        self.angle = x[-1].copy()
+        first = self.n + 1
+        self.n += len(rates)
+
+        for i, (m, stride) in enumerate(zip(self.m, self.stride)):
+            # Samples of x at multiples of stride within this chunk
+            start = (-first) % stride
+            xs = np.concatenate([self.tails[i], x[start::stride]])
+            lag = m // stride
+            if len(xs) > 2 * lag:
+                d = xs[2 * lag:] - 2.0 * xs[lag:-lag] + xs[:-2 * lag]
+                self.sum_sq[i] += np.sum(d * d, axis=0)
+                self.counts[i] += len(d)
+            self.tails[i] = xs[-2 * lag:]
+
+    def result(self):
+        # (tau, adev) for the cluster sizes that saw at least one cluster;
+        # adev is (n_tau, n_axes)
+        valid = self.counts > 0
+        tau = self.m[valid] * self.sample_dt
+        avar = self.sum_sq[valid] / (
+            2.0 * (tau ** 2)[:, np.newaxis] * self.counts[valid, np.newaxis])
+        return tau, np.sqrt(avar)
+
+
+class StreamingWelch:
+    # Hann windowed segments of nperseg samples with 50% overlap, each one
+    # mean removed; the partial segment left at the end of a chunk is
+    # carried into the next one.
+
+    def __init__(self, sample_dt, nperseg=4096, n_axes=3):
+        self.sample_dt = sample_dt
+        self.nperseg = nperseg
+        self.step = nperseg // 2
+        self.n_axes = n_axes
+        self.window = np.hanning(nperseg + 2)[1:-1]
+        self.reset()
+
+    def reset(self):
+        self.pending = np.zeros((0, self.n_axes))
+        self.sum_power = np.zeros((self.nperseg // 2 + 1, self.n_axes))
+        self.n_segments = 0
+
+    def push(self, rates):
+        rates = np.asarray(rates, dtype=np.float64).reshape(-1, self.n_axes)
+        data = np.concatenate([self.pending, rates])
+        n_seg = (len(data) - self.nperseg) // self.step + 1
+        if n_seg > 0:
+            segs = np.lib.stride_tricks.sliding_window_view(
+                data, self.nperseg, axis=0)[::self.step][:n_seg]
+            # segs is (n_seg, n_axes, nperseg)
+            segs = segs - segs.mean(axis=2, keepdims=True)
+            spectra = np.fft.rfft(segs * self.window, axis=2)
+            self.sum_power += np.sum(np.abs(spectra) ** 2, axis=0).T
+            self.n_segments += n_seg
+            data = data[n_seg * self.step:]
+        self.pending = data.copy()
+
+    def result(self):
+        # (freq, psd), psd one sided and (n_freq, n_axes)
+        fs = 1.0 / self.sample_dt
+        freq = np.fft.rfftfreq(self.nperseg, self.sample_dt)
+        if self.n_segments == 0:
+            return freq, np.full((len(freq), self.n_axes), np.nan)
+
+        psd = self.sum_power / (self.n_segments * fs * np.sum(self.window ** 2))
+        # One sided: double everything but DC and (for even lengths) Nyquist
+        last = len(freq) - 1 if self.nperseg % 2 == 0 else len(freq)
+        psd[1:last] *= 2.0
+        return freq, psd
+
+
+def iter_array_chunks(array, chunk_size=65536):
+    for start in range(0, len(array), chunk_size):
+        # Copied out so only one chunk of a memory mapped file is resident
+        yield np.array(array[start:start + chunk_size])
+
+
+def open_rates(path, sample_dt=None, chunk_size=65536):
+    # Chunk iterator and sample interval for a recording directory or an
+    # (N, 3) .npy rate file (memory mapped)
+    if os.path.isdir(path):
+        from .recorder import RecordingReader
+        reader = RecordingReader(path)
+        if sample_dt is None:
+            times = reader.chunk(0, 't')[:1000]
+            sample_dt = float(np.mean(np.diff(times)))
+        chunks = (cols['rates'] for _, cols in reader.iter_chunks(['rates']))
+        return chunks, sample_dt, len(reader)
+
+    if sample_dt is None:
+        raise ValueError("A sample interval is needed for .npy rate files")
+    array = np.load(path, mmap_mode='r')
+    return iter_array_chunks(array, chunk_size), sample_dt, len(array)
+
+
+def analyse(chunks, sample_dt, n_samples=None, nperseg=4096, max_cluster=None):
+    # One pass over the chunks feeding both estimators. max_cluster defaults
+    # to the largest octave with at least 9 independent clusters.
+    if max_cluster is None:
+        max_cluster = max((n_samples or 2 ** 24) // 9, 1)
+    allan = StreamingAllan(sample_dt, max_cluster)
+    welch = StreamingWelch(sample_dt, nperseg)
+    for chunk in chunks:
+        allan.push(chunk)
+        welch.push(chunk)
+
+    tau, adev = allan.result()
+    freq, psd = welch.result()
+    return {'tau': tau, 'adev': adev, 'freq': freq, 'psd': psd,
+            'n_samples': allan.n, 'sample_dt': sample_dt}
+
+
+def noise_summary(tau, adev):
+    # Angle random walk (the deviation at tau = 1 s, read off the log-log
+    # curve) and bias instability (the curve's minimum over 0.664) per axis
+    log_tau = np.log10(tau)
+    arw = np.array([10 ** np.interp(0.0, log_tau, np.log10(adev[:, axis]))
+                    for axis in range(adev.shape[1])])
+    bias_instability = adev.min(axis=0) / 0.664
+    return {'arw': arw, 'bias_instability': bias_instability,
+            'bias_instability_tau': tau[np.argmin(adev, axis=0)]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Allan deviation and PSD of a body rate log, in one "
+                    "streaming pass")
+    parser.add_argument('path',
+                        help="Recording directory or (N, 3) .npy rate file")
+    parser.add_argument('--dt', type=float,
+                        help="Sample interval in seconds (required for .npy)")
+    parser.add_argument('--chunk', type=int, default=65536,
+                        help="Rows read per chunk from .npy files")
+    parser.add_argument('--nperseg', type=int, default=4096,
+                        help="Welch segment length")
+    parser.add_argument('--save', metavar='FILE',
+                        help="Save the results to an .npz file")
+    parser.add_argument('--plot', action='store_true',
+                        help="Show the results in a vispy window")
+    args = parser.parse_args()
+
+    chunks, sample_dt, n_samples = open_rates(args.path, args.dt, args.chunk)
+    results = analyse(chunks, sample_dt, n_samples, args.nperseg)
+    summary = noise_summary(results['tau'], results['adev'])
+
+    print("{} samples at {:g} Hz".format(results['n_samples'],
+                                          1.0 / sample_dt))
+    for axis, name in enumerate(('X', 'Y', 'Z')):
+        print("  {}: ARW {:.4g} (rate at tau = 1 s), bias instability "
+              "{:.4g} at tau = {:g} s".format(
+                  name, summary['arw'][axis],
+                  summary['bias_instability'][axis],
+                  summary['bias_instability_tau'][axis]))
+
+    if args.save:
+        np.savez(args.save, **results)
+    if args.plot:
+        from .analysis_plot import show_analysis
+        show_analysis(results)
@@ -0,0 +1,169 @@
+import json
+
+import numpy as np
+
+
+# Scripted body rate manoeuvres. A profile is a list of segments that are
+# evaluated once, up front, into a dense (N, 3) array with one row per
+# integration step; GenRatesData.set_rate_schedule then only indexes into
+# it, so a run costs nothing per tick and is repeatable bit for bit.
+#
+# Rates are in degrees/second in the RateSliders convention (roll, pitch,
+# yaw), the same as GenRatesData.set_body_rates. Amplitudes and offsets are
+# 3 element sequences or a single value for all axes.
+SEGMENT_TYPES = ('hold', 'ramp', 'sine', 'chirp', 'recorded')
+
+
+class RateProfile:
+    def __init__(self, loop=False):
+        self.segments = []
+        self.loop = loop    # Start over at the end instead of holding
+
+    @property
+    def duration(self):
+        return sum(seg['duration'] for seg in self.segments)
+
+    def add(self, kind, duration, **params):
+        if kind not in SEGMENT_TYPES:
+            raise ValueError("Unknown segment type '{}'".format(kind))
+        if duration <= 0:
+            raise ValueError("Segment duration must be positive")
+        params['duration'] = float(duration)
+        params['type'] = kind
+        self.segments.append(params)
+        return self
+
+    def hold(self, duration, rates):
+        return self.add('hold', duration, rates=rates)
+
+    def ramp(self, duration, start, end):
+        return self.add('ramp', duration, start=start, end=end)
+
+    def sine(self, duration, amplitude, frequency, offset=0.0, phase=0.0):
+        # frequency in Hz, phase in degrees
+        return self.add('sine', duration, amplitude=amplitude,
+                        frequency=frequency, offset=offset, phase=phase)
+
+    def chirp(self, duration, amplitude, f_start, f_end, offset=0.0):
+        # Linear frequency sweep from f_start to f_end (Hz)
+        return self.add('chirp', duration, amplitude=amplitude,
+                        f_start=f_start, f_end=f_end, offset=offset)
+
+    def recorded(self, rates, sample_dt, duration=None):
+        # (M, 3) rates sampled every sample_dt seconds, linearly resampled
+        # onto the integration steps
+        rates = np.asarray(rates, dtype=np.float64).reshape(-1, 3)
+        if duration is None:
+            duration = len(rates) * sample_dt
+        return self.add('recorded', duration, rates=rates,
+                        sample_dt=sample_dt)
+
+    def evaluate(self, dt, dtype=np.float64, n_steps=None):
+        # One row per integration step, row i holding the rates applied from
+        # i * dt to (i + 1) * dt. n_steps defaults to the profile duration.
+        if not self.segments:
+            raise ValueError("Profile has no segments")
+        if self.duration < dt * (1 - 1e-9):
+            raise ValueError("Profile is {:g} s long, shorter than one "
+                             "{:g} s step".format(self.duration, dt))
+        if n_steps is None:
+            n_steps = int(np.ceil(self.duration / dt - 1e-9))
+        out = np.empty((n_steps, 3), dtype=dtype)
+
+        t_start = 0.0
+        for seg in self.segments:
+            t_end = t_start + seg['duration']
+            i0 = min(int(np.ceil(t_start / dt - 1e-9)), n_steps)
+            i1 = min(int(np.ceil(t_end / dt - 1e-9)), n_steps)
+            # Time since the segment started, as a column for broadcasting
+            tau = (np.arange(i0, i1) * dt - t_start)[:, np.newaxis]
+            out[i0:i1] = evaluate_segment(seg, tau)
+            t_start = t_end
+
+        # Past the last segment either repeat or hold the final rates
+        n_filled = min(int(np.ceil(t_start / dt - 1e-9)), n_steps)
+        if n_filled < n_steps:
+            if self.loop:
+                reps = int(np.ceil(n_steps / n_filled))
+                out[n_filled:] = np.tile(out[:n_filled], (reps, 1))[
+                    :n_steps - n_filled]
+            else:
+                out[n_filled:] = out[n_filled - 1]
+        return out
+
+    def to_dict(self):
+        segments = []
+        for seg in self.segments:
+            seg = dict(seg)
+            if seg['type'] == 'recorded':
+                seg['rates'] = seg['rates'].tolist()
+            segments.append(seg)
+        return {'loop': self.loop, 'segments': segments}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def from_dict(cls, spec):
+        profile = cls(loop=spec.get('loop', False))
+        for seg in spec['segments']:
+            seg = dict(seg)
+            kind = seg.pop('type')
+            duration = seg.pop('duration', None)
+            if kind == 'recorded':
+                if 'path' in seg:
+                    rates, sample_dt = load_recorded_rates(seg.pop('path'))
+                    seg.setdefault('sample_dt', sample_dt)
+                else:
+                    rates = seg.pop('rates')
+                profile.recorded(rates, seg['sample_dt'], duration)
+            else:
+                profile.add(kind, duration, **seg)
+        return profile
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def evaluate_segment(seg, tau):
+    kind = seg['type']
+    if kind == 'hold':
+        return np.asarray(seg['rates'], dtype=np.float64) + 0.0 * tau
+    if kind == 'ramp':
+        start = np.asarray(seg['start'], dtype=np.float64)
+        end = np.asarray(seg['end'], dtype=np.float64)
+        return start + (end - start) * (tau / seg['duration'])
+    if kind == 'sine':
+        phase = np.radians(seg['phase'])
+        return (np.asarray(seg['offset'], dtype=np.float64)
+                + np.asarray(seg['amplitude'], dtype=np.float64)
+                * np.sin(2.0 * np.pi * seg['frequency'] * tau + phase))
+    if kind == 'chirp':
+        sweep = (seg['f_end'] - seg['f_start']) / seg['duration']
+        phase = 2.0 * np.pi * (seg['f_start'] * tau + 0.5 * sweep * tau ** 2)
+        return (np.asarray(seg['offset'], dtype=np.float64)
+                + np.asarray(seg['amplitude'], dtype=np.float64)
+                * np.sin(phase))
+
+    # Recorded, resampled per axis. Past the end of the samples the last
+    # value is held.
+    rates = seg['rates']
+    sample_t = np.arange(len(rates)) * seg['sample_dt']
+    tau = tau[:, 0]
+    return np.stack([np.interp(tau, sample_t, rates[:, axis])
+                     for axis in range(3)], axis=1)
+
+
+def load_recorded_rates(path):
+    # Body rates from a recorder.TrajectoryRecorder directory, converted
+    # back from the GenRatesData convention (rad/s, Y and Z negated) to
+    # slider degrees/second. Returns (rates, mean sample interval).
+    from .recorder import RecordingReader
+    reader = RecordingReader(path)
+    times = reader.read('t')
+    rates = np.degrees(reader.read('rates')) * np.array([1.0, -1.0, -1.0])
+    sample_dt = float(np.mean(np.diff(times))) if len(times) > 1 else 1.0
+    return rates, sample_dt
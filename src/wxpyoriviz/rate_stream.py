@@ -0,0 +1,433 @@
+import argparse
+import asyncio
+import heapq
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# Packet layout (little endian):
+#   header: magic (u16), version (u8), flags (u8), seq (u32),
+#           sample count (u16), send time (f64, sender wall clock)
+#   samples: count x [sample time (f64), roll/pitch/yaw rates (3 x f32)]
+# Rates are in degrees/second, same convention as the RateSliders.
+PACKET_MAGIC = 0x4F52
+PACKET_VERSION = 1
+HEADER = struct.Struct('<HBBIHd')
+SAMPLE_DTYPE = np.dtype([('t', '<f8'), ('rates', '<f4', (3,))])
+MAX_SAMPLES_PER_PACKET = 64
+
+
+class PacketError(ValueError):
+    pass
+
+
+def encode_packet(seq, times, rates, send_time=None):
+    if send_time is None:
+        send_time = time.time()
+
+    samples = np.empty(len(times), dtype=SAMPLE_DTYPE)
+    samples['t'] = times
+    samples['rates'] = rates
+
+    header = HEADER.pack(PACKET_MAGIC, PACKET_VERSION, 0,
+                         seq & 0xFFFFFFFF, len(samples), send_time)
+    return header + samples.tobytes()
+
+
+def decode_header(data):
+    if len(data) < HEADER.size:
+        raise PacketError("Packet shorter than header")
+
+    magic, version, flags, seq, count, send_time = HEADER.unpack_from(data)
+    if magic != PACKET_MAGIC or version != PACKET_VERSION:
+        raise PacketError("Bad packet magic/version")
+
+    return seq, count, send_time
+
+
+def decode_packet(data):
+    seq, count, send_time = decode_header(data)
+    if len(data) != HEADER.size + count * SAMPLE_DTYPE.itemsize:
+        raise PacketError("Packet length does not match sample count")
+
+    samples = np.frombuffer(data, dtype=SAMPLE_DTYPE, count=count,
+                            offset=HEADER.size)
+    return seq, send_time, samples
+
+
+class StreamStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.packets_received = 0
+        self.packets_lost = 0
+        self.packets_late = 0       # Arrived after their slot was released
+        self.packets_duplicate = 0
+        self.packets_reordered = 0
+        self.packets_malformed = 0
+        self.stream_resyncs = 0     # Sender restarts, see JitterBuffer.resync
+        self.samples_fed = 0
+        self.latency_last = 0.0     # Seconds, send to arrival
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+
+    def add_latency(self, latency):
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
+        # Exponential moving average, roughly the last 100 packets
+        if self.packets_received <= 1:
+            self.latency_avg = latency
+        else:
+            self.latency_avg += 0.01 * (latency - self.latency_avg)
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class JitterBuffer:
+    # Holds packets for a fixed delay and releases them in sequence order.
+    # Gaps that are still open when the delay expires count as lost.
+    #
+    # A sequence number more than max_packets behind the next expected one
+    # can not be a late packet, the sender has restarted from 0: the buffer
+    # resyncs to the new stream. Receivers also resync on a new connection
+    # or sender address.
+
+    def __init__(self, delay=0.05, max_packets=1024):
+        self.delay = delay
+        self.max_packets = max_packets
+        self.stats = StreamStats()
+        self.reset()
+
+    def reset(self):
+        self.clear()
+        self.stats.reset()
+
+    def clear(self):
+        self.heap = []
+        self.seqs = set()
+        self.next_seq = None
+        self.highest_seq = None
+
+    def resync(self):
+        # Start over on a new stream. Packets of the old one still waiting
+        # are dropped (counted as lost), they would play out of order with
+        # the new stream's.
+        self.stats.packets_lost += len(self.heap)
+        self.stats.stream_resyncs += 1
+        self.clear()
+
+    def push(self, seq, send_time, samples, arrival_time):
+        self.stats.packets_received += 1
+        self.stats.add_latency(arrival_time - send_time)
+
+        if (self.next_seq is not None
+                and seq < self.next_seq - self.max_packets):
+            self.resync()
+        if self.next_seq is not None and seq < self.next_seq:
+            self.stats.packets_late += 1
+            return
+        if seq in self.seqs:
+            self.stats.packets_duplicate += 1
+            return
+        if self.highest_seq is not None and seq < self.highest_seq:
+            self.stats.packets_reordered += 1
+        if self.highest_seq is None or seq > self.highest_seq:
+            self.highest_seq = seq
+
+        heapq.heappush(self.heap, (seq, arrival_time, samples))
+        self.seqs.add(seq)
+
+        # Never let a stalled stream grow the buffer without bound
+        while len(self.heap) > self.max_packets:
+            self.release_packet()
+
+    def release_packet(self):
+        seq, arrival_time, samples = heapq.heappop(self.heap)
+        self.seqs.discard(seq)
+        if self.next_seq is not None and seq > self.next_seq:
+            self.stats.packets_lost += seq - self.next_seq
+        self.next_seq = seq + 1
+        return samples
+
+    def pop_ready(self, now):
+        # Packets are released in order once the oldest one has waited the
+        # full delay, or straight away if it is the next expected packet
+        ready = []
+        while self.heap:
+            seq, arrival_time, samples = self.heap[0]
+            in_order = self.next_seq is not None and seq == self.next_seq
+            if not in_order and now - arrival_time < self.delay:
+                break
+            ready.append(self.release_packet())
+
+        if not ready:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.concatenate(ready)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        self.receiver.on_packet(data, addr)
+
+
+class RateStreamReceiver:
+    # Receives rate packets on a background asyncio loop. The GUI thread
+    # calls drain() once per tick to feed the released samples into the
+    # data object on their own timestamps.
+
+    def __init__(self, host='127.0.0.1', port=5005, protocol='udp',
+                 jitter_delay=0.05):
+        if protocol not in ('udp', 'tcp'):
+            raise ValueError("Protocol must be 'udp' or 'tcp'")
+
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.jitter = JitterBuffer(jitter_delay)
+        self.stats = self.jitter.stats
+        self.lock = threading.Lock()
+
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.transport = None
+        self.started = threading.Event()
+        self.error = None   # Why the loop thread failed to bind
+        self.source = None  # Address or connection of the current stream
+        self.resyncs_fed = 0
+
+    def start(self):
+        # Raises what the loop thread hit binding the socket, e.g. OSError
+        # for a port in use
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        if not self.started.wait(5.0):
+            self.stop()
+            raise RuntimeError("Rate stream receiver did not start within 5 s")
+        if self.error is not None:
+            self.thread.join()
+            self.loop = None
+            raise self.error
+
+    def stop(self):
+        if self.loop is None:
+            return
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5.0)
+        self.loop = None
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._open())
+        except Exception as exc:
+            self.error = exc
+            self.loop.close()
+            self.started.set()
+            return
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            if self.transport is not None:
+                self.transport.close()
+            if self.server is not None:
+                self.server.close()
+            self.loop.close()
+
+    async def _open(self):
+        if self.protocol == 'udp':
+            self.transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self),
+                local_addr=(self.host, self.port))
+            self.port = self.transport.get_extra_info('sockname')[1]
+        else:
+            self.server = await asyncio.start_server(
+                self._handle_tcp, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _handle_tcp(self, reader, writer):
+        # Every connection is a new stream, numbered from its own seq 0
+        connection = object()
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                seq, count, send_time = decode_header(header)
+                payload = await reader.readexactly(
+                    count * SAMPLE_DTYPE.itemsize)
+                self.on_packet(header + payload, connection)
+        except (asyncio.IncompleteReadError, ConnectionError, PacketError):
+            pass
+        finally:
+            writer.close()
+
+    def on_packet(self, data, source=None):
+        # source: sender address (UDP) or connection (TCP); a new one means
+        # the sender restarted
+        arrival = time.time()
+        try:
+            seq, send_time, samples = decode_packet(data)
+        except PacketError:
+            with self.lock:
+                self.stats.packets_malformed += 1
+            return
+
+        with self.lock:
+            if source != self.source:
+                if self.source is not None:
+                    self.jitter.resync()
+                self.source = source
+            self.jitter.push(seq, send_time, samples, arrival)
+
+    def get_samples(self):
+        with self.lock:
+            return self.jitter.pop_ready(time.time())
+
+    def drain(self, data_obj):
+        # Samples of a restarted stream start a new sample clock in the
+        # data object instead of integrating across the restart
+        with self.lock:
+            samples = self.jitter.pop_ready(time.time())
+            resyncs = self.stats.stream_resyncs
+        if resyncs != self.resyncs_fed:
+            self.resyncs_fed = resyncs
+            data_obj.restart_rate_stream()
+        for sample in samples:
+            data_obj.feed_rate_sample(float(sample['t']),
+                                      tuple(sample['rates']))
+        self.stats.samples_fed += len(samples)
+        return len(samples)
+
+    def get_stats(self):
+        with self.lock:
+            return self.stats.as_dict()
+
+
+class RateStreamSender:
+    # Local stand-in for a flight controller, for testing on loopback.
+    # Can drop and reorder packets to exercise the jitter buffer.
+
+    def __init__(self, host='127.0.0.1', port=5005, protocol='udp',
+                 sample_rate=1000.0, batch=10, loss=0.0, reorder=0.0,
+                 seed=None):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.sample_rate = sample_rate
+        self.batch = min(batch, MAX_SAMPLES_PER_PACKET)
+        self.loss = loss
+        self.reorder = reorder
+        self.rng = np.random.default_rng(seed)
+        self.seq = 0
+
+    def rates_at(self, t):
+        # Default manoeuvre: steady yaw with a slow roll oscillation
+        return (30.0 * np.sin(0.5 * t), 0.0, 90.0)
+
+    async def run(self, duration=10.0):
+        loop = asyncio.get_running_loop()
+        if self.protocol == 'udp':
+            transport, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol,
+                remote_addr=(self.host, self.port))
+            send = transport.sendto
+        else:
+            reader, writer = await asyncio.open_connection(
+                self.host, self.port)
+            send = writer.write
+
+        sample_dt = 1.0 / self.sample_rate
+        batch_dt = self.batch * sample_dt
+        t0 = time.time()
+        t_sample = 0.0
+        held = None
+        try:
+            while t_sample < duration:
+                times = t_sample + sample_dt * np.arange(self.batch)
+                rates = np.array([self.rates_at(t) for t in times])
+                packet = encode_packet(self.seq, times, rates)
+                self.seq += 1
+                t_sample += batch_dt
+
+                # TCP is ordered and reliable, only UDP gets impaired
+                if self.protocol == 'udp':
+                    if self.rng.random() < self.loss:
+                        packet = None
+                    elif held is None and self.rng.random() < self.reorder:
+                        held, packet = packet, None
+                    elif held is not None:
+                        send(packet)
+                        packet, held = held, None
+
+                if packet is not None:
+                    send(packet)
+                    if self.protocol == 'tcp':
+                        await writer.drain()
+
+                delay = t0 + t_sample - time.time()
+                await asyncio.sleep(max(delay, 0.0))
+
+            # A packet still held back for reordering goes out last
+            if held is not None:
+                send(held)
+        finally:
+            if self.protocol == 'udp':
+                transport.close()
+            else:
+                writer.close()
+
+
+class _StatsOnlyData:
+    # Minimal data object for running the receiver from the command line
+    def __init__(self):
+        self.last = None
+
+    def feed_rate_sample(self, t, rates_tpl):
+        self.last = (t, rates_tpl)
+
+    def restart_rate_stream(self):
+        self.last = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Stand-in rate stream sender and receiver")
+    parser.add_argument('mode', choices=('send', 'receive'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--protocol', choices=('udp', 'tcp'), default='udp')
+    parser.add_argument('--rate', type=float, default=1000.0,
+                        help="Sample rate in Hz")
+    parser.add_argument('--batch', type=int, default=10,
+                        help="Samples per packet")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--reorder', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.mode == 'send':
+        sender = RateStreamSender(args.host, args.port, args.protocol,
+                                  args.rate, args.batch, args.loss,
+                                  args.reorder)
+        asyncio.run(sender.run(args.duration))
+    else:
+        receiver = RateStreamReceiver(args.host, args.port, args.protocol)
+        receiver.start()
+        data = _StatsOnlyData()
+        try:
+            while True:
+                time.sleep(1.0)
+                receiver.drain(data)
+                print(data.last, receiver.get_stats())
+        except KeyboardInterrupt:
+            receiver.stop()
@@ -0,0 +1,390 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from . import attitude_math as amath
+from . import quat_codec
+from .orientation import quat_to_display_ypr
+
+
+# A recording is a directory holding index.json plus one .npy file per
+# column per chunk (chunk_000012.quat.npy, ...). Plain .npy chunks can be
+# memory mapped straight from disk; compressed chunks (.npz) are smaller but
+# have to be loaded. Angles are in radians, rates in rad/s, in the same
+# convention as GenRatesData.
+#
+# Optionally the quaternion column is stored smallest-three compressed
+# (quat_codec, 32 or 48 bits) and the time column delta coded. Those
+# columns are decoded on read; chunk_raw() still memory maps the packed
+# arrays.
+#
+# compact recordings also drop euler_q, which is derived from the decoded
+# quaternions on read (so it carries their quat_codec error), and store the
+# rates and Euler angles as float32 and q_norm as a float32 offset from 1.
+# A float64 recording shrinks from 120 to 34-36 bytes per row, 3.3-3.5x;
+# the time and quaternion columns alone shrink 4.9-6.4x, but the float32
+# rates and Euler angles are 24 of the remaining bytes and are not
+# redundant. Compressed (.npz) chunks come out smaller still, depending on
+# the data.
+#
+# The time column is always float64, like GenRatesData.t; in a float32
+# recording only the other columns are float32 (float32 time steps at
+# t = 3000 s are 2.4e-4 s, coarser than an 8 kHz sample).
+COLUMNS = {
+    't': (),
+    'rates': (3,),
+    'quat': (4,),
+    'euler_q': (3,),    # Euler angles from the quaternion solution
+    'euler': (3,),      # Euler angles from the Euler rate integration
+    'q_norm': (),       # Quaternion norm of each step before normalising
+}
+
+TIME_DTYPE = np.dtype(np.float64)
+DERIVED_COLUMNS = ('euler_q',)     # Not stored in compact recordings
+COMPACT_DTYPE = np.dtype(np.float32)
+
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+
+
+def chunk_file(index, column, compress=False):
+    return "chunk_{:06d}.{}.{}".format(index, column,
+                                       'npz' if compress else 'npy')
+
+
+class TrajectoryRecorder:
+    # Streams GenRatesData states to disk. The producer only copies values
+    # into a preallocated chunk; full chunks go to a background writer
+    # thread. Chunk buffers are recycled, so memory stays constant however
+    # long the session. If the writer falls behind, full chunks are dropped
+    # and counted rather than ever blocking the caller.
+
+    def __init__(self, path, chunk_size=65536, max_pending=4, compress=False,
+                 dtype=np.float64, quat_bits=None, time_resolution=None,
+                 range_index=False, compact=False):
+        if quat_bits not in (None, 32, 48):
+            raise ValueError("quat_bits must be None, 32 or 48")
+        if compact and quat_bits is None:
+            raise ValueError("compact recordings need quat_bits")
+
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.quat_bits = quat_bits
+        self.time_resolution = time_resolution
+        self.compact = compact
+        self.dtype = np.dtype(dtype)
+        os.makedirs(path, exist_ok=True)
+
+        self.free_buffers = queue.Queue()
+        for _ in range(max_pending + 1):
+            self.free_buffers.put(self.new_buffer())
+        self.pending = queue.Queue(maxsize=max_pending)
+
+        self.buffer = self.free_buffers.get()
+        self.n = 0
+        self.chunks = []
+        self.n_chunks = 0
+        self.dropped_chunks = 0
+        self.dropped_samples = 0
+        self.write_errors = 0
+        self.closed = False
+
+        # Optional range_index summaries, built by the writer thread as
+        # chunks are written and saved on close
+        self.range_builder = None
+        if range_index:
+            from .range_index import RangeIndexBuilder
+            self.range_builder = RangeIndexBuilder()
+
+        self.writer = threading.Thread(target=self.run_writer, daemon=True)
+        self.writer.start()
+
+    def column_dtype(self, name):
+        return TIME_DTYPE if name == 't' else self.dtype
+
+    def new_buffer(self):
+        return {name: np.zeros((self.chunk_size,) + shape,
+                               dtype=self.column_dtype(name))
+                for name, shape in COLUMNS.items()}
+
+    def append(self, t, rates, quat, euler_q, euler, q_norm=1.0):
+        if self.n and t < self.buffer['t'][self.n - 1]:
+            # Time went backwards (a data reset). Start a new chunk, so
+            # every chunk's times increase and delta coding still works.
+            self.hand_off()
+
+        buf = self.buffer
+        i = self.n
+        buf['t'][i] = t
+        buf['rates'][i] = rates
+        buf['quat'][i] = quat
+        buf['euler_q'][i] = euler_q
+        buf['euler'][i] = euler
+        buf['q_norm'][i] = q_norm
+        self.n += 1
+
+        if self.n == self.chunk_size:
+            self.hand_off()
+
+    def record(self, data_obj):
+        # Sources that replay stored attitudes have no norm to record
+        self.append(data_obj.t, data_obj.omega_body, data_obj.attitude_q,
+                    data_obj.attitude_q_euler, data_obj.attitude_euler,
+                    getattr(data_obj, 'q_norm', 1.0))
+
+    def hand_off(self):
+        if self.n == 0:
+            return
+
+        try:
+            next_buffer = self.free_buffers.get_nowait()
+        except queue.Empty:
+            # Every spare buffer is waiting on the writer, drop this chunk
+            self.dropped_chunks += 1
+            self.dropped_samples += self.n
+            self.n = 0
+            return
+
+        self.pending.put_nowait((self.n_chunks, self.buffer, self.n))
+        self.n_chunks += 1
+        self.buffer = next_buffer
+        self.n = 0
+
+    def run_writer(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+
+            index, buf, n = item
+            try:
+                self.write_chunk(index, buf, n)
+            except Exception:
+                # Count it and keep going; a dead writer would never return
+                # its buffers and every later chunk would be dropped
+                self.write_errors += 1
+            finally:
+                self.free_buffers.put(buf)
+
+    def encode_column(self, name, data):
+        if name == 'quat' and self.quat_bits is not None:
+            return quat_codec.encode_quats(data, self.quat_bits)
+        if name == 't' and self.time_resolution is not None:
+            return quat_codec.encode_times(data, self.time_resolution)[1]
+        if self.compact and name == 'q_norm':
+            return (data - 1.0).astype(COMPACT_DTYPE)
+        if self.compact and name != 't':
+            return data.astype(COMPACT_DTYPE)
+        return data
+
+    def stored_columns(self):
+        if self.compact:
+            return [name for name in COLUMNS if name not in DERIVED_COLUMNS]
+        return list(COLUMNS)
+
+    def write_chunk(self, index, buf, n):
+        for name in self.stored_columns():
+            data = self.encode_column(name, buf[name][:n])
+            filename = os.path.join(self.path,
+                                    chunk_file(index, name, self.compress))
+            tmp_name = filename + '.tmp'
+            with open(tmp_name, 'wb') as f:
+                if self.compress:
+                    np.savez_compressed(f, data=data)
+                else:
+                    np.save(f, data)
+            os.replace(tmp_name, filename)
+
+        self.chunks.append({'index': index, 'n': n,
+                            't0': float(buf['t'][0]),
+                            't1': float(buf['t'][n - 1])})
+        self.write_index()
+        if self.range_builder is not None:
+            self.range_builder.push({name: buf[name][:n] for name in COLUMNS})
+
+    def write_index(self):
+        index = {
+            'version': FORMAT_VERSION,
+            'chunk_size': self.chunk_size,
+            'compressed': self.compress,
+            'dtype': self.dtype.str,
+            'time_dtype': TIME_DTYPE.str,
+            'quat_bits': self.quat_bits,
+            'time_resolution': self.time_resolution,
+            'compact': self.compact,
+            'columns': {name: list(shape) for name, shape in COLUMNS.items()},
+            'chunks': self.chunks,
+        }
+        tmp_name = os.path.join(self.path, INDEX_FILE + '.tmp')
+        with open(tmp_name, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_name, os.path.join(self.path, INDEX_FILE))
+
+    def close(self):
+        # Flushes the partial chunk and waits for the writer to finish
+        if self.closed:
+            return
+        self.closed = True
+        self.hand_off()
+        self.pending.put(None)
+        self.writer.join()
+        if self.range_builder is not None:
+            from .range_index import INDEX_FILE
+            self.range_builder.finish().save(
+                os.path.join(self.path, INDEX_FILE))
+
+
+class RecordingReader:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.chunks = sorted(self.index['chunks'], key=lambda c: c['index'])
+        self.compressed = self.index['compressed']
+        self.quat_bits = self.index.get('quat_bits')
+        self.time_resolution = self.index.get('time_resolution')
+        self.columns = list(self.index['columns'])
+        # Recordings from before time_dtype kept time in the common dtype
+        self.time_dtype = self.index.get('time_dtype', self.index['dtype'])
+        self.compact = self.index.get('compact', False)
+        self.offsets = np.cumsum([0] + [c['n'] for c in self.chunks])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def chunk(self, i, column):
+        if self.compact and column in DERIVED_COLUMNS:
+            quats = self.chunk(i, 'quat')
+            euler_q = amath.EulerXYZfromQuaternion(quats.T).T
+            return euler_q.astype(self.index['dtype'])
+
+        data = self.chunk_raw(i, column)
+        if column == 'quat' and self.quat_bits is not None:
+            return quat_codec.decode_quats(data, self.quat_bits)
+        if column == 't' and self.time_resolution is not None:
+            return quat_codec.decode_times(self.chunks[i]['t0'], data,
+                                           self.time_resolution)
+        if self.compact and column == 'q_norm':
+            return (1.0 + data.astype(np.float64)).astype(self.index['dtype'])
+        if self.compact and column != 't':
+            return data.astype(self.index['dtype'])
+        return data
+
+    def chunk_raw(self, i, column):
+        # Memory mapped (uncompressed) or loaded (compressed) chunk array,
+        # still packed if the column is encoded. Derived columns of compact
+        # recordings have no file.
+        filename = os.path.join(
+            self.path,
+            chunk_file(self.chunks[i]['index'], column, self.compressed))
+        if self.compressed:
+            with np.load(filename) as npz:
+                return npz['data']
+        return np.load(filename, mmap_mode='r')
+
+    def iter_chunks(self, columns=None):
+        # Yields (start row, {column: array}) one chunk at a time
+        columns = columns or self.columns
+        for i in range(len(self.chunks)):
+            yield int(self.offsets[i]), {c: self.chunk(i, c) for c in columns}
+
+    def read(self, column, start=0, stop=None):
+        # Rows [start, stop) of one column, touching only the chunks needed
+        stop = len(self) if stop is None else min(stop, len(self))
+        parts = []
+        first = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        for i in range(max(first, 0), len(self.chunks)):
+            c0 = int(self.offsets[i])
+            if c0 >= stop:
+                break
+            arr = self.chunk(i, column)
+            parts.append(arr[max(start - c0, 0):stop - c0])
+
+        if not parts:
+            shape = tuple(self.index['columns'][column])
+            dtype = self.time_dtype if column == 't' else self.index['dtype']
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.concatenate(parts)
+
+    def time_to_row(self, t):
+        # First row with a timestamp >= t
+        for i, c in enumerate(self.chunks):
+            if c['t1'] >= t:
+                times = self.chunk(i, 't')
+                return int(self.offsets[i]) + int(np.searchsorted(times, t))
+        return len(self)
+
+
+class RecordingReplay:
+    # Plays a recording back through the GenRatesData interface, one row per
+    # iterate_data, with only the current chunk loaded. seek() jumps to any
+    # row, e.g. to an events.EventIndex entry.
+
+    def __init__(self, reader):
+        if len(reader) == 0:
+            # E.g. a recording whose only chunk was dropped
+            raise ValueError("Recording '{}' has no rows".format(reader.path))
+        self.reader = reader
+        times = reader.chunk(0, 't')[:1000]
+        self.dt = float(np.mean(np.diff(times))) if len(times) > 1 else 1 / 60
+        self.dtype = np.dtype(reader.index['dtype'])
+        self.recorder = None
+        self.chunk_index = None
+        self.reset_data()
+
+    @classmethod
+    def open(cls, path):
+        return cls(RecordingReader(path))
+
+    def load_chunk(self, i):
+        if i != self.chunk_index:
+            self.chunk_index = i
+            self.chunk_t = self.reader.chunk(i, 't')
+            self.chunk_quat = self.reader.chunk(i, 'quat')
+            self.chunk_rates = self.reader.chunk(i, 'rates')
+
+    def seek(self, row):
+        # Moves the state to row; the next iterate_data shows the row after
+        row = min(max(int(row), 0), len(self.reader) - 1)
+        i = int(np.searchsorted(self.reader.offsets, row, side='right')) - 1
+        self.load_chunk(i)
+        j = row - int(self.reader.offsets[i])
+
+        self.row = row
+        self.t = float(self.chunk_t[j])
+        self.attitude_q = np.array(self.chunk_quat[j])
+        self.omega_body = np.array(self.chunk_rates[j])
+        self.dcm = amath.QuatToDCM(self.attitude_q)
+        self.time = [self.t]
+
+    def reset_data(self):
+        self.seek(0)
+
+    def iterate_data(self, dt=None):
+        # Holds the last row once the recording has played out
+        if self.row + 1 >= len(self.reader):
+            return
+        self.seek(self.row + 1)
+
+        if self.recorder is not None:
+            self.attitude_q_euler = amath.EulerXYZfromQuaternion(
+                self.attitude_q)
+            self.attitude_euler = self.attitude_q_euler
+            self.recorder.record(self)
+
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+
+    def set_body_rates(self, rates_tpl):
+        pass    # Replayed, not integrated
+
+    def get_latest_ypr(self):
+        return quat_to_display_ypr(self.attitude_q)
+
+    def get_dcm(self):
+        return self.dcm
@@ -0,0 +1,266 @@
+import argparse
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from . import attitude_math as amath
+from .orientation import GenRatesData, quat_to_display_ypr
+
+
+# Shared block layout: a fixed header followed by a ring of records.
+# Each record carries its own seqlock counter, which also holds the write
+# index: 2 * index + 1 while the writer is in the middle of writing record
+# index, 2 * index + 2 once it is consistent. A reader can then tell the
+# record it wants from a newer one that has lapped the same slot.
+HEADER_DTYPE = np.dtype([('magic', '<u4'), ('capacity', '<u4'),
+                         ('write_count', '<u8')])
+RECORD_DTYPE = np.dtype([('seq', '<u8'), ('t', '<f8'),
+                         ('quat', '<f8', (4,)), ('rates', '<f8', (3,))])
+SHM_MAGIC = 0x4F525653
+
+READ_RETRIES = 100
+
+
+def _attach_shm(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag, and would unlink the block when
+        # the reader exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _map_views(shm):
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+    capacity = int(header['capacity'])
+    records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=shm.buf,
+                         offset=HEADER_DTYPE.itemsize)
+    return header, records
+
+
+class StatePublisher:
+    # Single writer side of the ring. Only one process may publish.
+
+    def __init__(self, name=None, capacity=4096):
+        size = HEADER_DTYPE.itemsize + capacity * RECORD_DTYPE.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=size)
+        self.name = self.shm.name
+
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        header['magic'] = SHM_MAGIC
+        header['capacity'] = capacity
+        header['write_count'] = 0
+        self.header, self.records = _map_views(self.shm)
+        self.records['seq'] = 0
+        self.capacity = capacity
+
+    def publish(self, t, quat, rates):
+        count = int(self.header['write_count'])
+        slot = self.records[count % self.capacity]
+
+        slot['seq'] = 2 * count + 1
+        slot['t'] = t
+        slot['quat'] = quat
+        slot['rates'] = rates
+        slot['seq'] = 2 * count + 2
+
+        self.header['write_count'] = count + 1
+
+    def publish_from(self, data_obj):
+        self.publish(data_obj.t, data_obj.attitude_q, data_obj.omega_body)
+
+    def close(self):
+        del self.header, self.records
+        self.shm.close()
+        self.shm.unlink()
+
+
+class StateSubscriber:
+    # Reader side. Any number of processes can attach by name; reads copy a
+    # single record into a preallocated buffer, nothing is pickled.
+
+    def __init__(self, name):
+        self.shm = _attach_shm(name)
+        self.header, self.records = _map_views(self.shm)
+        if int(self.header['magic']) != SHM_MAGIC:
+            raise ValueError("Shared block '{}' is not a state ring".format(name))
+
+        self.capacity = len(self.records)
+        self.record = np.zeros((), dtype=RECORD_DTYPE)
+        self.read_count = 0
+        self.overruns = 0
+
+    def write_count(self):
+        return int(self.header['write_count'])
+
+    def read_slot(self, index, out):
+        # Copies record index into out. False if the writer has lapped it
+        # (the slot holds a newer record) or kept it busy for every retry.
+        slot = self.records[index % self.capacity]
+        expected = 2 * index + 2
+        for _ in range(READ_RETRIES):
+            seq1 = int(slot['seq'])
+            if seq1 > expected:
+                return False    # Overwritten by a later record
+            if seq1 != expected:
+                continue        # Writer is in the middle of this record
+            out[...] = slot
+            if int(slot['seq']) == seq1:
+                return True
+        return False
+
+    def latest(self):
+        # Most recent consistent record, or None if nothing is published yet
+        count = self.write_count()
+        if count == 0 or not self.read_slot(count - 1, self.record):
+            return None
+        self.read_count = count
+        return self.record
+
+    def read_new(self, out=None):
+        # All records published since the previous call, oldest first. A
+        # reader that falls more than a full ring behind skips ahead, and
+        # the skipped records, as well as any the writer laps while they are
+        # being read, are counted as overruns.
+        count = self.write_count()
+        start = self.read_count
+        if count - start > self.capacity - 1:
+            self.overruns += count - start - (self.capacity - 1)
+            start = count - (self.capacity - 1)
+
+        n = count - start
+        if out is None or len(out) < n:
+            out = np.zeros(n, dtype=RECORD_DTYPE)
+
+        n_read = 0
+        for index in range(start, count):
+            if self.read_slot(index, out[n_read:n_read + 1]):
+                n_read += 1
+            else:
+                self.overruns += 1
+
+        self.read_count = count
+        return out[:n_read]
+
+    def close(self):
+        del self.header, self.records
+        self.shm.close()
+
+
+class SharedStateView:
+    # Read only data object with the GenRatesData interface, so a viewer
+    # process can drive the canvases from another process's simulation.
+
+    def __init__(self, name):
+        self.subscriber = StateSubscriber(name)
+        self.t = 0.0
+        self.dt = 1 / 60    # Only paces the viewer's own render clock
+        self.dtype = RECORD_DTYPE['quat'].base
+        self.recorder = None
+        self.attitude_q = np.array([1.0, 0.0, 0.0, 0.0])
+        self.omega_body = np.zeros(3)
+        self.dcm = amath.QuatToDCM(self.attitude_q)
+        self.time = []
+        self.new_records = np.zeros(self.subscriber.capacity,
+                                    dtype=RECORD_DTYPE)
+
+        # Start from the latest record; earlier ones were published before
+        # this viewer attached
+        record = self.subscriber.latest()
+        if record is not None:
+            self.set_state(record)
+
+    def set_state(self, record):
+        self.t = float(record['t'])
+        self.attitude_q = record['quat'].copy()
+        self.omega_body = record['rates'].copy()
+
+    def iterate_data(self, dt=None):
+        # The GUI calls this n_steps times a tick: the first call takes
+        # every record published since the previous tick, the others find
+        # nothing new. Each record is recorded exactly once.
+        records = self.subscriber.read_new(self.new_records)
+        if len(records) == 0:
+            return
+
+        if self.recorder is not None:
+            for record in records:
+                self.set_state(record)
+                # Only the quaternion solution is published, both Euler
+                # columns get the angles derived from it
+                self.attitude_q_euler = amath.EulerXYZfromQuaternion(
+                    self.attitude_q)
+                self.attitude_euler = self.attitude_q_euler
+                self.recorder.record(self)
+        else:
+            self.set_state(records[-1])
+
+        self.dcm = amath.QuatToDCM(self.attitude_q)
+        self.time = [self.t]
+
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+
+    def set_body_rates(self, rates_tpl):
+        pass    # Rates are owned by the publishing process
+
+    def get_latest_ypr(self):
+        return quat_to_display_ypr(self.attitude_q)
+
+    def get_dcm(self):
+        return self.dcm
+
+    def reset_data(self):
+        pass
+
+    def close(self):
+        self.subscriber.close()
+
+
+def run_headless(name, rates_tpl, rate_hz=60.0, capacity=4096):
+    # Integrate with GenRatesData in real time and publish every step
+    data = GenRatesData()
+    data.dt = 1.0 / rate_hz
+    data.set_body_rates(rates_tpl)
+    publisher = StatePublisher(name, capacity)
+    print("Publishing on shared memory block '{}'".format(publisher.name))
+
+    t_next = time.monotonic()
+    try:
+        while True:
+            data.iterate_data()
+            publisher.publish_from(data)
+            t_next += data.dt
+            time.sleep(max(t_next - time.monotonic(), 0.0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Headless shared memory state publisher and watcher")
+    parser.add_argument('mode', choices=('publish', 'watch'))
+    parser.add_argument('--name', default='oriviz_state')
+    parser.add_argument('--rates', type=float, nargs=3,
+                        default=(0.0, 0.0, 90.0),
+                        help="Body rates roll pitch yaw in deg/s")
+    parser.add_argument('--rate-hz', type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.mode == 'publish':
+        run_headless(args.name, args.rates, args.rate_hz)
+    else:
+        view = SharedStateView(args.name)
+        try:
+            while True:
+                view.iterate_data()
+                print(view.t, view.get_latest_ypr())
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            view.close()
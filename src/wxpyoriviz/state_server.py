@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import collections
+import socket
+import struct
+import threading
+import time
+
+from .orientation import GenRatesData, quat_to_display_ypr
+
+
+# Frame layout (little endian, fixed size):
+#   magic (u16), version (u8), flags (u8), seq (u64), sim time (f64),
+#   quaternion w, x, y, z (4 x f64), yaw, pitch, roll (3 x f64, degrees)
+# The angles use the same sign convention as the gauges and labels. seq
+# counts published frames, so a subscriber can tell how many it missed.
+FRAME_MAGIC = 0x5354
+FRAME_VERSION = 1
+FRAME = struct.Struct('<HBBQd4d3d')
+
+
+class FrameError(ValueError):
+    pass
+
+
+def encode_frame(seq, t, quat, ypr):
+    return FRAME.pack(FRAME_MAGIC, FRAME_VERSION, 0, seq, t,
+                      *quat, *ypr)
+
+
+def decode_frame(data):
+    # Returns (seq, t, quat, ypr)
+    if len(data) != FRAME.size:
+        raise FrameError("Frame is {} bytes, expected {}".format(
+            len(data), FRAME.size))
+    values = FRAME.unpack(data)
+    if values[0] != FRAME_MAGIC or values[1] != FRAME_VERSION:
+        raise FrameError("Bad frame magic/version")
+    return values[3], values[4], values[5:9], values[9:12]
+
+
+class Subscriber:
+    # Bounded per client queue. When the client falls behind, the oldest
+    # frames are dropped so it always catches up to the newest state.
+
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = collections.deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.peer = writer.get_extra_info('peername') or 'unix'
+
+    def push(self, frame):
+        if len(self.queue) == self.queue.maxlen:
+            self.frames_dropped += 1
+        self.queue.append(frame)
+        self.ready.set()
+
+    def stats(self):
+        return {'peer': str(self.peer), 'queued': len(self.queue),
+                'frames_sent': self.frames_sent,
+                'frames_dropped': self.frames_dropped}
+
+
+class StateServer:
+    # Serves the state on a background asyncio loop to any number of TCP or
+    # Unix socket clients. publish() is called from the simulation thread;
+    # it only encodes the frame and hands it to the loop, so neither slow
+    # nor many clients can hold up the caller.
+
+    def __init__(self, host='127.0.0.1', port=5010, unix_path=None,
+                 queue_size=64):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.queue_size = queue_size
+
+        self.seq = 0
+        self.subscribers = set()
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.started = threading.Event()
+        self.error = None   # Why the loop thread failed to open the socket
+
+    def start(self):
+        # Raises what the loop thread hit opening the socket, e.g. OSError
+        # for a port in use
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        if not self.started.wait(5.0):
+            self.stop()
+            raise RuntimeError("State server did not start within 5 s")
+        if self.error is not None:
+            self.thread.join()
+            self.loop = None
+            raise self.error
+
+    def stop(self):
+        if self.loop is None:
+            return
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5.0)
+        self.loop = None
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._open())
+        except Exception as exc:
+            self.error = exc
+            self.loop.close()
+            self.started.set()
+            return
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def _open(self):
+        if self.unix_path is not None:
+            self.server = await asyncio.start_unix_server(
+                self._handle_client, self.unix_path)
+        else:
+            self.server = await asyncio.start_server(
+                self._handle_client, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _handle_client(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Keep the kernel and transport buffers to about one queue of
+            # frames, otherwise a slow client is fed stale frames from
+            # megabytes of socket buffer before drop-oldest ever applies
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                            self.queue_size * FRAME.size)
+            if sock.family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.transport.set_write_buffer_limits(high=4 * FRAME.size)
+
+        sub = Subscriber(writer, self.queue_size)
+        self.subscribers.add(sub)
+        try:
+            while True:
+                await sub.ready.wait()
+                sub.ready.clear()
+                while sub.queue:
+                    writer.write(sub.queue.popleft())
+                    sub.frames_sent += 1
+                # Only this client's task waits on a slow reader; meanwhile
+                # its queue keeps dropping the oldest frames
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass    # Client went away, or the server is stopping
+        finally:
+            self.subscribers.discard(sub)
+            writer.close()
+
+    def _broadcast(self, frame):
+        for sub in self.subscribers:
+            sub.push(frame)
+
+    def publish(self, t, quat, ypr):
+        frame = encode_frame(self.seq, t, quat, ypr)
+        self.seq += 1
+        # Nothing would ever run the callback on a loop that is not running
+        loop = self.loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self._broadcast, frame)
+
+    def publish_from(self, data_obj):
+        self.publish(data_obj.t, data_obj.attitude_q,
+                     quat_to_display_ypr(data_obj.attitude_q))
+
+    def get_stats(self):
+        # Snapshot of the per subscriber counters
+        return [sub.stats() for sub in list(self.subscribers)]
+
+
+async def read_frames(host='127.0.0.1', port=5010, unix_path=None):
+    # Async generator of decoded frames from a StateServer
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                data = await reader.readexactly(FRAME.size)
+            except asyncio.IncompleteReadError:
+                return
+            yield decode_frame(data)
+    finally:
+        writer.close()
+
+
+def run_headless(server, rates_tpl, rate_hz=60.0):
+    # Integrate with GenRatesData in real time and serve every step
+    data = GenRatesData()
+    data.dt = 1.0 / rate_hz
+    data.set_body_rates(rates_tpl)
+    server.start()
+    print("Serving state on {}".format(
+        server.unix_path or "{}:{}".format(server.host, server.port)))
+
+    t_next = time.monotonic()
+    try:
+        while True:
+            data.iterate_data()
+            server.publish_from(data)
+            t_next += data.dt
+            time.sleep(max(t_next - time.monotonic(), 0.0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+async def watch(host, port, unix_path, delay):
+    # Prints every frame; delay (seconds per frame) makes a deliberately
+    # slow client to watch the server drop frames for it
+    last_seq = None
+    async for seq, t, quat, ypr in read_frames(host, port, unix_path):
+        missed = 0 if last_seq is None else seq - last_seq - 1
+        last_seq = seq
+        print("{:>8} t={:9.3f} ypr=({:8.2f}, {:8.2f}, {:8.2f}) "
+              "q=({:.4f}, {:.4f}, {:.4f}, {:.4f}){}".format(
+                  seq, t, *ypr, *quat,
+                  "  missed {}".format(missed) if missed else ""))
+        if delay > 0.0:
+            await asyncio.sleep(delay)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Binary state broadcast server and watcher")
+    parser.add_argument('mode', choices=('serve', 'watch'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5010)
+    parser.add_argument('--unix', metavar='PATH',
+                        help="Use a Unix socket instead of TCP")
+    parser.add_argument('--rates', type=float, nargs=3,
+                        default=(0.0, 0.0, 90.0),
+                        help="Body rates (deg/s) when serving headless")
+    parser.add_argument('--queue', type=int, default=64,
+                        help="Frames queued per subscriber")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="Seconds the watcher waits per frame")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        run_headless(StateServer(args.host, args.port, args.unix, args.queue),
+                     args.rates)
+    else:
+        try:
+            asyncio.run(watch(args.host, args.port, args.unix, args.delay))
+        except KeyboardInterrupt:
+            pass
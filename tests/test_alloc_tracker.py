@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from wxpyoriviz import alloc_tracker, orientation
+
+
+def measure(name):
+    tick = alloc_tracker.TICKS[name]()
+    return alloc_tracker.AllocationTracker().measure(
+        name, tick, alloc_tracker.TICK_COUNTS.get(name, 200))
+
+
+@pytest.mark.parametrize('name', ['simulate', 'interpolate'])
+def test_tick_within_budget(name):
+    result = measure(name)
+    assert result.over_budget(alloc_tracker.TICK_BUDGETS[name]) == [], \
+        result.format()
+
+
+def test_chevron_tick_within_budget():
+    pytest.importorskip('vispy')
+    result = measure('chevron_matrices')
+    assert result.over_budget(
+        alloc_tracker.TICK_BUDGETS['chevron_matrices']) == [], result.format()
+
+
+def test_uncapped_history_fails_simulate_budget(monkeypatch):
+    # Stand-in for a regression: histories that double without a cap
+    def make_room(self, n_new):
+        needed = self.n + n_new
+        if needed > len(self.data):
+            grown = np.zeros((2 * needed, self.data.shape[1]),
+                             dtype=self.data.dtype)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+
+    monkeypatch.setattr(orientation.HistoryBuffer, 'make_room', make_room)
+    result = measure('simulate')
+    assert 'held_bytes' in result.over_budget(
+        alloc_tracker.TICK_BUDGETS['simulate'])
+
+
+def test_history_buffer_keeps_newest_rows():
+    history = orientation.HistoryBuffer(1, capacity=4, max_rows=8)
+    for i in range(50):
+        history.next_row()[0] = i
+    assert len(history.data) == 16
+    assert list(history.column(0)) == list(range(40, 50))
+
+    history.extend(np.arange(100, 120)[:, np.newaxis])
+    assert list(history.column(0)) == list(range(112, 120))
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from wxpyoriviz import math_backend
+from wxpyoriviz.orientation import GenRatesData
+
+needs_numba = pytest.mark.skipif(not math_backend.HAVE_NUMBA,
+                                 reason="numba is not installed")
+
+# Largest difference between run_steps and iterate_data after N_STEPS;
+# float32 rounds every iterate_data step, run_steps only at the end
+N_STEPS = 600
+TOLERANCE = {np.float64: 1e-9, np.float32: 1e-5}
+
+
+def stepped_pair(dtype, backend, rates=(10.0, 20.0, 90.0)):
+    stepped = GenRatesData(dtype, backend)
+    batched = GenRatesData(dtype, backend)
+    for data in (stepped, batched):
+        data.set_body_rates(rates)
+    for _ in range(N_STEPS):
+        stepped.iterate_data()
+    batched.run_steps(N_STEPS)
+    return stepped, batched
+
+
+def assert_same_state(stepped, batched, tolerance):
+    assert batched.t == pytest.approx(stepped.t, abs=1e-9)
+    assert len(batched.time) == len(stepped.time)
+    np.testing.assert_allclose(batched.time, stepped.time, atol=1e-9)
+    for name in ('attitude_q', 'attitude_q_euler', 'attitude_euler', 'dcm'):
+        np.testing.assert_allclose(getattr(batched, name),
+                                   getattr(stepped, name), atol=tolerance,
+                                   err_msg=name)
+    for name in ('phi_q', 'theta_q', 'psi_q'):
+        # Degrees
+        np.testing.assert_allclose(getattr(batched, name),
+                                   getattr(stepped, name),
+                                   atol=tolerance * 180.0 / np.pi,
+                                   err_msg=name)
+    assert batched.q_norm == pytest.approx(stepped.q_norm, abs=tolerance)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_run_steps_matches_iterate_data(dtype):
+    stepped, batched = stepped_pair(dtype, 'numpy')
+    assert batched.attitude_q.dtype == np.dtype(dtype)
+    assert_same_state(stepped, batched, TOLERANCE[dtype])
+
+
+def test_run_steps_continues_a_stepped_run():
+    stepped = GenRatesData()
+    batched = GenRatesData()
+    for data in (stepped, batched):
+        data.set_body_rates((-40.0, 15.0, 5.0))
+        data.iterate_data()
+    for _ in range(N_STEPS):
+        stepped.iterate_data()
+    batched.run_steps(N_STEPS)
+    assert_same_state(stepped, batched, TOLERANCE[np.float64])
+
+
+def test_numba_request_falls_back_to_numpy(monkeypatch):
+    monkeypatch.setattr(math_backend, 'HAVE_NUMBA', False)
+    assert math_backend.get_backend('auto') is math_backend.numpy_backend
+    with pytest.warns(UserWarning):
+        backend = math_backend.get_backend('numba')
+    assert backend is math_backend.numpy_backend
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        math_backend.get_backend('cuda')
+
+
+@needs_numba
+def test_numba_kernels_match_numpy():
+    diffs = math_backend.parity_check('numba')
+    assert max(diffs.values()) < 1e-9, diffs
+
+
+@needs_numba
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_numba_run_steps_matches_numpy_iterate_data(dtype):
+    stepped = GenRatesData(dtype, 'numpy')
+    batched = GenRatesData(dtype, 'numba')
+    for data in (stepped, batched):
+        data.set_body_rates((10.0, 20.0, 90.0))
+    for _ in range(N_STEPS):
+        stepped.iterate_data()
+    batched.run_steps(N_STEPS)
+    assert_same_state(stepped, batched, TOLERANCE[dtype])
+
+
+@needs_numba
+def test_numba_backend_builds_without_a_writable_cache(monkeypatch):
+    # As on a read only install with no user cache directory
+    from numba.core import caching
+
+    def no_locator(self, py_func):
+        raise RuntimeError("cannot cache function: no locator available")
+
+    monkeypatch.setattr(caching.FunctionCache, '__init__', no_locator)
+    backend = math_backend.build_numba_backend()
+    rates = np.radians(np.tile([10.0, 20.0, 90.0], (10, 1)))
+    quats = backend.IntegrateRates(np.array([1.0, 0.0, 0.0, 0.0]),
+                                   np.zeros(3), rates, 1 / 60)[0]
+    assert np.allclose(np.linalg.norm(quats, axis=1), 1.0)
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from wxpyoriviz.rate_stream import (
+    RateStreamReceiver, RateStreamSender, _StatsOnlyData)
+
+
+# Packets of 4 samples at 512 Hz, 1/128 s apart: exact in binary, so a run
+# sends exactly duration * 128 packets
+SAMPLE_RATE = 512.0
+BATCH = 4
+
+
+def run_sender(port, protocol, duration=0.25, **kwargs):
+    sender = RateStreamSender(port=port, protocol=protocol,
+                              sample_rate=SAMPLE_RATE, batch=BATCH, seed=0,
+                              **kwargs)
+    asyncio.run(sender.run(duration))
+    return sender
+
+
+def drain_all(receiver, data):
+    # Let the jitter delay expire, then release everything waiting
+    time.sleep(2 * receiver.jitter.delay)
+    return receiver.drain(data)
+
+
+def test_stats_only_receiver_survives_sender_restart():
+    for protocol in ('udp', 'tcp'):
+        receiver = RateStreamReceiver(port=0, protocol=protocol)
+        receiver.start()
+        data = _StatsOnlyData()
+        try:
+            run_sender(receiver.port, protocol)
+            assert drain_all(receiver, data) > 0
+            run_sender(receiver.port, protocol)
+            assert drain_all(receiver, data) > 0
+        finally:
+            receiver.stop()
+
+        stats = receiver.get_stats()
+        assert stats['stream_resyncs'] == 1
+        assert stats['packets_late'] == 0
+        assert data.last is not None
+
+
+def test_sender_flushes_held_packet():
+    receiver = RateStreamReceiver(port=0, protocol='udp')
+    receiver.start()
+    data = _StatsOnlyData()
+    try:
+        # Every packet that is not sent straight away is held back; with an
+        # odd packet count the last one is still held when the run ends
+        sender = run_sender(receiver.port, 'udp', duration=9 / 128,
+                            reorder=1.0)
+        fed = drain_all(receiver, data)
+    finally:
+        receiver.stop()
+
+    stats = receiver.get_stats()
+    assert sender.seq == 9
+    assert stats['packets_received'] == 9
+    assert fed == 9 * BATCH
+    assert stats['packets_lost'] == 0